@@ -0,0 +1,212 @@
+'''
+Program   : Benchmarks of the preprocessing scripts
+Source    : Synthetic data (benchmarks/synthetic.py)
+Dependency: SCL-SPH
+Repository: indicators_health_secondary_data
+            https://github.com/BID-DATA/indicators_health_secondary_data
+Objective : Measure wall time, peak memory and rows/sec of every script of source/
+Notes     : Runs against a local S3 stand-in (moto server) and a local GHO stand-in,
+                no credentials or access to the Social Data Lake needed
+            Each script runs in its own process, at each scale factor, in pipeline order
+            Steps of each script (load keys, import, ..., export) come from metrics.py
+            Results are compared with benchmarks/baselines.json, runs slower or heavier
+                than the baseline by more than the tolerance are flagged as regressions
+            Requirements: moto[server], boto3, s3fs, openpyxl, pyarrow
+            Usage: python benchmarks/run.py --scales 1 4 [--stages who-ghed] [--save-baseline]
+'''
+
+# Libraries
+#------------------------------------------------------------------------------
+import os
+import sys
+import gzip
+import json
+import time
+import socket
+import argparse
+import tempfile
+import subprocess
+
+HERE   = os.path.dirname(os.path.abspath(__file__))
+SOURCE = os.path.join(os.path.dirname(HERE), "source")
+sys.path.insert(0, HERE)
+sys.path.insert(0, SOURCE)
+
+import synthetic
+
+BASELINES = os.path.join(HERE, "baselines.json")
+
+# GHO stand-in
+#------------------------------------------------------------------------------
+def install_gho(scale, latency):
+    '''Replace the ghoclient module with a local stand-in serving synthetic frames.'''
+    import types
+    import pandas as pd
+
+    class GHOSession:
+        served = 0
+        def get_data_codes(self, format = "dataframe"):
+            return synthetic.gho_codes(synthetic.GHO_CODES)
+        def fetch_data_from_codes(self, code = None):
+            time.sleep(latency)
+            data = synthetic.gho_frame(code, scale)
+            GHOSession.served += len(data)
+            return data
+
+    module            = types.ModuleType("ghoclient")
+    module.GHOSession = GHOSession
+    sys.modules["ghoclient"] = module
+    return GHOSession
+
+# Worker: run one script
+#------------------------------------------------------------------------------
+def worker(script, scale, latency):
+    '''Run `script` in this process and print its measures as JSON.'''
+    from metrics import peak_rss
+    from pipeline import run_script
+
+    session = install_gho(scale, latency)
+    start   = time.perf_counter()
+    run_script(script)
+    wall = time.perf_counter() - start
+    # Note: VmHWM of this process; ru_maxrss would be the peak of the driver (see metrics.py)
+    rss  = peak_rss()
+
+    # Steps recorded by the script (metrics.py)
+    steps  = []
+    folder = os.environ.get("sclmetrics")
+    if folder and os.path.isdir(folder):
+        for name in sorted(os.listdir(folder)):
+            if name.endswith(".json"):
+                with open(os.path.join(folder, name)) as file:
+                    steps += json.load(file)["steps"]
+    print(json.dumps({"wall_s": wall, "peak_rss_mb": rss, "gho_rows": session.served, "steps": steps}))
+
+# S3 stand-in
+#------------------------------------------------------------------------------
+def free_port():
+    with socket.socket() as sock:
+        sock.bind(("127.0.0.1", 0))
+        return sock.getsockname()[1]
+
+def start_s3():
+    '''Start a moto S3 server, returns (server, endpoint).'''
+    import logging
+    from moto.server import ThreadedMotoServer
+    logging.getLogger("werkzeug").setLevel(logging.ERROR)
+    port   = free_port()
+    server = ThreadedMotoServer(ip_address = "127.0.0.1", port = port)
+    server.start()
+    return server, f"http://127.0.0.1:{port}"
+
+def line_count(client, bucket, prefix):
+    '''Data rows of the CSV objects under `prefix`.'''
+    rows = 0
+    for page in client.get_paginator("list_objects_v2").paginate(Bucket = bucket, Prefix = prefix):
+        for obj in page.get("Contents", []):
+            if obj["Key"].endswith((".csv",".csv.gz")):
+                body  = client.get_object(Bucket = bucket, Key = obj["Key"])["Body"].read()
+                body  = gzip.decompress(body) if obj["Key"].endswith(".gz") else body
+                rows += body.count(b"\n") - 1
+    return rows
+
+# Baselines
+#------------------------------------------------------------------------------
+def compare(results, baselines, tolerance):
+    '''Flag results slower or heavier than the baseline by more than `tolerance`.'''
+    for name, result in results.items():
+        base = baselines.get(name)
+        result["regression"] = []
+        if base is None:
+            continue
+        for measure in ["wall_s","peak_rss_mb"]:
+            if result[measure] > base[measure] * (1 + tolerance):
+                result["regression"].append(f"{measure} {base[measure]:.2f} -> {result[measure]:.2f}")
+    return results
+
+def report(results):
+    print(f"{'stage@scale':<24}{'wall (s)':>10}{'peak RSS (MB)':>15}{'rows':>12}{'rows/sec':>12}  regression")
+    for name, result in results.items():
+        print(f"{name:<24}{result['wall_s']:>10.2f}{result['peak_rss_mb']:>15.1f}{result['rows']:>12,}"
+              f"{result['rows_per_s']:>12,.0f}  {'; '.join(result['regression'])}")
+        for step in result.get("steps", []):
+            rows = step["rows_out"] if step["rows_out"] is not None else step["rows_in"]
+            print(f"  {step['step']:<22}{step['wall_s']:>10.2f}{step['peak_rss_mb']:>15.1f}"
+                  f"{rows if rows is not None else '':>12}")
+
+# Main
+#------------------------------------------------------------------------------
+def main():
+    import boto3
+    from pipeline import STAGES
+
+    parser = argparse.ArgumentParser(description = "Benchmark the preprocessing scripts on synthetic data")
+    parser.add_argument("--scales"       , nargs = "*", type = int, default = [1, 4])
+    parser.add_argument("--stages"       , nargs = "*", choices = [stage.name for stage in STAGES])
+    parser.add_argument("--gho-latency"  , type = float, default = 0.1, help = "seconds per GHO request")
+    parser.add_argument("--tolerance"    , type = float, default = 0.25, help = "allowed slowdown vs baseline")
+    parser.add_argument("--save-baseline", action = "store_true")
+    parser.add_argument("--worker"       , help = argparse.SUPPRESS)
+    parser.add_argument("--scale"        , type = int, default = 1, help = argparse.SUPPRESS)
+    args = parser.parse_args()
+
+    if args.worker:
+        return worker(args.worker, args.scale, args.gho_latency)
+
+    # Local S3 and environment of the scripts
+    server, endpoint = start_s3()
+    folder = tempfile.mkdtemp(prefix = "bench-")
+    env    = dict(os.environ, AWS_ENDPOINT_URL = endpoint, AWS_ACCESS_KEY_ID = "bench", AWS_SECRET_ACCESS_KEY = "bench",
+                  AWS_DEFAULT_REGION = "us-east-1", PYTHONPATH = SOURCE)
+    client = boto3.client("s3", endpoint_url = endpoint, region_name = "us-east-1",
+                          aws_access_key_id = "bench", aws_secret_access_key = "bench")
+    stages  = [stage for stage in STAGES if args.stages is None or stage.name in args.stages]
+    results = {}
+
+    try:
+        for scale in args.scales:
+
+            # Synthetic inputs
+            bucket = f"bench-{scale}"
+            client.create_bucket(Bucket = bucket)
+            write  = lambda key, body: client.put_object(Bucket = bucket, Key = key, Body = body)
+            rows   = {"ihme-haq": synthetic.ihme_haq(write, scale),
+                      "ihme-le" : synthetic.ihme_gbd(write, scale),
+                      "who-ghed": synthetic.who_ghed(write, scale)}
+            synthetic.keys(write, scale)
+
+            # Run stages in pipeline order, cold caches
+            for stage in stages:
+                cache = tempfile.mkdtemp(dir = folder)
+                env_  = dict(env, sclbucket = bucket, ghocache = f"{cache}/gho", ghocatalogue = f"{cache}/gho-catalogue.pkl", keycache = f"{cache}/keys",
+                             ghedcache = f"{cache}/ghed", pipelinestate = f"{cache}/pipeline.json",
+                             sclmetrics = f"{cache}/metrics")
+                if stage.name not in rows and stage.name != "who-gho":
+                    rows[stage.name] = sum(line_count(client, bucket, prefix) for prefix in stage.inputs[1:])
+                out = subprocess.run([sys.executable, __file__, "--worker", stage.script, "--scale", str(scale),
+                                      "--gho-latency", str(args.gho_latency)], env = env_, capture_output = True, text = True)
+                if out.returncode != 0:
+                    print(f"[{stage.name}@{scale}] failed\n{out.stderr}")
+                    continue
+                result = json.loads(out.stdout.strip().splitlines()[-1])
+                result["rows"]       = result.pop("gho_rows") if stage.name == "who-gho" else rows[stage.name]
+                result["rows_per_s"] = result["rows"] / result["wall_s"]
+                results[f"{stage.name}@{scale}"] = result
+    finally:
+        server.stop()
+
+    # Compare with baselines
+    baselines = {}
+    if os.path.exists(BASELINES):
+        with open(BASELINES) as file:
+            baselines = json.load(file)
+    report(compare(results, baselines, args.tolerance))
+
+    if args.save_baseline:
+        baselines.update({name: {key: value for key, value in result.items() if key not in ("regression","steps")} for name, result in results.items()})
+        with open(BASELINES, "w") as file:
+            json.dump(baselines, file, indent = 1, sort_keys = True)
+    return 1 if any(result["regression"] for result in results.values()) else 0
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,191 @@
+'''
+Program   : Synthetic raw inputs for benchmarks
+Source    : Multiple
+Dependency: SCL-SPH
+Repository: indicators_health_secondary_data
+            https://github.com/BID-DATA/indicators_health_secondary_data
+Objective : Generate raw inputs with the same schema as the Social Data Lake files
+Notes     : The scale factor multiplies the size of each input
+                IHME GBD: age groups and subnational locations
+                IHME HAQ: years and subnational locations
+                WHO GHED: extra (unused) variables in the Data sheet and years
+                WHO GHO : disaggregation rows per code
+            Values are random, only names, columns and dtypes follow the real files
+            Every generator returns the number of raw rows it wrote
+'''
+
+# Libraries
+#------------------------------------------------------------------------------
+import io
+import zlib
+import numpy as np
+import pandas as pd
+
+# Countries
+#------------------------------------------------------------------------------
+IADB  = ["ARG","BHS","BRB","BLZ","BOL","BRA","CHL","COL","CRI","DOM","ECU","SLV","GTM"]
+IADB += ["GUY","HTI","HND","JAM","MEX","NIC","PAN","PRY","PER","SUR","TTO","URY","VEN"]
+OECD  = ["AUS","AUT","BEL","CAN","CHL","COL","CRI","CZE","DNK","EST","FIN","FRA","DEU"]
+OECD += ["GRC","HUN","ISL","IRL","ISR","ITA","JPN","KOR","LVA","LTU","LUX","MEX","NLD"]
+OECD += ["NZL","NOR","POL","PRT","SVK","SVN","ESP","SWE","CHE","TUR","GBR","USA"]
+
+def countries(n = 200):
+    '''DataFrame of `n` countries: isoalpha3, country_name_en, income_group.'''
+    codes  = list(dict.fromkeys(IADB + OECD))
+    codes += [f"X{i:02d}" for i in range(n - len(codes))]
+    groups = ["High income","Upper middle income","Lower middle income","Low income"]
+    return pd.DataFrame({"isoalpha3"      : codes,
+                         "country_name_en": [f"Country {code}" for code in codes],
+                         "income_group"   : [groups[i % 4] for i in range(len(codes))]})
+
+# Generators
+#------------------------------------------------------------------------------
+def keys(write, scale = 1):
+    '''iadb-keys.csv, oecd-keys.csv and world-keys.csv.'''
+    world = countries()
+    iadb  = pd.DataFrame({"isoalpha3": IADB, "iadbcode": range(1, len(IADB) + 1)})
+    oecd  = pd.DataFrame({"isoalpha3": OECD})
+    path  = "Geospatial Basemaps/Cartographic Boundary Files/keys"
+    write(f"{path}/iadb-keys.csv" , iadb.to_csv(index = False).encode())
+    write(f"{path}/oecd-keys.csv" , oecd.to_csv(index = False).encode())
+    write(f"{path}/world-keys.csv", world.to_csv(index = False).encode())
+    return len(world) + len(iadb) + len(oecd)
+
+def ihme_locations(scale = 1):
+    '''IHME location codebook: global/regions (levels 0-2), countries (3), subnational (4).'''
+    world = countries()
+    rows  = [(1, "Global", 0, "G")] + [(2 + i, f"Region {i}", 1 + i % 2, None) for i in range(20)]
+    rows += [(100 + i, name, 3, code) for i, (code, name) in enumerate(zip(world.isoalpha3, world.country_name_en))]
+    rows += [(1000 + i, f"Subnational {i}", 4, None) for i in range(50 * scale)]
+    return pd.DataFrame(rows, columns = ["location_id","location_name","level","ihme_loc_id"])
+
+def ihme_gbd(write, scale = 1, seed = 0):
+    '''ihme-gbd-le-{1,2,3}.csv, ihme-gbd-hale-{1,2,3}.csv and codebook/ihme-location-2019.csv.'''
+    rng    = np.random.default_rng(seed)
+    locs   = ihme_locations(scale)
+    ages   = ["<1 year"] + [f"{5 * i} to {5 * i + 4}" for i in range(1, 4 * scale)]
+    sexes  = {1: "Male", 2: "Female", 3: "Both"}
+    years  = np.arange(1990, 2020)
+    path   = "International Organizations/Institute for Health Metrics and Evaluation (IHME)/Global Burden of Disease (GBD)"
+    total  = 0
+    grid   = pd.MultiIndex.from_product([locs.index, list(sexes), range(len(ages)), years], names = ["loc","sex","age","year"]).to_frame(index = False)
+
+    for measure_id, measure, name in [(26, "Life expectancy", "le"), (28, "HALE (Healthy life expectancy)", "hale")]:
+        data = pd.DataFrame({"measure_id"   : measure_id,
+                             "measure_name" : measure,
+                             "location_id"  : locs.location_id.to_numpy()[grid["loc"]],
+                             "location_name": locs.location_name.to_numpy()[grid["loc"]],
+                             "sex_id"       : grid.sex,
+                             "sex_name"     : grid.sex.map(sexes),
+                             "age_id"       : grid.age + 1,
+                             "age_name"     : np.array(ages)[grid.age],
+                             "metric_id"    : 5,
+                             "metric_name"  : "Years",
+                             "year"         : grid.year,
+                             "val"          : rng.normal(70, 8, len(grid)).round(6)})
+        data["upper"] = data.val + 1
+        data["lower"] = data.val - 1
+        for i, part in enumerate(np.array_split(np.arange(len(data)), 3), start = 1):
+            write(f"{path}/raw/ihme-gbd-{name}-{i}.csv", data.iloc[part].to_csv(index = False).encode())
+        total += len(data)
+
+    write(f"{path}/codebook/ihme-location-2019.csv", locs.to_csv(index = False).encode())
+    return total
+
+def ihme_haq(write, scale = 1, seed = 0):
+    '''haq_1990_2016_scaled.csv.'''
+    rng        = np.random.default_rng(seed)
+    locs       = ihme_locations(scale)
+    locs       = locs[locs.level >= 3]
+    indicators = ["Healthcare Access and Quality Index"] + [f"Cause {i}" for i in range(32)]
+    years      = np.arange(1990, 1990 + 27 * scale)
+    grid       = pd.MultiIndex.from_product([locs.index, range(len(indicators)), years], names = ["loc","ind","year"]).to_frame(index = False)
+    data = pd.DataFrame({"location_id"      : locs.location_id[grid["loc"]].to_numpy(),
+                         "ihme_loc_id"      : locs.ihme_loc_id[grid["loc"]].fillna("SUB").to_numpy(),
+                         "location_name"    : locs.location_name[grid["loc"]].to_numpy(),
+                         "indicator_id"     : grid.ind + 1,
+                         "indicator_name"   : np.array(indicators)[grid.ind],
+                         "measure"          : "scaled",
+                         "year_id"          : grid.year,
+                         "val"              : rng.uniform(0, 100, len(grid)).round(4),
+                         "parent_location"  : "Region",
+                         "sdi_quintile"     : "Middle SDI",
+                         "super_region_name": "Super region",
+                         "region_name"      : "Region"})
+    data["lower"] = data.val - 1
+    data["upper"] = data.val + 1
+    path = "International Organizations/Institute for Health Metrics and Evaluation (IHME)/Healthcare Access and Quality (HAQ) index/raw"
+    write(f"{path}/haq_1990_2016_scaled.csv", data.to_csv(index = False).encode())
+    return len(data)
+
+GHED_VARS  = ["che_usd","gdp_usd","gdp_ppp","pop"]
+GHED_VARS += ["gghed","gghed_usd","gghed_ppp2020","gghed_usd2020_pc","gghed_ppp2020_pc","gghed_gdp"]
+GHED_VARS += ["hf3"  ,"hf3_usd"  ,"hf3_ppp2020"  ,"hf3_usd2020_pc"  ,"hf3_ppp2020_pc"  ,"hf3_gdp"  ]
+GHED_VARS += ["hf2"  ,"hf2_usd"  ,"hf2_ppp2020"  ,"hf2_usd2020_pc"  ,"hf2_ppp2020_pc"  ,"hf2_gdp"  ]
+
+def who_ghed(write, scale = 1, seed = 0):
+    '''GHED_data_raw.xlsx with Data and Codebook sheets.'''
+    rng    = np.random.default_rng(seed)
+    world  = countries()
+    years  = np.arange(2022 - 22 * scale, 2022)
+    extra  = [f"var{i:03d}" for i in range(40 * scale)]
+    grid   = pd.MultiIndex.from_product([world.index, years], names = ["c","year"]).to_frame(index = False)
+    data   = pd.DataFrame({"country": world.country_name_en[grid.c].to_numpy(),
+                           "code"   : world.isoalpha3[grid.c].to_numpy(),
+                           "year"   : grid.year})
+    values = pd.DataFrame(rng.uniform(1, 1e4, (len(grid), len(GHED_VARS) + len(extra))), columns = GHED_VARS + extra)
+    values.loc[rng.random(len(grid)) < 0.05, "gdp_usd"] = np.nan
+    data   = pd.concat([data, values], axis = 1)
+    book   = pd.DataFrame({"variable code": GHED_VARS + extra,
+                           "variable name": [f"Name of {name}" for name in GHED_VARS + extra]})
+
+    buffer = io.BytesIO()
+    with pd.ExcelWriter(buffer, engine = "openpyxl") as writer:
+        data.to_excel(writer, sheet_name = "Data", index = False)
+        book.to_excel(writer, sheet_name = "Codebook", index = False)
+    path = "International Organizations/World Health Organization (WHO)/Globoal Health Expenditure Database (GHED)"
+    write(f"{path}/GHED_data_raw.xlsx", buffer.getvalue())
+    return len(data)
+
+GHO_CODES  = ["WHOSIS_000003","nmr","MDG_0000000007","u5mr","MEDS1_02_04","MDG_0000000001","imr","MEDS1_02_03"]
+GHO_CODES += ["WHS6_102","HWF_0001","FINPROTECTION_CATA_TOT_10_POP","WSH_SANITATION_BASIC","WSH_SANITATION_SAFELY_MANAGED"]
+GHO_CODES += ["NCD_BMI_25C","NCD_BMI_25A","NCD_BMI_18C","NCD_BMI_18A","LBW_PREVALENCE","NUTUNDERWEIGHTPREV"]
+GHO_CODES += ["NUTOVERWEIGHTPREV","NUTRITION_ANT_WHZ_NE2","vmsl","WHS8_110","MCV2","WHS4_543","vbcg"]
+GHO_CODES += ["UHC_INDEX_REPORTED","UHC_SCI_RMNCH"] + [f"OTHER_{i:04d}" for i in range(500)]
+
+GHO_CATEGORIES = {"SEX": ["BTSX","MLE","FMLE"], "AGEGROUP": ["YEARS18-PLUS","YEARS05-09"],
+                  "RESIDENCEAREATYPE": ["URB","RUR","TOTL"], "WEALTHQUINTILE": ["WQ1","WQ5"]}
+
+def gho_codes(codes):
+    '''Code catalogue as returned by GHOSession.get_data_codes(format = "dataframe").'''
+    return pd.DataFrame({"@Label": codes, "Display": [f"Indicator {code}" for code in codes], "Url": ""})
+
+def gho_frame(code, scale = 1, seed = 0):
+    '''
+    Data of one GHO code as returned by GHOSession.fetch_data_from_codes(code = ...).
+    Rows are distinct cells of year x country x categories, as in the API; each country
+    is in one region.
+    '''
+    rng     = np.random.default_rng(zlib.crc32(code.encode()) + seed)
+    world   = countries()
+    years   = np.arange(2000, 2022)
+    regions = np.array(["AMR","EUR","AFR","WPR"])
+    values  = [np.array(items + [None], dtype = object) for items in GHO_CATEGORIES.values()]
+    shape   = [len(years), len(world)] + [len(items) for items in values]
+    n       = min(len(world) * len(years) * scale, int(np.prod(shape)))
+    cell    = np.unravel_index(rng.choice(int(np.prod(shape)), n, replace = False), shape)
+    data  = pd.DataFrame({"GHO"         : code,
+                          "PUBLISHSTATE": "PUBLISHED",
+                          "YEAR"        : years[cell[0]],
+                          "REGION"      : regions[cell[1] % len(regions)],
+                          "COUNTRY"     : world.isoalpha3.to_numpy()[cell[1]],
+                          "Display"     : "",
+                          "Numeric"     : rng.uniform(0, 100, n).round(3),
+                          "Low"         : np.nan,
+                          "High"        : np.nan,
+                          "Comments"    : None})
+    for k, name in enumerate(GHO_CATEGORIES):
+        data[name] = values[k][cell[2 + k]]
+    data.loc[rng.random(n) < 0.02, "COUNTRY"] = None
+    data["Value"] = data.Numeric.astype(str)
+    return data
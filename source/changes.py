@@ -0,0 +1,198 @@
+'''
+Program   : Row-level change capture of the published datasets
+Source    : Multiple
+Dependency: SCL-SPH
+Repository: indicators_health_secondary_data
+            https://github.com/BID-DATA/indicators_health_secondary_data
+Objective : Publish the rows inserted, updated and deleted since the last run of a dataset
+Notes     : Each row is hashed twice: by its natural key (e.g. source, isoalpha3, indicator,
+                sex, age, year) and by its other columns (value, labels)
+            Values are hashed as text that is the same after a CSV round trip: missing values
+                and "" are equal, columns that read as numbers are numbers, integral numbers
+                are integers and other numbers float64
+            The hashes of the published version are kept in {path}/changes/{name}/{run}.state.csv.gz,
+                so a run only compares integer hashes, without reading the previous dataset
+            Each run with changes writes {path}/changes/{name}/{run}.csv.gz with the column
+                `op` (insert, update or delete; deletes only have the key columns) and
+                {path}/changes/{name}/{run}.json with its counts
+            manifest.json lists the runs in order and is written last; the state of a run is
+                only used once the manifest lists it
+            Consumers apply the deltas of the runs after the last one they applied (see apply);
+                the first run is a full insert
+            Usage: publish_changes(data, storage_, path, "indicators_health", keys = [...])
+'''
+
+# Libraries
+#------------------------------------------------------------------------------
+import io
+import json
+import time
+import numpy as np
+import pandas as pd
+from storage import as_storage
+from subset import get_subset
+
+# Delta version: a manifest of another version is ignored (the next delta is a full insert)
+VERSION = 2
+OPS     = ("insert","update","delete")
+
+# Hashes
+#------------------------------------------------------------------------------
+def _numbers(numbers):
+    '''Text of float64 `numbers`: integral numbers as integers, missing as "".'''
+    text     = numbers.astype(str).astype(object)
+    integral = np.isfinite(numbers) & (numbers == np.trunc(numbers)) & (np.abs(numbers) < 2**53)
+    text[integral] = numbers[integral].astype(np.int64).astype(str)
+    text[np.isnan(numbers)] = ""
+    return text
+
+def _text(values):
+    '''
+    Text of each value of a column, the same before and after a CSV round trip:
+    missing values and "" are "", a column of numbers (or of text that reads as numbers,
+    as read_csv does) is written as numbers, integral numbers as integers (2001.0, 2001
+    and "2001" are "2001") and other numbers as float64.
+    '''
+    values = pd.Series(np.asarray(values), copy = False)
+    if pd.api.types.is_numeric_dtype(values.dtype) or pd.api.types.is_bool_dtype(values.dtype):
+        return _numbers(values.to_numpy(dtype = np.float64, na_value = np.nan))
+    text    = values.to_numpy(dtype = object)
+    missing = values.isna().to_numpy() | (text == "")
+    if missing.all():
+        return np.full(len(text), "", dtype = object)
+
+    # Note: only parsed when the first value reads as a number
+    first = text[~missing][0]
+    try:
+        float(first)
+        numbers = pd.to_numeric(pd.Series(np.where(missing, np.nan, text)), errors = "coerce").to_numpy(dtype = np.float64)
+    except (TypeError, ValueError):
+        numbers = None
+    if numbers is not None and not np.isnan(numbers[~missing]).any():
+        return _numbers(numbers)
+    text = text.astype(str).astype(object)
+    text[missing] = ""
+    return text
+
+def _hash(data):
+    '''uint64 hash of each row of `data`, from the text of its values (see _text).'''
+    if data.shape[1] == 0:
+        return np.zeros(len(data), dtype = np.uint64)
+    text = pd.DataFrame({name: _text(data[name]) for name in data.columns})
+    return pd.util.hash_pandas_object(text, index = False).to_numpy()
+
+def hashes(data, keys):
+    '''
+    DataFrame with the `keys` columns of `data` and the hashes `key` (of `keys`) and
+    `row` (of the other columns). Rows with the same `keys` (reported by the quality
+    gate) are told apart by their other columns.
+    '''
+    output = data[keys].reset_index(drop = True)
+    output["key"] = _hash(data[keys])
+    output["row"] = _hash(data.drop(columns = keys))
+    duplicated = output.key.duplicated(keep = False).to_numpy()
+    if duplicated.any():
+        output.loc[duplicated, "key"] = _hash(output.loc[duplicated, ["key","row"]])
+    return output
+
+# Delta
+#------------------------------------------------------------------------------
+def delta(data, keys, state = None):
+    '''
+    (delta, state) of `data` against `state` (the hashes of the previous version, or None).
+    delta has the column `op` and the columns of `data`; deleted rows only have `keys`.
+    '''
+    current = hashes(data, keys)
+    # Note: identical rows are kept once in the state
+    unique  = current.drop_duplicates("key", ignore_index = True)
+    if state is None or len(state) == 0:
+        output = data.reset_index(drop = True)
+        output.insert(0, "op", "insert")
+        return output, unique
+
+    # Integer lookups of the current keys in the previous version
+    previous = pd.Index(state.key.to_numpy())
+    position = previous.get_indexer(current.key.to_numpy())
+    found    = position >= 0
+    changed  = np.zeros(len(current), dtype = bool)
+    changed[found] = state.row.to_numpy()[position[found]] != current.row.to_numpy()[found]
+    deleted  = ~previous.isin(current.key.to_numpy())
+
+    rows     = data.reset_index(drop = True)
+    inserts  = rows[~found].assign(op = "insert")
+    updates  = rows[changed].assign(op = "update")
+    deletes  = state.loc[deleted, keys].assign(op = "delete")
+    output   = pd.concat([inserts, updates, deletes], ignore_index = True)
+    return output[["op"] + list(data.columns)], unique
+
+def apply(data, changes, keys):
+    '''`data` with the rows of a delta `changes` applied (inserts and updates replace by key).'''
+    kept  = data[~np.isin(_hash(data[keys]), _hash(changes[keys]))]
+    added = changes[changes.op != "delete"].drop(columns = "op")
+    return pd.concat([kept, added], ignore_index = True)
+
+# Publish
+#------------------------------------------------------------------------------
+def _read_csv(storage, key, **kwargs):
+    try:
+        return pd.read_csv(io.BytesIO(storage.read(key)), compression = "gzip", **kwargs)
+    except FileNotFoundError:
+        return None
+
+def _write_csv(storage, key, data):
+    buffer = io.BytesIO()
+    data.to_csv(buffer, index = False, compression = {"method": "gzip", "mtime": 0})
+    storage.write(key, buffer.getvalue(), content_type = "application/gzip")
+
+def read_manifest(storage, folder):
+    '''Manifest of the deltas of `folder`, or an empty manifest.'''
+    try:
+        manifest = json.loads(storage.read(f"{folder}/manifest.json"))
+    except FileNotFoundError:
+        return {"version": VERSION, "runs": []}
+    return manifest if manifest.get("version") == VERSION else {"version": VERSION, "runs": []}
+
+def publish_changes(data, storage, path, name, keys):
+    '''
+    Write the delta of `data` since the last run to {path}/changes/{name}/ of `storage`.
+    The delta and the state of the run are written before the manifest that lists them,
+    so a failed run leaves the previous run as the last one. Returns the manifest entry
+    of the run (None if no changes or in a subset run, see subset.py).
+    '''
+    if get_subset().active:
+        print(f"[changes] {name}: subset run, no delta published")
+        return None
+    storage  = as_storage(storage)
+    keys     = list(keys)
+    folder   = f"{path}/changes/{name}"
+    manifest = read_manifest(storage, folder)
+    last     = manifest["runs"][-1] if manifest["runs"] else None
+    state    = _read_csv(storage, last["state"], dtype = {"key": np.uint64, "row": np.uint64}) if last else None
+
+    changes, current = delta(data, keys, state)
+    counts = {op: int((changes.op == op).sum()) for op in OPS}
+    if len(changes) == 0:
+        print(f"[changes] {name}: no changes")
+        return None
+
+    # Note: run ids are numbered, so they sort in order and never repeat
+    run   = f"{len(manifest['runs']) + 1:05d}-{time.strftime('%Y%m%dT%H%M%S', time.gmtime())}"
+    entry = {"run"     : run,
+             "previous": last["run"] if last else None,
+             "full"    : state is None,
+             "keys"    : keys,
+             "rows"    : len(data),
+             "delta"   : f"{folder}/{run}.csv.gz",
+             "state"   : f"{folder}/{run}.state.csv.gz",
+             **counts}
+    _write_csv(storage, entry["delta"], changes)
+    _write_csv(storage, entry["state"], current)
+    storage.write(f"{folder}/{run}.json", json.dumps(entry, indent = 1).encode(), content_type = "application/json")
+    manifest["runs"].append(entry)
+    storage.write(f"{folder}/manifest.json", json.dumps(manifest, indent = 1).encode(), content_type = "application/json")
+
+    # Note: only the state of the last run is needed
+    if last:
+        storage.delete(last["state"])
+    print(f"[changes] {name}: {counts['insert']} inserts, {counts['update']} updates, {counts['delete']} deletes")
+    return entry
@@ -0,0 +1,305 @@
+'''
+Program   : Dashboard figures
+Source    : who-gho-api, GHED_data_processed, haq, ihme-gbd-le-hale
+Dependency: SCL-SPH
+Repository: indicators_health_secondary_data
+            https://github.com/BID-DATA/indicators_health_secondary_data
+Objective : Render the figures of examples/dashboard-figures.ipynb from a list of chart specs
+Notes     : A chart spec (Chart) declares the dataset, indicators, countries, filters,
+                years and chart type of one figure; CHARTS has the figures of the notebook
+            Each dataset is read once (only the columns and indicators of the charts) and
+                indexed by indicator, so a chart selects its rows without copying the dataset
+            Rows of a chart are averaged by x (country or year) and hue, e.g. the IADB
+                average by year of a GHO indicator
+            Figures are rendered in worker processes and saved as {name}.png/.svg
+            Requires matplotlib
+            Usage: python source/figures.py [--charts hospital_beds ...] [--output figures]
+                       [--formats png svg] [--workers 8] [--storage DIR] [--list]
+'''
+
+# Libraries
+#------------------------------------------------------------------------------
+import os
+import time
+import argparse
+from dataclasses import dataclass, field
+from concurrent.futures import ProcessPoolExecutor
+import numpy as np
+import pandas as pd
+from outputs import load
+
+# Datasets
+#------------------------------------------------------------------------------
+IHME = "International Organizations/Institute for Health Metrics and Evaluation (IHME)/"
+WHO  = "International Organizations/World Health Organization (WHO)/"
+
+@dataclass(frozen = True)
+class Dataset:
+    '''Processed dataset and the names of its columns.'''
+    path     : str
+    name     : str
+    indicator: str
+    country  : str
+    year     : str
+    value    : str
+    label    : str
+    latest   : str = None
+
+DATASETS = {
+    "who_gho" : Dataset(WHO + "Global Health Observatory (GHO)", "who-gho-api",
+                        "GHO", "COUNTRY", "YEAR", "Numeric", "display", latest = "LATEST"),
+    "who_ghed": Dataset(WHO + "Globoal Health Expenditure Database (GHED)", "GHED_data_processed",
+                        "var_code", "code", "year", "value", "var_name"),
+    "ihme_haq": Dataset(IHME + "Healthcare Access and Quality (HAQ) index/processed", "haq",
+                        "indicator_name", "code", "year", "val", "indicator_name"),
+    "ihme_le" : Dataset(IHME + "Global Burden of Disease (GBD)/processed", "ihme-gbd-le-hale",
+                        "measure_name", "code", "year", "val", "measure_name"),
+}
+
+# Chart specs
+#------------------------------------------------------------------------------
+KINDS   = ("bar","barh","line","area")
+REGIONS = ("IADB","OECD","Global")
+
+@dataclass
+class Chart:
+    '''
+    One figure: rows of `indicators` in `dataset` for `countries` (iadb, oecd, regions
+    or a tuple of codes), filtered by `where` ({column: value or list of values}).
+    `year` is latest (LATEST flag, or last year of the rows), all, or a first year.
+    '''
+    name      : str
+    dataset   : str
+    indicators: tuple
+    kind      : str   = "bar"
+    countries : object = "iadb"
+    where     : dict  = field(default_factory = dict)
+    year      : object = "latest"
+    x         : str   = "country"
+    hue       : str   = None
+    labels    : dict  = field(default_factory = dict)
+    stacked   : bool  = False
+    title     : str   = None
+    colors    : list  = None
+    size      : tuple = (12,4)
+
+SOURCES = {"gghed_che": "Government", "oop_che": "Out-of-pocket", "pri_che": "Private",
+           "gghed_usd": "Government", "hf3_usd": "Out-of-pocket", "hf2_usd": "Private"}
+SCHEMES = ["#418AB3","#A6B727","#F69200"]
+SEXES   = {"BTSX": "Both", "FMLE": "Female", "MLE": "Male"}
+
+CHARTS = [
+    # Epi-social determinants
+    Chart("sanitation_basic"   , "who_gho", ("WSH_SANITATION_BASIC",), where = {"CATEGORY": "TOTL"}),
+    Chart("overweight_adults"  , "who_gho", ("NCD_BMI_25A",), where = {"CATEGORY": "BTSX-YEARS18-PLUS"}),
+    Chart("underweight_adults" , "who_gho", ("NCD_BMI_18A",), where = {"CATEGORY": "BTSX-YEARS18-PLUS"}),
+    Chart("low_birth_weight"   , "who_gho", ("LBW_PREVALENCE",)),
+    Chart("overweight_children", "who_gho", ("NUTOVERWEIGHTPREV",)),
+
+    # Funding and resources
+    Chart("che_by_source"        , "who_ghed", ("gghed_usd","hf3_usd","hf2_usd"), kind = "area", countries = ("IADB",),
+          year = "all", x = "year", hue = "var_code", labels = SOURCES, colors = SCHEMES, size = (12,6)),
+    Chart("che_share_regions"    , "who_ghed", ("gghed_che","oop_che","pri_che"), kind = "barh", countries = "regions",
+          hue = "var_code", labels = SOURCES, colors = SCHEMES, title = "% of CHE", size = (8,10)),
+    Chart("che_share_countries"  , "who_ghed", ("gghed_che","oop_che","pri_che"), hue = "var_code",
+          labels = SOURCES, stacked = True, colors = SCHEMES, title = "% of CHE"),
+    Chart("hospital_beds"        , "who_gho", ("WHS6_102",)),
+    Chart("doctors"              , "who_gho", ("HWF_0001",)),
+
+    # Coverage and quality
+    Chart("vaccination_dtp3_trend", "who_gho", ("WHS4_543",), year = "all", x = "year"),
+    Chart("vaccination_dtp3"      , "who_gho", ("WHS4_543",)),
+    Chart("vaccination_mcv1"      , "who_gho", ("WHS8_110",)),
+    Chart("uhc_index"             , "who_gho", ("UHC_INDEX_REPORTED","UHC_SCI_RMNCH"), hue = "GHO",
+          labels = {"UHC_INDEX_REPORTED": "General", "UHC_SCI_RMNCH": "Reproductive, maternal, newborn and child health"}),
+    Chart("haq_index"             , "ihme_haq", ("Healthcare Access and Quality Index",)),
+
+    # Population health
+    Chart("life_expectancy_trend" , "ihme_le", ("Life expectancy at birth",), kind = "line", countries = ("IADB",),
+          where = {"age_name": "<1 year"}, year = "all", x = "year", hue = "sex_name"),
+    Chart("life_expectancy"       , "ihme_le", ("Life expectancy at birth",), where = {"age_name": "<1 year", "sex_name": ["Female","Male"]},
+          hue = "sex_name", colors = ["#F50000","#FFC233"]),
+    Chart("healthy_life_expectancy", "ihme_le", ("Healthy Life Expectancy at birth",), where = {"age_name": "<1 year", "sex_name": ["Female","Male"]},
+          hue = "sex_name", colors = ["#F50000","#FFC233"]),
+    Chart("infant_mortality_trend", "who_gho", ("MDG_0000000001",), kind = "line", year = 1961, x = "year", hue = "CATEGORY"),
+    Chart("infant_mortality"      , "who_gho", ("MDG_0000000001",), hue = "CATEGORY", labels = SEXES),
+    Chart("neonatal_mortality"    , "who_gho", ("WHOSIS_000003",), hue = "CATEGORY", labels = SEXES),
+
+    # Financial protection
+    Chart("oop_trend"             , "who_ghed", ("hf3_usd",), kind = "line", countries = ("IADB",), year = "all", x = "year"),
+    Chart("oop_che"               , "who_ghed", ("oop_che",)),
+    Chart("catastrophic_oop"      , "who_gho", ("FINPROTECTION_CATA_TOT_10_POP",), where = {"CATEGORY": "TOTL"},
+          title = "Population with household expenditures on health > 10% of total household expenditure/income (%)"),
+]
+
+def check(charts):
+    '''Raise ValueError for unknown datasets or kinds and duplicated chart names.'''
+    names = [chart.name for chart in charts]
+    if len(names) != len(set(names)):
+        raise ValueError(f"Duplicated chart names: {sorted({name for name in names if names.count(name) > 1})}")
+    for chart in charts:
+        if chart.dataset not in DATASETS:
+            raise ValueError(f"{chart.name}: dataset must be one of {list(DATASETS)}, got {chart.dataset!r}")
+        if chart.kind not in KINDS:
+            raise ValueError(f"{chart.name}: kind must be one of {KINDS}, got {chart.kind!r}")
+        if chart.x not in ("country","year"):
+            raise ValueError(f"{chart.name}: x must be country or year, got {chart.x!r}")
+
+# Selection
+#------------------------------------------------------------------------------
+class Index:
+    '''Rows of a dataset by indicator.'''
+
+    def __init__(self, data, dataset):
+        self.data    = data.reset_index(drop = True)
+        self.dataset = dataset
+        self.rows    = self.data.groupby(dataset.indicator, observed = True, sort = False).indices
+
+    def select(self, chart, countries):
+        '''(rows of `chart` as columns x, hue, value; title) for the codes `countries`.'''
+        dataset = self.dataset
+        rows    = [self.rows[code] for code in chart.indicators if code in self.rows]
+        temp    = self.data.take(np.sort(np.concatenate(rows))) if rows else self.data.iloc[:0]
+        temp    = temp[temp[dataset.country].isin(countries)]
+        for column, value in chart.where.items():
+            temp = temp[temp[column].isin(value if isinstance(value, (list, tuple, set)) else [value])]
+
+        # Years
+        title = chart.title or (str(temp[dataset.label].iloc[0]) if len(temp) else chart.name)
+        if chart.year == "latest" and dataset.latest:
+            temp = temp[temp[dataset.latest] == 1]
+        elif chart.year == "latest" and len(temp):
+            year_ = temp[dataset.year].max()
+            temp  = temp[temp[dataset.year] == year_]
+            title = f"{title}, {int(year_)}"
+        elif chart.year != "all":
+            temp = temp[temp[dataset.year] >= chart.year]
+
+        # Average by x and hue
+        output = pd.DataFrame({"x"    : temp[dataset.country if chart.x == "country" else dataset.year].to_numpy(),
+                               "hue"  : temp[chart.hue].map(lambda value: chart.labels.get(value, value)).to_numpy() if chart.hue else "",
+                               "value": temp[dataset.value].to_numpy(dtype = float, na_value = np.nan)})
+        if chart.x == "year":
+            output["x"] = output.x.astype(int)
+        output = output.groupby(["x","hue"], sort = True).value.mean().reset_index()
+        return output, title
+
+def countries_of(chart, keys):
+    '''Codes of the countries of `chart`.'''
+    if chart.countries == "iadb":
+        return keys.codes_iadb
+    if chart.countries == "oecd":
+        return keys.codes_oecd
+    if chart.countries == "regions":
+        return set(REGIONS)
+    return set(chart.countries)
+
+def load_datasets(storage, charts):
+    '''{dataset: Index} of the datasets of `charts`, each read once with the columns and indicators used.'''
+    indexes = {}
+    for name in dict.fromkeys(chart.dataset for chart in charts):
+        dataset    = DATASETS[name]
+        charts_    = [chart for chart in charts if chart.dataset == name]
+        columns    = [dataset.indicator, dataset.country, dataset.year, dataset.value, dataset.label, dataset.latest]
+        columns   += [column for chart in charts_ for column in [chart.hue, *chart.where]]
+        columns    = list(dict.fromkeys(column for column in columns if column))
+        codes      = sorted({code for chart in charts_ for code in chart.indicators})
+        data       = load(storage.url(dataset.path), dataset.name, columns = columns, filters = [(dataset.indicator,"in",codes)])
+        indexes[name] = Index(data, dataset)
+    return indexes
+
+# Rendering
+#------------------------------------------------------------------------------
+def _init():
+    import matplotlib
+    matplotlib.use("Agg")
+    import matplotlib.pyplot as plt
+    plt.style.use("seaborn-v0_8-darkgrid")
+
+def render(chart, data, title, folder, formats):
+    '''Save the figure of `chart` with rows `data` (x, hue, value); returns the paths.'''
+    import matplotlib.pyplot as plt
+
+    wide = data.pivot(index = "x", columns = "hue", values = "value")
+    if chart.kind == "barh":
+        wide = wide.iloc[::-1]
+    fig, ax = plt.subplots(figsize = chart.size)
+    colors  = chart.colors or (["#21B0D4"] if wide.shape[1] == 1 else None)
+    wide.plot(kind = chart.kind, ax = ax, stacked = chart.stacked or chart.kind == "area",
+              color = colors[:wide.shape[1]] if colors else None, legend = chart.hue is not None)
+    ax.tick_params(labelsize = 7)
+    ax.set_xlabel("")
+    ax.set_ylabel("")
+    ax.set_title(title, fontsize = 10 if chart.x == "country" else 8)
+    if chart.hue:
+        ax.legend(ncol = min(3, wide.shape[1]), frameon = False, loc = "upper center",
+                  bbox_to_anchor = (0.5,-0.12), fontsize = 8)
+
+    paths = []
+    for format_ in formats:
+        path = os.path.join(folder, f"{chart.name}.{format_}")
+        fig.savefig(path + ".tmp", format = format_, bbox_inches = "tight", dpi = 150)
+        os.replace(path + ".tmp", path)
+        paths.append(path)
+    plt.close(fig)
+    return paths
+
+def _render(args):
+    chart, data, title, folder, formats = args
+    return chart.name, render(chart, data, title, folder, formats)
+
+def render_all(charts, storage, keys, folder = "figures", formats = ("png",), workers = None):
+    '''
+    Render `charts` to `folder` in worker processes.
+    Returns {name: paths}; charts without rows are left out (and reported).
+    '''
+    check(charts)
+    os.makedirs(folder, exist_ok = True)
+    indexes = load_datasets(storage, charts)
+
+    # Rows of each chart, selected from the index of its dataset
+    tasks = []
+    for chart in charts:
+        data, title = indexes[chart.dataset].select(chart, countries_of(chart, keys))
+        if data.value.notna().any():
+            tasks.append((chart, data, title, folder, tuple(formats)))
+        else:
+            print(f"[figures] {chart.name}: no rows")
+    if len(tasks) == 0:
+        return {}
+
+    workers = workers or os.cpu_count() or 1
+    with ProcessPoolExecutor(max_workers = max(1, min(workers, len(tasks))), initializer = _init) as pool:
+        return dict(pool.map(_render, tasks))
+
+# Command line
+#------------------------------------------------------------------------------
+if __name__ == "__main__":
+    from keys import load_keys
+    from storage import get_storage
+
+    parser = argparse.ArgumentParser(description = "Render the dashboard figures")
+    parser.add_argument("--charts" , nargs = "*", help = "charts to render (default: all)")
+    parser.add_argument("--output" , default = "figures")
+    parser.add_argument("--formats", nargs = "+", default = ["png"], choices = ["png","svg","pdf"])
+    parser.add_argument("--workers", type = int, default = None)
+    parser.add_argument("--storage", help = "local directory with the layout of the bucket (default: S3 bucket `sclbucket`)")
+    parser.add_argument("--list"   , action = "store_true", help = "list the charts and exit")
+    args = parser.parse_args()
+
+    if args.list:
+        for chart in CHARTS:
+            print(f"{chart.name:<26} {chart.dataset:<9} {chart.kind:<5} {', '.join(chart.indicators)}")
+        raise SystemExit(0)
+
+    charts = CHARTS
+    if args.charts:
+        unknown = set(args.charts) - {chart.name for chart in CHARTS}
+        if unknown:
+            parser.error(f"unknown charts: {sorted(unknown)}")
+        charts = [chart for chart in CHARTS if chart.name in args.charts]
+
+    start    = time.perf_counter()
+    storage_ = get_storage(args.storage)
+    paths    = render_all(charts, storage_, load_keys(storage_), args.output, args.formats, args.workers)
+    print(f"{len(paths)} of {len(charts)} figures rendered to {args.output} in {time.perf_counter() - start:.1f}s")
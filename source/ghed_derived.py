@@ -0,0 +1,115 @@
+'''
+Program   : Derived indicators of the GHED database
+Source    : WHO GHED
+            https://apps.who.int/nha/database
+Dependency: SCL-SPH
+Repository: indicators_health_secondary_data
+            https://github.com/BID-DATA/indicators_health_secondary_data
+Objective : Declare each derived indicator once as a ratio of base variables and compute
+            all of them in one pass
+Notes     : A ratio is scale * numerator / (sum of the denominator variables)
+                e.g. hf3_gdp = 100 * hf3_usd / gdp_usd
+                     oop_che = 100 * hf3_usd / (gghed_usd + hf3_usd + hf2_usd)
+            Ratios with regions_only are computed for region rows only; country rows keep
+                the value of the workbook (e.g. per capita in constant 2020 USD)
+            check verifies that the numerator is a variable of the same financing scheme
+                as the indicator (gghed, hf3/oop, hf2/pri, che), so a copy-pasted formula
+                such as hf3_gdp = gghed_usd / gdp_usd fails before it is computed
+            Missing values in any input give a missing ratio, as in pandas arithmetic
+'''
+
+# Libraries
+#------------------------------------------------------------------------------
+from dataclasses import dataclass
+import numpy as np
+import pandas as pd
+
+# Ratios
+#------------------------------------------------------------------------------
+@dataclass(frozen = True)
+class Ratio:
+    '''scale * numerator / sum(denominator) with an optional description.'''
+    numerator   : str
+    denominator : tuple
+    scale       : float = 1
+    name        : str   = None
+    regions_only: bool  = False
+
+# Financing scheme of an indicator (first part of its code)
+# Note: oop and pri are the names of hf3 and hf2 in the derived indicators
+SCHEMES = {"oop": "hf3", "pri": "hf2"}
+CHE     = ("gghed_usd","hf3_usd","hf2_usd")
+
+def _scheme(code):
+    prefix = code.split("_")[0]
+    return SCHEMES.get(prefix, prefix)
+
+def _per_capita(scheme, unit):
+    return Ratio(f"{scheme}_{unit}", ("pop",), 1000, regions_only = True)
+
+def _gdp(scheme):
+    return Ratio(f"{scheme}_usd", ("gdp_usd",), 100, regions_only = True)
+
+# Derived indicators
+# Note: per capita and % GDP of regions are computed from the sums of the region
+# Note: per capita in 2020 USD/PPP from the numerator in USD/PPP (gghed_usd2020_pc from gghed_usd)
+UNITS    = {"usd2020_pc": "usd", "ppp2020_pc": "ppp2020"}
+DERIVED  = {f"{scheme}_{code}": _per_capita(scheme, unit) for code, unit in UNITS.items() for scheme in ["gghed","hf3","hf2"]}
+DERIVED |= {f"{scheme}_gdp": _gdp(scheme) for scheme in ["gghed","hf3","hf2"]}
+DERIVED |= {"gghed_che": Ratio("gghed_usd", CHE, 100, "Governemnt as % CHE"),
+            "oop_che"  : Ratio("hf3_usd"  , CHE, 100, "OOP as % CHE"),
+            "pri_che"  : Ratio("hf2_usd"  , CHE, 100, "Private as % CHE"),
+            "che_gdp"  : Ratio("che_usd"  , ("gdp_usd",), 100, "CHE as % GDP")}
+
+# Functions
+#------------------------------------------------------------------------------
+def check(ratios, columns):
+    '''Raise ValueError if a ratio uses a missing variable or the numerator of another scheme.'''
+    for code, ratio in ratios.items():
+        missing = [name for name in (ratio.numerator, *ratio.denominator) if name not in columns]
+        if missing:
+            raise ValueError(f"{code}: variables {missing} are not in the data")
+        if _scheme(ratio.numerator) != _scheme(code):
+            raise ValueError(f"{code}: numerator {ratio.numerator} is not a {_scheme(code)} variable")
+
+def derive(data, ratios = DERIVED, regions = None):
+    '''
+    Add or replace the columns of `ratios` in `data`, all computed in one pass.
+    `regions` is a boolean mask of region rows, for ratios with regions_only.
+    '''
+    check(ratios, data.columns)
+    if len(ratios) == 0:
+        return data.copy()
+    codes  = list(ratios)
+    inputs = list(dict.fromkeys(name for ratio in ratios.values() for name in (ratio.numerator, *ratio.denominator)))
+    where  = {name: k for k, name in enumerate(inputs)}
+
+    # Wide array of inputs with a column of zeros to pad the denominators
+    values = np.zeros((len(data), len(inputs) + 1))
+    for name, k in where.items():
+        values[:, k] = data[name].to_numpy(dtype = float, na_value = np.nan)
+
+    # Index of the numerator and of the denominator variables of each ratio
+    width       = max(len(ratio.denominator) for ratio in ratios.values())
+    numerator   = np.array([where[ratio.numerator] for ratio in ratios.values()])
+    denominator = np.full((len(codes), width), len(inputs))
+    for k, ratio in enumerate(ratios.values()):
+        denominator[k, :len(ratio.denominator)] = [where[name] for name in ratio.denominator]
+    scale       = np.array([ratio.scale for ratio in ratios.values()], dtype = float)
+
+    # All ratios: rows x ratios
+    with np.errstate(divide = "ignore", invalid = "ignore"):
+        output = scale * values[:, numerator] / values[:, denominator].sum(axis = 2)
+
+    # Keep the country values of ratios computed for regions only
+    regions = np.ones(len(data), dtype = bool) if regions is None else np.asarray(regions, dtype = bool)
+    data    = data.copy()
+    for k, (code, ratio) in enumerate(ratios.items()):
+        if ratio.regions_only and code in data.columns:
+            output[:, k] = np.where(regions, output[:, k], data[code].to_numpy(dtype = float, na_value = np.nan))
+    data[codes] = pd.DataFrame(output, index = data.index, columns = codes)
+    return data
+
+def names(ratios = DERIVED):
+    '''{code: description} of the ratios with a description.'''
+    return {code: ratio.name for code, ratio in ratios.items() if ratio.name}
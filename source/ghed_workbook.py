@@ -0,0 +1,89 @@
+'''
+Program   : GHED workbook reader
+Source    : WHO GHED
+            https://apps.who.int/nha/database
+Dependency: SCL-SPH
+Repository: indicators_health_secondary_data
+            https://github.com/BID-DATA/indicators_health_secondary_data
+Objective : Read the sheets of GHED_data_raw.xlsx once and keep them as Parquet
+Notes     : The workbook is opened once in read-only (streaming) mode and only the
+                requested columns of each sheet are materialized
+            Sheets are cached as Parquet sidecars keyed by the ETag (version) of the workbook,
+                so repeat runs against the same workbook skip Excel parsing
+            Default location: ~/.cache/indicators_health/ghed (env variable `ghedcache`)
+'''
+
+# Libraries
+#------------------------------------------------------------------------------
+import io
+import os
+import pandas as pd
+
+def cache_path():
+    return os.environ.get("ghedcache") or os.path.expanduser("~/.cache/indicators_health/ghed")
+
+# Excel
+#------------------------------------------------------------------------------
+def read_sheets(excel_file, sheets):
+    '''
+    Read `sheets` ({sheet: list of columns or None for all}) from one pass over the workbook.
+    Returns {sheet: DataFrame}. The first row of each sheet is the header.
+    '''
+    import openpyxl
+
+    workbook = openpyxl.load_workbook(excel_file, read_only = True, data_only = True)
+    data     = {}
+    try:
+        for sheet, columns in sheets.items():
+            rows   = workbook[sheet].iter_rows(values_only = True)
+            header = list(next(rows))
+            if columns is None:
+                columns = [name for name in header if name is not None]
+            missing = [name for name in columns if name not in header]
+            if missing:
+                raise KeyError(f"Columns {missing} not found in sheet {sheet}")
+
+            # Keep only the columns of interest
+            index_  = [header.index(name) for name in columns]
+            values_ = [[row[i] for i in index_] for row in rows if any(value is not None for value in row)]
+            data[sheet] = pd.DataFrame(values_, columns = columns)
+    finally:
+        workbook.close()
+    return data
+
+# Parquet sidecar
+#------------------------------------------------------------------------------
+def _arrow_safe(data):
+    '''Text columns with mixed types (e.g. numbers and notes) are stored as strings.'''
+    data = data.copy()
+    for name in data.columns[data.dtypes == object]:
+        if pd.api.types.infer_dtype(data[name], skipna = True) not in ("string","empty"):
+            data[name] = data[name].map(lambda value: value if value is None else str(value))
+    return data
+
+def load_workbook(storage, key, sheets, folder = None):
+    '''
+    Sheets of `key` of `storage` (storage.py) as {sheet: DataFrame}.
+    Read from the Parquet sidecar of the current ETag when available.
+    '''
+    folder = folder or cache_path()
+    etag   = storage.etag(key)
+    paths  = {sheet: os.path.join(folder, etag, f"{sheet}.parquet") for sheet in sheets}
+
+    # Sidecar of this workbook version
+    if all(os.path.exists(path) for path in paths.values()):
+        data = {sheet: pd.read_parquet(path) for sheet, path in paths.items()}
+        if all(columns is None or set(columns) <= set(data[sheet].columns) for sheet, columns in sheets.items()):
+            return {sheet: data[sheet] if columns is None else data[sheet][columns] for sheet, columns in sheets.items()}
+
+    # Parse the workbook once
+    data = read_sheets(io.BytesIO(storage.read(key)), sheets)
+    data = {sheet: _arrow_safe(temp) for sheet, temp in data.items()}
+
+    # Write sidecar of the version checked
+    os.makedirs(os.path.join(folder, etag), exist_ok = True)
+    for sheet in sheets:
+        path = os.path.join(folder, etag, f"{sheet}.parquet")
+        data[sheet].to_parquet(path + ".tmp", index = False)
+        os.replace(path + ".tmp", path)
+    return data
@@ -0,0 +1,87 @@
+'''
+Program   : Per-indicator cache for WHO GHO data
+Source    : WHO Global Health Indicators
+            https://www.who.int/data/gho/info/athena-api
+Dependency: SCL-SPH
+Repository: indicators_health_secondary_data
+            https://github.com/BID-DATA/indicators_health_secondary_data
+Objective : Keep the payload of each GHO code on disk to refresh only new or stale codes
+Notes     : One pickle per code plus a manifest.json with content hash, fetch time and rows
+            The manifest also keeps the hash of the content of each code in the published
+                dataset (publish), so codes fetched by a run whose export failed are still
+                pending in the next run (unpublished)
+            Default location: ~/.cache/indicators_health/gho (env variable `ghocache`)
+'''
+
+# Libraries
+#------------------------------------------------------------------------------
+import os
+import json
+import time
+import hashlib
+import pandas as pd
+
+# Cache
+#------------------------------------------------------------------------------
+class GHOCache:
+    '''Directory with one payload per GHO code and a manifest of hashes and fetch times.'''
+
+    default_path = os.path.expanduser("~/.cache/indicators_health/gho")
+
+    def __init__(self, path = None):
+        self.path     = path or os.environ.get("ghocache") or self.default_path
+        self.manifest = {}
+        os.makedirs(self.path, exist_ok = True)
+        if os.path.exists(self._manifest_path()):
+            with open(self._manifest_path()) as file:
+                self.manifest = json.load(file)
+
+    def __contains__(self, code):
+        return code in self.manifest and os.path.exists(self._payload_path(code))
+
+    def _manifest_path(self):
+        return os.path.join(self.path, "manifest.json")
+
+    def _payload_path(self, code):
+        return os.path.join(self.path, f"{code}.pkl")
+
+    @staticmethod
+    def content_hash(data):
+        '''SHA-256 of the payload serialized as CSV, independent of the row index.'''
+        return hashlib.sha256(data.to_csv(index = False).encode("utf-8")).hexdigest()
+
+    def stale(self, codes, max_age_days = 30):
+        '''Codes that are not cached or were fetched more than `max_age_days` ago.'''
+        limit = time.time() - max_age_days * 86400
+        return [code for code in codes if code not in self or self.manifest[code]["fetched"] < limit]
+
+    def get(self, code):
+        return pd.read_pickle(self._payload_path(code))
+
+    def put(self, code, data):
+        '''
+        Store the payload of `code` and refresh its fetch time.
+        Returns True if the content is new or changed since the last fetch.
+        '''
+        hash_   = self.content_hash(data)
+        changed = code not in self or self.manifest[code]["hash"] != hash_
+        if changed:
+            data.to_pickle(self._payload_path(code))
+        self.manifest[code] = {**self.manifest.get(code, {}), "hash": hash_, "fetched": time.time(), "rows": int(data.shape[0])}
+        return changed
+
+    def unpublished(self, codes):
+        '''Cached codes whose content is not the content of the published dataset.'''
+        return [code for code in codes if code in self and self.manifest[code].get("published") != self.manifest[code]["hash"]]
+
+    def publish(self, codes):
+        '''Record the cached content of `codes` as exported (call after the export succeeds).'''
+        for code in codes:
+            self.manifest[code]["published"] = self.manifest[code]["hash"]
+
+    def save(self):
+        '''Write the manifest atomically.'''
+        temp = self._manifest_path() + ".tmp"
+        with open(temp, "w") as file:
+            json.dump(self.manifest, file, indent = 1, sort_keys = True)
+        os.replace(temp, self._manifest_path())
@@ -0,0 +1,154 @@
+'''
+Program   : Catalogue and search index of WHO GHO codes
+Source    : WHO Global Health Indicators
+            https://www.who.int/data/gho/info/athena-api
+Dependency: SCL-SPH
+Repository: indicators_health_secondary_data
+            https://github.com/BID-DATA/indicators_health_secondary_data
+Objective : Keep the list of GHO codes on disk with a text index, to search indicators and
+            find the name (Display) of a code without calling the API
+Notes     : One pickle with the codes, their names, the inverted index {word: codes} and
+                the fetch time; the list is fetched again when older than `max_age_days`
+            Words are the lower-case letters/digits of the code and of its name,
+                e.g. UHC_INDEX_REPORTED -> uhc, index, reported
+            A search returns the codes that have all the words of the query
+                (the last word can be the start of a word, e.g. "vacc")
+            Default location: ~/.cache/indicators_health/gho-catalogue.pkl (env variable `ghocatalogue`)
+            Usage:
+                python source/gho_catalogue.py UHC
+                python source/gho_catalogue.py hospital beds [--refresh]
+'''
+
+# Libraries
+#------------------------------------------------------------------------------
+import os
+import re
+import sys
+import time
+import bisect
+import pickle
+import argparse
+
+# Catalogue version: catalogues of another version are fetched again
+VERSION = 1
+WORD    = re.compile(r"[a-z0-9]+")
+
+def catalogue_path():
+    return os.environ.get("ghocatalogue") or os.path.expanduser("~/.cache/indicators_health/gho-catalogue.pkl")
+
+def words(text):
+    '''Lower-case words of `text`.'''
+    return WORD.findall(str(text).lower())
+
+# Catalogue
+#------------------------------------------------------------------------------
+class Catalogue:
+    '''GHO codes with their names and an inverted index of their words.'''
+
+    def __init__(self, display, fetched = None):
+        self.display    = display
+        self.fetched    = fetched or time.time()
+        self.index      = {}
+        for code, name in display.items():
+            for word in set(words(code) + words(name)):
+                self.index.setdefault(word, []).append(code)
+        self.vocabulary = sorted(self.index)
+
+    def __contains__(self, code):
+        return code in self.display
+
+    def __len__(self):
+        return len(self.display)
+
+    @classmethod
+    def from_codes(cls, codes):
+        '''Catalogue of `codes`, the output of GHOSession().get_data_codes(format = "dataframe").'''
+        # Note: the code column is `@Label` or `Label` depending on the GHOclient version
+        label = "@Label" if "@Label" in codes.columns else "Label"
+        codes = codes.dropna(subset = [label])
+        return cls(dict(zip(codes[label].astype(str), codes.Display.fillna("").astype(str))))
+
+    def name(self, code):
+        '''Name (Display) of `code`, KeyError if the code is not in the catalogue.'''
+        return self.display[code]
+
+    def _matches(self, word, prefix = False):
+        if not prefix:
+            return set(self.index.get(word, []))
+        output = set()
+        for item in self.vocabulary[bisect.bisect_left(self.vocabulary, word):]:
+            if not item.startswith(word):
+                break
+            output.update(self.index[item])
+        return output
+
+    def search(self, query):
+        '''[{"code", "display"}] of the codes with all the words of `query`, sorted by code.'''
+        query  = words(query)
+        if len(query) == 0:
+            return []
+        codes  = self._matches(query[-1], prefix = True)
+        for word in query[:-1]:
+            codes &= self._matches(word)
+        return [{"code": code, "display": self.display[code]} for code in sorted(codes)]
+
+    def age_days(self):
+        return (time.time() - self.fetched) / 86400
+
+    def save(self, path = None):
+        '''Write the catalogue atomically.'''
+        path = path or catalogue_path()
+        os.makedirs(os.path.dirname(path), exist_ok = True)
+        with open(path + ".tmp", "wb") as file:
+            pickle.dump({"version": VERSION, "fetched": self.fetched, "display": self.display,
+                         "index": self.index, "vocabulary": self.vocabulary}, file, protocol = pickle.HIGHEST_PROTOCOL)
+        os.replace(path + ".tmp", path)
+
+    @classmethod
+    def read(cls, path = None):
+        '''Catalogue saved in `path`, None if there is none (or of another version).'''
+        try:
+            with open(path or catalogue_path(), "rb") as file:
+                saved = pickle.load(file)
+        except (OSError, EOFError, pickle.UnpicklingError):
+            return None
+        if saved.get("version") != VERSION:
+            return None
+        # Note: the index is read as saved, not built again
+        catalogue            = cls.__new__(cls)
+        catalogue.display    = saved["display"]
+        catalogue.fetched    = saved["fetched"]
+        catalogue.index      = saved["index"]
+        catalogue.vocabulary = saved["vocabulary"]
+        return catalogue
+
+def load_catalogue(get_codes = None, max_age_days = 30, refresh = False, path = None):
+    '''
+    Catalogue saved on disk, fetched again with `get_codes()` if it is missing, older than
+    `max_age_days` or `refresh` is True (default: GHOSession().get_data_codes).
+    '''
+    catalogue = None if refresh else Catalogue.read(path)
+    if catalogue is not None and catalogue.age_days() <= max_age_days:
+        return catalogue
+    if get_codes is None:
+        from ghoclient import GHOSession
+        get_codes = GHOSession().get_data_codes
+    catalogue = Catalogue.from_codes(get_codes(format = "dataframe"))
+    catalogue.save(path)
+    return catalogue
+
+# Find indicator
+#------------------------------------------------------------------------------
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description = "Find GHO indicators by word")
+    parser.add_argument("query"  , nargs = "+", help = "words of the code or name, e.g. UHC or hospital beds")
+    parser.add_argument("--refresh", action = "store_true", help = "fetch the list of codes again")
+    parser.add_argument("--max-age", type = float, default = 30, help = "days before the list of codes is fetched again")
+    args   = parser.parse_args()
+
+    catalogue = load_catalogue(max_age_days = args.max_age, refresh = args.refresh)
+    results   = catalogue.search(" ".join(args.query))
+    for item in results:
+        print(f"{item['code']:<40}{item['display']}")
+    print(f"{len(results)} of {len(catalogue)} codes")
+    sys.exit(0 if results else 1)
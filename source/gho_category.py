@@ -0,0 +1,57 @@
+'''
+Program   : Disaggregation categories for WHO GHO data
+Source    : WHO Global Health Indicators
+            https://www.who.int/data/gho/info/athena-api
+Dependency: SCL-SPH
+Repository: indicators_health_secondary_data
+            https://github.com/BID-DATA/indicators_health_secondary_data
+Objective : Encode and recode the CATEGORY variable without row-level string operations
+Notes     : encode joins the non-missing values of SEX, AGEGROUP, ... with "-"
+                e.g. SEX = BTSX and AGEGROUP = YEARS18-PLUS gives BTSX-YEARS18-PLUS
+                rows without any category get "", empty values count as missing
+            Columns are combined as integer codes; strings are built once per distinct
+                combination, never per row
+            recode maps the categories of a categorical (e.g. CATEGORY -> sex) through
+                a lookup table over its codes
+'''
+
+# Libraries
+#------------------------------------------------------------------------------
+import numpy as np
+import pandas as pd
+
+# Functions
+#------------------------------------------------------------------------------
+def encode(data, columns, sep = "-"):
+    '''Categorical with the non-missing values of `columns` joined by `sep`.'''
+    key    = np.zeros(len(data), dtype = np.int64)
+    combos = [()]
+    for name in columns:
+        codes, uniques = pd.factorize(data[name], use_na_sentinel = True)
+        # Note: empty values are missing, so they add no "-" to the category
+        labels = [None] + [str(value) or None for value in uniques]
+
+        # Combine with previous columns, keeping the key compact
+        key, combined = pd.factorize(key * len(labels) + (codes + 1))
+        combos = [combos[k // len(labels)] + (labels[k % len(labels)],) for k in combined]
+
+    # One string per distinct combination
+    strings           = [sep.join(value for value in combo if value is not None) for combo in combos]
+    remap, categories = pd.factorize(np.array(strings, dtype = object))
+    return pd.Categorical.from_codes(remap[key], categories = categories)
+
+def recode(values, mapping, missing = None):
+    '''
+    Categorical of `values` mapped through `mapping` ({category: new category}).
+    Categories not in `mapping` become missing; missing values become `missing`.
+    '''
+    values = pd.Series(values)
+    if not isinstance(values.dtype, pd.CategoricalDtype):
+        values = values.astype("category")
+
+    # Lookup table over the codes, the last position is for missing values
+    labels         = list(values.cat.categories) + [np.nan]
+    targets        = [mapping.get(label, None) for label in labels[:-1]] + [missing]
+    lookup, output = pd.factorize(np.array(targets, dtype = object), use_na_sentinel = True)
+    codes          = values.cat.codes.to_numpy()
+    return pd.Categorical.from_codes(lookup[np.where(codes >= 0, codes, len(labels) - 1)], categories = output)
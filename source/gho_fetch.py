@@ -0,0 +1,67 @@
+'''
+Program   : Fetch engine for WHO GHO indicators
+Source    : WHO Global Health Indicators
+            https://www.who.int/data/gho/info/athena-api
+Dependency: SCL-SPH
+Repository: indicators_health_secondary_data
+            https://github.com/BID-DATA/indicators_health_secondary_data
+Objective : Fetch a list of GHO codes concurrently
+Notes     : Duplicated codes are fetched only once
+            Each code is retried with exponential backoff before it is reported as failed
+            The fetch function is an argument, e.g. GHOSession().fetch_data_from_codes
+            For tests, point the session to a local server that mimics the GHO API
+'''
+
+# Libraries
+#------------------------------------------------------------------------------
+import time
+import random
+from concurrent.futures import ThreadPoolExecutor
+
+# Functions
+#------------------------------------------------------------------------------
+def unique_codes(codes):
+    '''Remove duplicated codes keeping the order of first appearance.'''
+    return list(dict.fromkeys(codes))
+
+def fetch_with_retry(fetch, code, retries = 3, backoff = 1.0, max_backoff = 30.0):
+    '''
+    Call `fetch(code = code)` and retry on any exception.
+    Waits backoff * 2**attempt seconds (with jitter) between attempts.
+    Raises the last exception if all attempts fail.
+    '''
+    for attempt in range(retries + 1):
+        try:
+            return fetch(code = code)
+        except Exception:
+            if attempt == retries:
+                raise
+            wait = min(max_backoff, backoff * 2 ** attempt)
+            time.sleep(wait * random.uniform(0.5, 1.0))
+
+def fetch_codes(fetch, codes, max_workers = 8, retries = 3, backoff = 1.0):
+    '''
+    Fetch all `codes` concurrently with a bounded pool of threads.
+    Returns (data, failed):
+        data  : dict {code: DataFrame} in the order of `codes`
+        failed: dict {code: "ExceptionName: message"} for codes that failed after all retries
+    '''
+    codes  = unique_codes(codes)
+    data   = {}
+    failed = {}
+    if not codes:
+        return data, failed
+
+    # Submit requests
+    workers = max(1, min(max_workers, len(codes)))
+    with ThreadPoolExecutor(max_workers = workers) as pool:
+        futures = {code: pool.submit(fetch_with_retry, fetch, code, retries, backoff) for code in codes}
+
+    # Collect results in input order
+    for code, future in futures.items():
+        try:
+            data[code] = future.result()
+        except Exception as error:
+            failed[code] = f"{type(error).__name__}: {error}"
+
+    return data, failed
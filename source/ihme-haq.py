@@ -14,78 +14,124 @@ Objective : Proprocess indicators of interest
 Notes     : Download data manually
                 Only upload the most recent year
                 Check for recent data at least once a year
-                Update code to read all available datasets in the collection
-                Update code to merge all available datasets per source
+                All vintages in raw/ (haq_{start}_{end}_scaled.csv) are read, the newest
+                    vintage wins for each location, indicator and year (vintages.py)
             Upload it to the Social Data Lake 
                 https://scldata.iadb.org/app?locale=es
                 International Organizations/Institute for Health Metrics and Evaluation (IHME)
             Rerun notebook
 '''
 
-# Libraries
+# Stage
 #------------------------------------------------------------------------------
-import os
-import boto3
-import dotenv
-import numpy as np
-import pandas as pd
+def main():
+    '''Preprocess the IHME HAQ extracts and export haq.'''
+    # Note: pandas, numpy and the helper modules are imported when the stage runs,
+    #       so the script can be imported without loading them (see pipeline.py)
+    import numpy as np
+    from changes import publish_changes
+    from ihme_ingest import concat, read_file
+    from ihme_locations import load_crosswalk
+    from keys import load_keys
+    from metrics import Run
+    from outputs import export
+    from quality import Coverage, NotNull, Range, Unique, gate
+    from storage import get_storage
+    from subset import get_subset
+    from vintages import discover, newest, read_all
 
-# Working environments
-#------------------------------------------------------------------------------
-dotenv.load_dotenv("/home/ec2-user/SageMaker/.env")
-sclbucket   = os.environ.get("sclbucket")
-scldatalake = os.environ.get("scldatalake")
+    # Working environments
+    #--------------------------------------------------------------------------
+    # Note: S3 bucket `sclbucket` or local directory `sclstorage` (see storage.py),
+    #       the S3 client is created on first use
+    storage_ = get_storage()
 
-# Resources and buckets
-#------------------------------------------------------------------------------
-s3        = boto3.client('s3')
-s3_       = boto3.resource("s3")
-s3_bucket = s3_.Bucket(sclbucket)
+    # Run metrics
+    #--------------------------------------------------------------------------
+    # Note: time, memory, rows and bytes of each step are saved as JSON (see metrics.py)
+    run_ = Run("ihme-haq")
 
-# Country keys 
-#------------------------------------------------------------------------------
-# Path 
-path = "Geospatial Basemaps/Cartographic Boundary Files/keys"
+    # Subset run
+    # Note: countries, indicators and years of the env variables (see subset.py),
+    #       all of them if not set
+    subset_ = get_subset()
 
-# IADB 26-LAC countries
-iadb       = pd.read_csv(f"s3://{sclbucket}/{path}/iadb-keys.csv")
-codes_iadb = iadb.isoalpha3.unique().tolist()
+    # Country keys 
+    #--------------------------------------------------------------------------
+    # Note: keys are downloaded only when they change in S3
+    run_.step("load keys")
+    keys_ = load_keys(storage_)
 
-# OECD countries
-oecd       = pd.read_csv(f"s3://{sclbucket}/{path}/oecd-keys.csv") 
-codes_oecd = oecd.isoalpha3.unique().tolist()
+    # IADB 26-LAC countries
+    iadb       = keys_.iadb
+    codes_iadb = keys_.codes_iadb
 
-# World countries
-world = pd.read_csv(f"s3://{sclbucket}/{path}/world-keys.csv") 
-world = world.rename(columns = {"isoalpha3":"code","country_name_en":"location_name"})
-world = world.drop(columns = "income_group")
+    # OECD countries
+    oecd       = keys_.oecd
+    codes_oecd = keys_.codes_oecd
 
-# Import data and dictionary
-#------------------------------------------------------------------------------
-path     = "International Organizations/Institute for Health Metrics and Evaluation (IHME)"
-path    += "/Healthcare Access and Quality (HAQ) index/raw"
-ihme_haq = pd.read_csv(f"s3://{sclbucket}/{path}/haq_1990_2016_scaled.csv")
+    # IHME locations
+    # Note: location_id to isoalpha3 crosswalk and membership flags (see ihme_locations.py)
+    crosswalk_ = load_crosswalk(storage_)
 
-# Preprocessing
-#------------------------------------------------------------------------------
-# Keep only country-level data
-ihme_haq = ihme_haq[np.where(ihme_haq.ihme_loc_id.isin(world.code),1,0) == 1]
-
-# Keep variables of interest
-vars_    = ["location_id","indicator_id","measure","lower","upper"]
-vars_   += ["parent_location","sdi_quintile","super_region_name","region_name"]
-ihme_haq = ihme_haq.drop(columns = vars_)
-
-# Rename variables
-ihme_haq = ihme_haq.rename(columns = {"ihme_loc_id":"code","year_id":"year"})
-
-# Define regions 
-ihme_haq["IADB"]   = np.where(ihme_haq.code.isin(codes_iadb),1,0)
-ihme_haq["OECD"]   = np.where(ihme_haq.code.isin(codes_oecd),1,0)
-ihme_haq["Global"] = 1
-
-# Export data 
-path     = "International Organizations/Institute for Health Metrics and Evaluation (IHME)"
-path    += "/Healthcare Access and Quality (HAQ) index/processed"
-ihme_haq.to_csv(f"s3://{sclbucket}/{path}/haq.csv", index = False)
+    # Import data and dictionary
+    #--------------------------------------------------------------------------
+    run_.step("import")
+    path     = "International Organizations/Institute for Health Metrics and Evaluation (IHME)"
+    path    += "/Healthcare Access and Quality (HAQ) index/raw"
+
+    # Read all vintages concurrently
+    # Note: a new vintage only needs to be uploaded, e.g. haq_1990_2019_scaled.csv
+    files_   = discover(storage_, f"{path}/", r"haq_(?P<vintage>\d{4}_\d{4})_scaled\.csv")
+    # Note: only the columns of interest and the locations of the world keys are read,
+    #       chunk by chunk (see ihme_ingest.py); in a subset run only the indicators and
+    #       years of the subset, and all countries to compute the benchmarks (see subset.py)
+    dtypes_  = {"location_id":np.int32,"location_name":"category","indicator_id":np.int64,"indicator_name":"category",
+                "year_id":np.int64,"val":np.float64}
+    where_   = (lambda chunk: subset_.mask(chunk, indicator = "indicator_name", year = "year_id")) if subset_.active else None
+    read_    = lambda key: read_file(storage_.url(key), crosswalk_.locations("World"), dtypes_, where = where_)
+    ihme_haq = read_all(read_, [key for _, key in files_])
+    ihme_haq = newest(ihme_haq, [vintage for vintage, _ in files_], on = ["location_id","indicator_id","year_id"], concat = concat)
+    run_.rows(ihme_haq)
+
+    # Preprocessing
+    #--------------------------------------------------------------------------
+    # Add world codes
+    # Note: integer lookups of location_id in the crosswalk
+    run_.step("filter", rows_in = ihme_haq)
+    ihme_haq["code"] = np.asarray(crosswalk_.codes(ihme_haq.location_id), dtype = object)
+
+    # Define regions 
+    ihme_haq["IADB"]   = crosswalk_.member(ihme_haq.location_id, "IADB").astype(int)
+    ihme_haq["OECD"]   = crosswalk_.member(ihme_haq.location_id, "OECD").astype(int)
+    ihme_haq["Global"] = 1
+
+    # Keep variables of interest
+    # Note: other columns of the extract are not read
+    ihme_haq = ihme_haq.drop(columns = ["location_id","indicator_id"])
+
+    # Rename variables
+    ihme_haq = ihme_haq.rename(columns = {"year_id":"year"})
+    run_.rows(ihme_haq)
+
+    # Quality gate
+    # Note: the export is blocked if a rule with severity error fails (see quality.py)
+    run_.step("validate", rows_in = ihme_haq)
+    rules_ = [NotNull(["code","year"]), Unique(["code","indicator_name","year"]), Range("val", 0, 100)]
+    rules_ += [Coverage("code", "year", subset_.within(codes_iadb), by = ["indicator_name"])]
+    gate(ihme_haq, rules_, "ihme-haq")
+
+    # Export data 
+    run_.step("export", rows_in = ihme_haq)
+    path     = "International Organizations/Institute for Health Metrics and Evaluation (IHME)"
+    path    += "/Healthcare Access and Quality (HAQ) index/processed"
+    export(ihme_haq, storage_.url(path), "haq", indicator = "indicator_name", year = "year")
+
+    # Delta since the last run
+    # Note: rows inserted, updated and deleted, by key (see changes.py)
+    publish_changes(ihme_haq, storage_, path, "haq", keys = ["code","indicator_name","year"])
+    run_.finish()
+
+if __name__ == "__main__":
+    main()
 #------------------------------------------------------------------------------
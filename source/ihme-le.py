@@ -13,120 +13,140 @@ Objective : Proprocess indicators of interest
 Notes     : Download data manually
                 Only upload the most recent year
                 Check for recent data at least once a year
-                Update code to read all available datasets in the collection
-                Update code to merge all available datasets per source
+                All releases and parts in raw/ (ihme-gbd-{le|hale}[-{release}]-{part}.csv)
+                    are read, the newest release wins for each location, measure, sex,
+                    age and year (vintages.py)
             Upload it to the Social Data Lake 
                 https://scldata.iadb.org/app?locale=es
                 International Organizations/Institute for Health Metrics and Evaluation (IHME)
             Rerun notebook
 '''
 
-# Libraries
+# Stage
 #------------------------------------------------------------------------------
-import os
-import boto3
-import dotenv
-import numpy as np
-import pandas as pd
-
-# Working environments
-#------------------------------------------------------------------------------
-dotenv.load_dotenv("/home/ec2-user/SageMaker/.env")
-sclbucket   = os.environ.get("sclbucket")
-scldatalake = os.environ.get("scldatalake")
-
-# Resources and buckets
-#------------------------------------------------------------------------------
-s3        = boto3.client('s3')
-s3_       = boto3.resource("s3")
-s3_bucket = s3_.Bucket(sclbucket)
-
-# Country keys 
-#------------------------------------------------------------------------------
-# Path 
-path = "Geospatial Basemaps/Cartographic Boundary Files/keys"
-
-# IADB 26-LAC countries
-iadb       = pd.read_csv(f"s3://{sclbucket}/{path}/iadb-keys.csv")
-codes_iadb = iadb.isoalpha3.unique().tolist()
-
-# OECD countries
-oecd       = pd.read_csv(f"s3://{sclbucket}/{path}/oecd-keys.csv") 
-codes_oecd = oecd.isoalpha3.unique().tolist()
-
-# World countries
-world = pd.read_csv(f"s3://{sclbucket}/{path}/world-keys.csv") 
-world = world.rename(columns = {"isoalpha3":"code","country_name_en":"location_name"})
-world = world.drop(columns = "income_group")
-
-# Import data and dictionary
-#------------------------------------------------------------------------------
-path      = "International Organizations/Institute for Health Metrics and Evaluation (IHME)/"
-path     += "Global Burden of Disease (GBD)"
-
-ihme_le   = pd.concat([pd.read_csv(f"s3://{sclbucket}/{path}/raw/ihme-gbd-le-{i}.csv")     for i in [1,2,3]])
-ihme_hale = pd.concat([pd.read_csv(f"s3://{sclbucket}/{path}/raw/ihme-gbd-hale-{i}.csv") for i in [1,2,3]])
-ihme_le   = pd.concat([ihme_le, ihme_hale])
-ihme_dict = pd.read_csv(f"s3://{sclbucket}/{path}/codebook/ihme-location-2019.csv")
-
-# Preprocessing
-#------------------------------------------------------------------------------
-# Keep only country-level data
-ihme_le = ihme_le.merge(ihme_dict[["location_id","level"]], on = "location_id", how = "left")
-ihme_le = ihme_le[ihme_le.level == 3]
-
-# Drop columns
-vars_   = ["measure_id","location_id","sex_id","age_id","metric_id","metric_name","upper","lower","level"]
-ihme_le = ihme_le.drop(columns = vars_)
-
-# Add world codes
-ihme_le = ihme_le.merge(world, on = "location_name", how = "left")
-
-# Rename measure
-label_ = {"Life expectancy":"Life expectancy at birth","HALE (Healthy life expectancy)":"Healthy Life Expectancy at birth"}
-ihme_le.measure_name = ihme_le.measure_name.replace(label_)
-
-# Define regions 
-ihme_le["IADB"]   = np.where(ihme_le.code.isin(codes_iadb),1,0)
-ihme_le["OECD"]   = np.where(ihme_le.code.isin(codes_oecd),1,0)
-ihme_le["Global"] = 1
-
-# Create group values
-group_ = []
-for group in ["IADB","OECD","Global"]:
-    
-    # Collapse data
-    temp_ = ihme_le.copy()
-    temp_ = temp_.groupby(["measure_name","sex_name","age_name","year",group]).mean().reset_index()
-    temp_ = temp_[temp_[group] == 1]
-    temp_ = temp_.drop(columns = ["IADB","OECD","Global"])
+def main():
+    '''Preprocess the IHME GBD extracts and export ihme-gbd-le-hale.'''
+    # Note: pandas, numpy and the helper modules are imported when the stage runs,
+    #       so the script can be imported without loading them (see pipeline.py)
+    import numpy as np
+    import pandas as pd
+    from changes import publish_changes
+    from ihme_ingest import concat, read_file
+    from ihme_locations import load_crosswalk
+    from keys import load_keys
+    from metrics import Run
+    from outputs import export
+    from quality import Coverage, NotNull, Range, Unique, gate
+    from regions import aggregate
+    from storage import get_storage
+    from subset import get_subset
+    from vintages import discover, newest, read_all
+
+    # Working environments
+    #--------------------------------------------------------------------------
+    # Note: S3 bucket `sclbucket` or local directory `sclstorage` (see storage.py),
+    #       the S3 client is created on first use
+    storage_ = get_storage()
+
+    # Run metrics
+    #--------------------------------------------------------------------------
+    # Note: time, memory, rows and bytes of each step are saved as JSON (see metrics.py)
+    run_ = Run("ihme-le")
+
+    # Subset run
+    # Note: countries, indicators and years of the env variables (see subset.py),
+    #       all of them if not set
+    subset_ = get_subset()
+
+    # Country keys 
+    #--------------------------------------------------------------------------
+    # Note: keys are downloaded only when they change in S3
+    run_.step("load keys")
+    keys_ = load_keys(storage_)
+
+    # IADB 26-LAC countries
+    iadb       = keys_.iadb
+    codes_iadb = keys_.codes_iadb
+
+    # OECD countries
+    oecd       = keys_.oecd
+    codes_oecd = keys_.codes_oecd
+
+    # IHME locations
+    # Note: location_id to isoalpha3 crosswalk, built once per version of the codebook
+    #       and the keys (see ihme_locations.py)
+    crosswalk_ = load_crosswalk(storage_)
+
+    # Import data and dictionary
+    #--------------------------------------------------------------------------
+    run_.step("import")
+    path      = "International Organizations/Institute for Health Metrics and Evaluation (IHME)/"
+    path     += "Global Burden of Disease (GBD)"
+
+    # Read only country-level data and variables of interest
+    # Note: all releases and parts are read concurrently and filtered chunk by chunk,
+    #       files without release are older than any named release
+    files_    = discover(storage_, f"{path}/raw/", r"ihme-gbd-(le|hale)(-(?P<vintage>\d{4}))?-\d+\.csv")
+    # Note: only locations of the world keys, as in ihme-haq.py (locations without a match
+    #       in the crosswalk are reported by ihme_locations.py and dropped); in a subset run
+    #       only the measures and years of the subset are kept, and all countries to
+    #       compute the regions (see subset.py)
+    label_    = {"Life expectancy":"Life expectancy at birth","HALE (Healthy life expectancy)":"Healthy Life Expectancy at birth"}
+    measures_ = [name for name, label in label_.items() if subset_.wants(label)]
+    location_ = crosswalk_.locations("World")
+    where_    = (lambda chunk: subset_.mask(chunk, year = "year") & chunk.measure_name.isin(measures_).to_numpy(dtype = bool)) if subset_.active else None
+    ihme_le   = read_all(lambda key: read_file(storage_.url(key), location_, where = where_), [key for _, key in files_])
+    ihme_le   = newest(ihme_le, [vintage for vintage, _ in files_], on = ["location_id","measure_name","sex_name","age_name","year"], concat = concat)
+    run_.rows(ihme_le)
+
+    # Preprocessing
+    #--------------------------------------------------------------------------
+    # Add world codes
+    # Note: integer lookup of location_id in the crosswalk
+    run_.step("reshape", rows_in = ihme_le)
+    ihme_le["code"] = crosswalk_.codes(ihme_le.location_id)
+    ihme_le = ihme_le.drop(columns = "location_id")
+
+    # Rename measure
+    ihme_le.measure_name = ihme_le.measure_name.cat.rename_categories(lambda name: label_.get(name, name))
+
+    # Define regions 
+    regions_ = {"IADB":codes_iadb, "OECD":codes_oecd, "Global":None}
+
+    # Create group values
+    # Note: all regions are computed in one pass
+    run_.step("aggregate", rows_in = ihme_le)
+    group_ = aggregate(ihme_le, ["measure_name","sex_name","age_name","year"], ["val"], regions_, how = "mean")
 
     # Add lables
-    temp_["location_name"] = group
-    temp_["code"]          = group
-    
-    # Append to list of groups
-    group_.append(temp_)
-
-# Append to dataset
-ihme_le = pd.concat([ihme_le] + group_)
-
-# Drop columns 
-ihme_le = ihme_le.drop(columns = ["IADB","OECD","Global"])
-
-# Export data 
-ihme_le.to_csv(f"s3://{sclbucket}/{path}/processed/ihme-gbd-le-hale.csv", index = False)
+    group_["location_name"] = group_.region
+    group_["code"]          = group_.region
+    group_                  = group_.drop(columns = "region")
+
+    # Append to dataset
+    ihme_le = pd.concat([ihme_le, group_])
+
+    # Keep rows of the subset
+    # Note: region rows are always kept, they are the benchmarks of scl-profiles.py
+    ihme_le = subset_.apply(ihme_le, country = "code", indicator = "measure_name", year = "year", countries = subset_.output_countries(keys_))
+    run_.rows(ihme_le)
+
+    # Quality gate
+    # Note: the export is blocked if a rule with severity error fails (see quality.py)
+    run_.step("validate", rows_in = ihme_le)
+    rules_  = [NotNull(["code","year"]), Unique(["code","measure_name","sex_name","age_name","year"])]
+    rules_ += [Range("val", 0, 120), Coverage("code", "year", subset_.within(codes_iadb), by = ["measure_name"])]
+    gate(ihme_le, rules_, "ihme-le")
+
+    # Export data 
+    run_.step("export", rows_in = ihme_le)
+    export(ihme_le, storage_.url(f"{path}/processed"), "ihme-gbd-le-hale", indicator = "measure_name", year = "year")
+
+    # Delta since the last run
+    # Note: rows inserted, updated and deleted, by key (see changes.py)
+    publish_changes(ihme_le, storage_, f"{path}/processed", "ihme-gbd-le-hale", keys = ["code","measure_name","sex_name","age_name","year"])
+    run_.finish()
+
+if __name__ == "__main__":
+    main()
 #------------------------------------------------------------------------------
-
-
-
-
-
-
-
-
-
-
-
-
-
@@ -0,0 +1,58 @@
+'''
+Program   : Streaming ingest of IHME GBD extracts
+Source    : IHME GBD Results
+            https://vizhub.healthdata.org/gbd-results/
+Dependency: SCL-SPH
+Repository: indicators_health_secondary_data
+            https://github.com/BID-DATA/indicators_health_secondary_data
+Objective : Read GBD extracts in chunks, keeping only country-level rows
+Notes     : Only the columns of interest are read, with compact dtypes
+                (categoricals for names, int16 for year)
+            val stays float64: float32 would change the exported values (e.g. 71.234
+                becomes 71.23400115966797 once joined with float64 region means)
+            Each chunk is filtered to country-level locations as it arrives, so
+                memory depends on the output size and not on the size of the extract
+'''
+
+# Libraries
+#------------------------------------------------------------------------------
+import numpy as np
+import pandas as pd
+from pandas.api.types import union_categoricals
+
+# Columns and dtypes
+#------------------------------------------------------------------------------
+DTYPES = {"measure_name" : "category",
+          "location_id"  : np.int32,
+          "location_name": "category",
+          "sex_name"     : "category",
+          "age_name"     : "category",
+          "year"         : np.int16,
+          "val"          : np.float64}
+
+# Functions
+#------------------------------------------------------------------------------
+def concat(frames):
+    '''Concatenate frames keeping categorical columns as categoricals.'''
+    frames = [frame for frame in frames if frame.shape[0] > 0] or frames[:1]
+    data   = pd.concat(frames, ignore_index = True)
+    for name, dtype in frames[0].dtypes.items():
+        if isinstance(dtype, pd.CategoricalDtype) and not isinstance(data[name].dtype, pd.CategoricalDtype):
+            data[name] = union_categoricals([frame[name] for frame in frames])
+    return data
+
+def read_file(path, locations, dtypes = DTYPES, chunksize = 250_000, where = None):
+    '''
+    Rows of `path` whose location_id is in `locations`, read in chunks.
+    `where(chunk)` is an optional boolean array of other rows to keep (e.g. years).
+    '''
+    locations = pd.Index(locations).unique()
+    chunks    = []
+    reader    = pd.read_csv(path, usecols = lambda name: name in dtypes, dtype = dtypes, chunksize = chunksize)
+    with reader:
+        for chunk in reader:
+            keep = locations.get_indexer(chunk.location_id) >= 0
+            if where is not None:
+                keep &= where(chunk)
+            chunks.append(chunk[keep])
+    return concat(chunks)
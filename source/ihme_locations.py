@@ -0,0 +1,133 @@
+'''
+Program   : IHME location crosswalk
+Source    : IHME GBD Results, location codebook (ihme-location-2019.csv)
+            Geospatial Basemaps/Cartographic Boundary Files/keys
+Dependency: SCL-SPH
+Repository: indicators_health_secondary_data
+            https://github.com/BID-DATA/indicators_health_secondary_data
+Objective : Map IHME location_id to isoalpha3 and IADB/OECD/World membership once,
+                so IHME joins and filters are integer lookups instead of name merges
+Notes     : One row per country-level location (level 3 of the codebook)
+            isoalpha3 is the ihme_loc_id of the location; locations whose ihme_loc_id is
+                not in the world keys are matched by English name (country_name_en)
+            Locations without a match are reported when the crosswalk is built
+            The crosswalk is versioned by a digest of VERSION, the codebook and the keys,
+                and kept in ~/.cache/indicators_health/ihme (env variable `ihmecache`)
+            Usage:
+                crosswalk = load_crosswalk(storage_)
+                data["code"] = crosswalk.codes(data.location_id)
+                data = data[crosswalk.member(data.location_id, "World")]
+'''
+
+# Libraries
+#------------------------------------------------------------------------------
+import os
+import hashlib
+import functools
+import numpy as np
+import pandas as pd
+from keys import fetch, load_keys, replace_file
+from storage import as_storage
+
+# Paths
+#------------------------------------------------------------------------------
+# Crosswalk version: crosswalks of another version are always built again
+VERSION  = 1
+CODEBOOK = "International Organizations/Institute for Health Metrics and Evaluation (IHME)/Global Burden of Disease (GBD)/codebook/ihme-location-2019.csv"
+REGIONS  = {"IADB": "iadb", "OECD": "oecd", "World": "world"}
+
+def cache_path():
+    return os.environ.get("ihmecache") or os.path.expanduser("~/.cache/indicators_health/ihme")
+
+# Build
+#------------------------------------------------------------------------------
+def build_crosswalk(codebook, keys):
+    '''
+    DataFrame indexed by location_id (sorted) with location_name, isoalpha3 and the
+    int8 flags iadb, oecd and world, for the country-level locations of `codebook`.
+    '''
+    countries = codebook[codebook.level == 3].sort_values("location_id")
+    code      = pd.Series(np.nan, index = countries.index, dtype = object)
+    if "ihme_loc_id" in countries:
+        code  = countries.ihme_loc_id.where(countries.ihme_loc_id.isin(keys.codes_world))
+
+    # Names of the world keys for locations without a valid ihme_loc_id
+    names     = keys.world.dropna(subset = ["isoalpha3"]).drop_duplicates("country_name_en")
+    names     = pd.Series(names.isoalpha3.to_numpy(), index = names.country_name_en.to_numpy())
+    code      = code.fillna(countries.location_name.map(names))
+
+    missing   = countries.location_name[code.isna()]
+    if len(missing):
+        print(f"[ihme_locations] {len(missing)} locations without isoalpha3: {', '.join(missing.astype(str)[:10])}")
+
+    output = pd.DataFrame({"location_name": countries.location_name.to_numpy(),
+                           "isoalpha3"    : pd.Categorical(code, dtype = keys.dtype)},
+                          index = pd.Index(countries.location_id.to_numpy(dtype = np.int32), name = "location_id"))
+    for region, column in REGIONS.items():
+        output[column] = keys.member(output.isoalpha3, region).astype(np.int8)
+    return output
+
+# Crosswalk
+#------------------------------------------------------------------------------
+class Crosswalk:
+    '''Lookups of IHME location_id: isoalpha3 and region membership.'''
+
+    def __init__(self, table, version = None):
+        self.table   = table
+        self.version = version
+        self.codes_  = table.isoalpha3.cat.codes.to_numpy()
+
+    def _positions(self, location_id):
+        '''Rows of the crosswalk of each `location_id` (-1 if not a country-level location).'''
+        return self.table.index.get_indexer(np.asarray(location_id, dtype = np.int32))
+
+    def codes(self, location_id):
+        '''Categorical isoalpha3 of each `location_id` (missing if not in the crosswalk).'''
+        positions = self._positions(location_id)
+        codes     = np.where(positions >= 0, self.codes_[positions], -1)
+        return pd.Categorical.from_codes(codes, dtype = self.table.isoalpha3.dtype)
+
+    def member(self, location_id, region):
+        '''Boolean array: `location_id` belongs to `region` (IADB, OECD or World).'''
+        flags     = self.table[REGIONS[region]].to_numpy(dtype = bool)
+        positions = self._positions(location_id)
+        return np.where(positions >= 0, flags[positions], False)
+
+    def locations(self, region = None):
+        '''location_id of the country-level locations, of `region` if given.'''
+        if region is None:
+            return self.table.index
+        return self.table.index[self.table[REGIONS[region]].to_numpy(dtype = bool)]
+
+def _digest(path, keys):
+    hash_ = hashlib.sha256(str(VERSION).encode())
+    with open(path, "rb") as file:
+        hash_.update(file.read())
+    for codes in [keys.codes_iadb, keys.codes_oecd, keys.codes_world]:
+        hash_.update(",".join(sorted(codes)).encode() + b"\n")
+    hash_.update(pd.util.hash_pandas_object(keys.world[["isoalpha3","country_name_en"]].astype(str), index = False).to_numpy().tobytes())
+    return hash_.hexdigest()[:16]
+
+@functools.lru_cache(maxsize = None)
+def load_crosswalk(storage = None, folder = None):
+    '''
+    Crosswalk of the codebook CODEBOOK of `storage` and the keys (keys.py), read from
+    the local copy of the same version or built and saved once.
+    Cached per process: later calls return the same object.
+    '''
+    storage = as_storage(storage)
+    folder  = folder or cache_path()
+    os.makedirs(folder, exist_ok = True)
+    keys    = load_keys(storage)
+
+    codebook = fetch(storage, CODEBOOK, folder)
+    version  = _digest(codebook, keys)
+    local    = os.path.join(folder, f"ihme-crosswalk-{version}.csv")
+    if os.path.exists(local):
+        table = pd.read_csv(local, index_col = "location_id", dtype = {"location_id": np.int32})
+        table["isoalpha3"] = pd.Categorical(table.isoalpha3, dtype = keys.dtype)
+        return Crosswalk(table, version)
+
+    table = build_crosswalk(pd.read_csv(codebook), keys)
+    replace_file(local, table.to_csv)
+    return Crosswalk(table, version)
@@ -0,0 +1,134 @@
+'''
+Program   : Country keys
+Source    : Social Data Lake
+            Geospatial Basemaps/Cartographic Boundary Files/keys
+Dependency: SCL-SPH
+Repository: indicators_health_secondary_data
+            https://github.com/BID-DATA/indicators_health_secondary_data
+Objective : Load IADB, OECD and world keys once and share ready-made membership structures
+Notes     : Keys are kept on disk and downloaded again only when the S3 ETag changes
+            The ETag is checked at most once per hour (`validate_after`, seconds)
+            Default location: ~/.cache/indicators_health/keys (env variable `keycache`)
+            Downloads and metadata are written to a unique temporary file and renamed, so
+                processes sharing the folder (pipeline.py) never read a partial file
+            Keys provide:
+                codes_iadb, codes_oecd, codes_world: frozensets of isoalpha3
+                dtype : categorical dtype with all world (and IADB/OECD) codes
+                matrix: country x region indicator matrix (IADB, OECD, Global)
+                member: vectorized membership test through categorical codes
+'''
+
+# Libraries
+#------------------------------------------------------------------------------
+import os
+import json
+import time
+import tempfile
+import functools
+import numpy as np
+import pandas as pd
+from storage import as_storage
+
+# Paths
+#------------------------------------------------------------------------------
+KEYS_PATH = "Geospatial Basemaps/Cartographic Boundary Files/keys"
+FILES     = {"iadb":"iadb-keys.csv", "oecd":"oecd-keys.csv", "world":"world-keys.csv"}
+
+def cache_path():
+    return os.environ.get("keycache") or os.path.expanduser("~/.cache/indicators_health/keys")
+
+# Download
+#------------------------------------------------------------------------------
+def replace_file(path, write):
+    '''
+    Write the file `path` with `write(temp)`, where temp is a unique file of the same
+    folder, and rename it to `path`; the temporary file is removed on failure.
+    '''
+    handle, temp = tempfile.mkstemp(dir = os.path.dirname(path) or ".", prefix = os.path.basename(path) + ".", suffix = ".tmp")
+    os.close(handle)
+    try:
+        write(temp)
+        os.replace(temp, path)
+    except BaseException:
+        if os.path.exists(temp):
+            os.remove(temp)
+        raise
+
+def _write_json(data):
+    def write(path):
+        with open(path, "w") as file:
+            json.dump(data, file)
+    return write
+
+def fetch(storage, key, folder, validate_after = 3600):
+    '''
+    Local path of `key` of `storage` (storage.py), downloading it only if the ETag changed.
+    Returns the path of the local copy.
+    '''
+    local = os.path.join(folder, os.path.basename(key))
+    meta  = local + ".json"
+    info  = {}
+    if os.path.exists(local) and os.path.exists(meta):
+        with open(meta) as file:
+            info = json.load(file)
+        if time.time() - info.get("validated", 0) < validate_after:
+            return local
+
+    etag = storage.etag(key)
+    if etag != info.get("etag") or not os.path.exists(local):
+        replace_file(local, lambda temp: storage.download(key, temp))
+
+    replace_file(meta, _write_json({"etag": etag, "validated": time.time()}))
+    return local
+
+# Keys
+#------------------------------------------------------------------------------
+class Keys:
+    '''Country keys and membership structures.'''
+
+    def __init__(self, iadb, oecd, world):
+        self.iadb  = iadb
+        self.oecd  = oecd
+        self.world = world
+
+        # Sets of codes
+        self.codes_iadb  = frozenset(iadb.isoalpha3.dropna())
+        self.codes_oecd  = frozenset(oecd.isoalpha3.dropna())
+        self.codes_world = frozenset(world.isoalpha3.dropna())
+
+        # Categorical dtype with all codes
+        codes      = sorted(self.codes_world | self.codes_iadb | self.codes_oecd)
+        self.dtype = pd.CategoricalDtype(codes)
+
+        # Country x region matrix
+        index       = pd.Index(codes, name = "isoalpha3")
+        self.matrix = pd.DataFrame({"IADB":   index.isin(self.codes_iadb),
+                                    "OECD":   index.isin(self.codes_oecd),
+                                    "Global": np.ones(len(index), dtype = bool)}, index = index).astype(np.int8)
+
+    def codes(self, values):
+        '''Categorical codes of `values` (-1 for codes not in the keys).'''
+        return pd.Categorical(values, dtype = self.dtype).codes
+
+    def member(self, values, region):
+        '''Boolean array: `values` belong to `region` (IADB, OECD, Global or World).'''
+        if region == "World":
+            mask = self.dtype.categories.isin(self.codes_world)
+        else:
+            mask = self.matrix[region].to_numpy(dtype = bool)
+        codes = self.codes(values)
+        return np.where(codes >= 0, mask[codes], False)
+
+@functools.lru_cache(maxsize = None)
+def load_keys(storage = None, folder = None):
+    '''
+    Keys from {KEYS_PATH} of `storage` (a storage, a bucket name or None for
+    get_storage()), read from the local copy when up to date.
+    Cached per process: later calls return the same object.
+    '''
+    storage = as_storage(storage)
+    folder  = folder or cache_path()
+    os.makedirs(folder, exist_ok = True)
+
+    files = {name: fetch(storage, f"{KEYS_PATH}/{file}", folder) for name, file in FILES.items()}
+    return Keys(**{name: pd.read_csv(path) for name, path in files.items()})
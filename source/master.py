@@ -0,0 +1,167 @@
+'''
+Program   : Schema of the master health dataset
+Source    : indicators_health (scl-indicators.py)
+Dependency: SCL-SPH
+Repository: indicators_health_secondary_data
+            https://github.com/BID-DATA/indicators_health_secondary_data
+Objective : Build the master dataset with categorical and compact numeric columns
+Notes     : Text columns (iddate, idgeo, isoalpha3, source, sex, age, indicator) are
+                categoricals: each label is stored once and rows keep a small integer code
+            year is int16, value stays float64 so exported values do not change
+            Recodes (e.g. indicator names, lower case, country/region) are lookup tables
+                over the categories, never row-level string operations
+            concat joins the sources by the union of their categories; pd.concat would turn
+                categoricals with different categories back into strings
+            from_ghed, from_le, from_haq and from_gho turn the processed output of each source
+                into rows of indicators_health (idgeo = country), so scl-indicators.py and
+                the benchmarks of scl-profiles.py share one reshape per source
+'''
+
+# Libraries
+#------------------------------------------------------------------------------
+import numpy as np
+import pandas as pd
+from pandas.api.types import union_categoricals
+from gho_category import recode
+
+# Columns and dtypes of indicators_health
+SCHEMA = {"iddate"   : "category",
+          "year"     : "int16",
+          "idgeo"    : "category",
+          "isoalpha3": "category",
+          "source"   : "category",
+          "sex"      : "category",
+          "age"      : "category",
+          "indicator": "category",
+          "value"    : "float64"}
+
+# WHO GHO indicators of indicators_health (lower case)
+GHO_CODES = ['mdg_0000000007','whs6_102','hwf_0001','wsh_sanitation_basic','ncd_bmi_25a','lbw_prevalence',
+             'whs4_543','uhc_index_reported','uhc_sci_rmnch','finprotection_cata_tot_10_pop']
+
+# Sex of the GHO categories
+# Note: categories without a label are dropped, missing/empty categories are totals
+GHO_SEX = {"":"Both","TOTL":"Both","BTSX":"Both","BTSX-YEARS18-PLUS":"Both","MLE":"Male","FMLE":"Female"}
+
+# Category of the total (sex Both) of each GHO indicator
+# Note: rows of other total categories are dropped; a code not listed keeps every total
+#       category, so two totals of a country and year fail the Unique rule of the quality
+#       gate instead of one being picked silently
+GHO_TOTAL = {"mdg_0000000007"               : "BTSX",
+             "whs6_102"                     : "",
+             "hwf_0001"                     : "",
+             "wsh_sanitation_basic"         : "TOTL",
+             "ncd_bmi_25a"                  : "BTSX-YEARS18-PLUS",
+             "lbw_prevalence"               : "",
+             "whs4_543"                     : "",
+             "uhc_index_reported"           : "",
+             "uhc_sci_rmnch"                : "",
+             "finprotection_cata_tot_10_pop": ""}
+
+# Functions
+#------------------------------------------------------------------------------
+def _categorical(values):
+    values = pd.Series(values)
+    if not isinstance(values.dtype, pd.CategoricalDtype):
+        values = values.astype("category")
+    return values.cat.rename_categories(values.cat.categories.astype(str))
+
+def constant(value, n):
+    '''Categorical of `n` rows equal to `value`.'''
+    return pd.Categorical.from_codes(np.zeros(n, dtype = np.int8), categories = [value])
+
+def relabel(values, mapping):
+    '''
+    Categorical of `values` with each category mapped through `mapping`, a dict
+    (categories not in it are kept) or a function, e.g. str.lower.
+    '''
+    values  = _categorical(values)
+    labels  = list(values.cat.categories)
+    targets = [mapping.get(label, label) for label in labels] if isinstance(mapping, dict) else [mapping(label) for label in labels]
+
+    # Lookup table over the codes: categories mapped to the same label are merged
+    lookup, output = pd.factorize(np.array(targets, dtype = object))
+    codes          = values.cat.codes.to_numpy()
+    return pd.Categorical.from_codes(np.where(codes >= 0, lookup[codes], -1), categories = output.astype(str))
+
+def geography(codes, regions):
+    '''Categorical idgeo: "region" for the codes in `regions`, "country" otherwise.'''
+    return relabel(codes, lambda code: "region" if code in regions else "country")
+
+def compact(data):
+    '''`data` with the columns and dtypes of SCHEMA; missing columns are empty.'''
+    output = {}
+    for name, dtype in SCHEMA.items():
+        if name not in data.columns:
+            output[name] = pd.Categorical.from_codes(np.full(len(data), -1, dtype = np.int8), categories = pd.Index([], dtype = str))
+        elif dtype == "category":
+            output[name] = _categorical(data[name]).array
+        else:
+            output[name] = data[name].to_numpy().astype(dtype)
+    return pd.DataFrame(output)
+
+def concat(frames):
+    '''Rows of all `frames` (see compact) with the union of their categories.'''
+    frames = [compact(data) for data in frames]
+    output = {}
+    for name, dtype in SCHEMA.items():
+        if dtype == "category":
+            output[name] = union_categoricals([data[name] for data in frames])
+        else:
+            output[name] = np.concatenate([data[name].to_numpy() for data in frames])
+    return pd.DataFrame(output)
+
+# Sources
+#------------------------------------------------------------------------------
+def from_ghed(who_ghed):
+    '''Rows of indicators_health of GHED_data_processed (who-ghed.py).'''
+    who_ghed = who_ghed.drop(columns = ["country","var_name"])
+    who_ghed = who_ghed.rename(columns = {"code":"isoalpha3","var_code":"indicator"})
+    who_ghed["iddate"] = constant("year", len(who_ghed))
+    who_ghed["source"] = constant("WHO GHED", len(who_ghed))
+    who_ghed["idgeo"]  = constant("country", len(who_ghed))
+    return who_ghed
+
+def from_le(ihme_le):
+    '''Rows of indicators_health of ihme-gbd-le-hale (ihme-le.py).'''
+    ihme_le = ihme_le.drop(columns = ["location_name"])
+    ihme_le = ihme_le.rename(columns = {"measure_name":"indicator","sex_name":"sex","age_name":"age","val":"value","code":"isoalpha3"})
+    ihme_le["iddate"] = constant("year", len(ihme_le))
+    ihme_le["source"] = constant("IHME GBD", len(ihme_le))
+    ihme_le["idgeo"]  = constant("country", len(ihme_le))
+    ihme_le.indicator = relabel(ihme_le.indicator, {'Life expectancy at birth':"lexp",'Healthy Life Expectancy at birth':'hale'})
+    return ihme_le
+
+def from_haq(ihme_haq):
+    '''Rows of indicators_health of the HAQ index of haq (ihme-haq.py).'''
+    ihme_haq = ihme_haq.drop(columns = ["location_name"])
+    ihme_haq = ihme_haq.rename(columns = {"code":"isoalpha3","indicator_name":"indicator","val":"value"})
+    ihme_haq = ihme_haq[ihme_haq.indicator == "Healthcare Access and Quality Index"].copy()
+    ihme_haq["iddate"] = constant("year", len(ihme_haq))
+    ihme_haq["source"] = constant("IHME HAQ", len(ihme_haq))
+    ihme_haq["idgeo"]  = constant("country", len(ihme_haq))
+    ihme_haq.indicator = constant("HAQ", len(ihme_haq))
+    return ihme_haq
+
+def from_gho(who_gho):
+    '''
+    Rows of indicators_health of the GHO_CODES of who-gho-api (who-gho.py), with the
+    columns GHO, YEAR, COUNTRY, CATEGORY and Numeric: the categories of GHO_SEX, and
+    for the total only the category of GHO_TOTAL of each indicator.
+    '''
+    who_gho = who_gho.copy()
+    who_gho.GHO = relabel(who_gho.GHO, str.lower)
+    who_gho = who_gho[who_gho.GHO.isin(GHO_CODES)]
+    who_gho["sex"] = recode(who_gho.CATEGORY, GHO_SEX, missing = "Both")
+    who_gho = who_gho[who_gho.sex.notna()]
+
+    # Keep the total category of each indicator
+    total_    = who_gho.GHO.astype(object).map(GHO_TOTAL)
+    category_ = who_gho.CATEGORY.astype(object).fillna("")
+    who_gho   = who_gho[(who_gho.sex != "Both") | total_.isna() | (category_ == total_)]
+    who_gho = who_gho[["GHO","YEAR","COUNTRY","sex","Numeric"]]
+    who_gho = who_gho.rename(columns = {"GHO":"indicator","YEAR":"year","COUNTRY":"isoalpha3","Numeric":"value"})
+    who_gho["iddate"] = constant("year", len(who_gho))
+    who_gho["source"] = constant("WHO GHO", len(who_gho))
+    who_gho["idgeo"]  = constant("country", len(who_gho))
+    return who_gho.drop_duplicates()
@@ -0,0 +1,183 @@
+'''
+Program   : Run metrics of the preprocessing scripts
+Source    : Multiple
+Dependency: SCL-SPH
+Repository: indicators_health_secondary_data
+            https://github.com/BID-DATA/indicators_health_secondary_data
+Objective : Record wall time, memory, rows and bytes of each step of a script
+Notes     : A step runs from `run_.step(name)` to the next step (or `run_.finish()`)
+            Each step records
+                wall_s            : wall time
+                rss_mb/peak_rss_mb: resident memory at the end of the step and peak of the process
+                                    (VmHWM, so not the peak of the parent process)
+                rows_in/rows_out  : rows given with step(name, rows_in) and rows(rows_out)
+                bytes_read/written: bytes read and written by the process (files and network)
+            One JSON per run in ~/.cache/indicators_health/metrics (env variable `sclmetrics`)
+            Profiling (cProfile + tracemalloc) of one stage or one step with the env variable
+                `sclprofile`, e.g. sclprofile=who-ghed or sclprofile=who-ghed:import
+            Memory and bytes are read from /proc (Linux); elsewhere they are missing
+'''
+
+# Libraries
+#------------------------------------------------------------------------------
+import os
+import json
+import time
+import atexit
+import numbers
+import resource
+
+def metrics_path():
+    return os.environ.get("sclmetrics") or os.path.expanduser("~/.cache/indicators_health/metrics")
+
+# Process counters
+#------------------------------------------------------------------------------
+def _io():
+    '''(bytes read, bytes written) by the process, from /proc/self/io.'''
+    try:
+        with open("/proc/self/io") as file:
+            counters = dict(line.split(": ") for line in file.read().splitlines())
+        return int(counters["rchar"]), int(counters["wchar"])
+    except (OSError, KeyError, ValueError):
+        return None, None
+
+def _rss():
+    '''Resident memory of the process in MB, from /proc/self/statm.'''
+    try:
+        with open("/proc/self/statm") as file:
+            return int(file.read().split()[1]) * os.sysconf("SC_PAGE_SIZE") / 2**20
+    except (OSError, IndexError, ValueError):
+        return None
+
+def peak_rss():
+    '''
+    Peak resident memory of the process in MB, from VmHWM of /proc/self/status.
+    Note: ru_maxrss (used only without /proc) keeps the peak of the parent across
+          fork + exec, e.g. a stage started by pipeline.py or benchmarks/run.py
+    '''
+    try:
+        with open("/proc/self/status") as file:
+            for line in file:
+                if line.startswith("VmHWM:"):
+                    return int(line.split()[1]) / 1024
+    except (OSError, IndexError, ValueError):
+        pass
+    return resource.getrusage(resource.RUSAGE_SELF).ru_maxrss / 1024
+
+def _rows(data):
+    if data is None:
+        return None
+    return int(data) if isinstance(data, numbers.Integral) else len(data)
+
+def _delta(end, start):
+    return None if end is None or start is None else end - start
+
+# Profiler
+#------------------------------------------------------------------------------
+class Profiler:
+    '''cProfile and tracemalloc around one stage or step.'''
+
+    def __init__(self, path):
+        import cProfile
+        import tracemalloc
+        self.path    = path
+        self.profile = cProfile.Profile()
+        tracemalloc.start()
+        self.profile.enable()
+
+    def stop(self, top = 20):
+        import tracemalloc
+        self.profile.disable()
+        self.profile.dump_stats(self.path)
+        _, peak    = tracemalloc.get_traced_memory()
+        snapshot   = tracemalloc.take_snapshot()
+        tracemalloc.stop()
+        statistics = snapshot.statistics("lineno")[:top]
+        return {"stats"         : self.path,
+                "peak_traced_mb": peak / 2**20,
+                "allocations"   : [f"{stat.size / 2**20:.1f} MB {stat.traceback}" for stat in statistics]}
+
+# Run
+#------------------------------------------------------------------------------
+class Run:
+    '''Metrics of one run of a script, step by step.'''
+
+    def __init__(self, stage, folder = None):
+        self.stage    = stage
+        self.folder   = folder or metrics_path()
+        self.started  = time.strftime("%Y%m%dT%H%M%S")
+        self.steps    = []
+        self.current  = None
+        self.finished = False
+        self.profiled = {}
+        self.profiler = None
+        self._start   = (time.perf_counter(), *_io())
+
+        # Profile of the whole stage ("") or of one step
+        name, _, step = os.environ.get("sclprofile", "").partition(":")
+        self.target   = step if name == stage else None
+        os.makedirs(self.folder, exist_ok = True)
+        if self.target == "":
+            self.profiler = Profiler(self._path("prof"))
+        atexit.register(self.finish, "incomplete")
+
+    def _path(self, extension):
+        return os.path.join(self.folder, f"{self.stage}-{self.started}.{extension}")
+
+    def step(self, name, rows_in = None):
+        '''Close the current step and start step `name`.'''
+        self._close()
+        self.current = {"step": name, "rows_in": _rows(rows_in), "rows_out": None,
+                        "_start": (time.perf_counter(), *_io())}
+        if self.target == name:
+            self.profiler = Profiler(self._path(f"{name}.prof"))
+
+    def rows(self, rows_out):
+        '''Rows (DataFrame or number) produced by the current step.'''
+        self.current["rows_out"] = _rows(rows_out)
+
+    def _close(self):
+        if self.current is None:
+            return
+        start, read, written = self.current.pop("_start")
+        end = (time.perf_counter(), *_io())
+        self.current.update({"wall_s"       : end[0] - start,
+                             "rss_mb"       : _rss(),
+                             "peak_rss_mb"  : peak_rss(),
+                             "bytes_read"   : _delta(end[1], read),
+                             "bytes_written": _delta(end[2], written)})
+        if self.profiler is not None and self.target == self.current["step"]:
+            self.profiled = self.profiler.stop()
+            self.profiler = None
+        self.steps.append(self.current)
+        self.current = None
+
+    def finish(self, status = "done"):
+        '''Close the last step and write the JSON of the run. Returns its path.'''
+        if self.finished:
+            return None
+        self._close()
+        if self.profiler is not None:
+            self.profiled = self.profiler.stop()
+            self.profiler = None
+        self.finished = True
+        atexit.unregister(self.finish)
+
+        start, read, written = self._start
+        end    = (time.perf_counter(), *_io())
+        output = {"stage"        : self.stage,
+                  "started"      : self.started,
+                  "status"       : status,
+                  "wall_s"       : end[0] - start,
+                  "peak_rss_mb"  : peak_rss(),
+                  "bytes_read"   : _delta(end[1], read),
+                  "bytes_written": _delta(end[2], written),
+                  "steps"        : self.steps}
+        if self.profiled:
+            output["profile"] = self.profiled
+
+        path = self._path("json")
+        with open(path + ".tmp", "w") as file:
+            json.dump(output, file, indent = 1)
+        os.replace(path + ".tmp", path)
+        return path
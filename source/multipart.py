@@ -0,0 +1,175 @@
+'''
+Program   : Chunked, compressed and concurrent writer of the exports
+Source    : Multiple
+Dependency: SCL-SPH
+Repository: indicators_health_secondary_data
+            https://github.com/BID-DATA/indicators_health_secondary_data
+Objective : Write a DataFrame as CSV to S3 or disk without building the whole text in memory
+Notes     : Rows are serialized in chunks and compressed as they are written
+                (env variable `sclcompression`: none (default), gzip or zstd)
+            S3: compressed bytes are cut in parts of `part_size` (at least 5 MB) and
+                uploaded concurrently with a multipart upload, at most `workers` parts
+                are held in memory; the object only appears when the upload completes
+                and the upload is aborted on failure
+            Disk: written to {path}.tmp and renamed when complete
+            Outputs smaller than one part are uploaded in one request
+            zstd requires the package zstandard
+'''
+
+# Libraries
+#------------------------------------------------------------------------------
+import os
+import io
+import zlib
+import threading
+from concurrent.futures import ThreadPoolExecutor
+
+# Compression
+#------------------------------------------------------------------------------
+COMPRESSIONS = {"none": "", "gzip": ".gz", "zstd": ".zst"}
+MIN_PART     = 5 * 2**20
+
+def compression():
+    '''Compression of the exports from env variable `sclcompression`.'''
+    compression_ = os.environ.get("sclcompression", "none").lower()
+    if compression_ not in COMPRESSIONS:
+        raise ValueError(f"sclcompression must be one of {tuple(COMPRESSIONS)}, got {compression_!r}")
+    return compression_
+
+def extension(compression_ = None):
+    '''File extension of `compression_` (default: compression()), e.g. .gz.'''
+    return COMPRESSIONS[compression_ or compression()]
+
+class _Identity:
+    def compress(self, data):
+        return data
+    def flush(self):
+        return b""
+
+def compressor(compression_):
+    '''Object with compress(bytes) and flush() for `compression_`.'''
+    if compression_ == "gzip":
+        return zlib.compressobj(6, zlib.DEFLATED, 31)
+    if compression_ == "zstd":
+        import zstandard
+        return zstandard.ZstdCompressor(level = 3).compressobj()
+    return _Identity()
+
+# Writers
+#------------------------------------------------------------------------------
+class LocalWriter:
+    '''Bytes written to {path}.tmp and renamed to `path` on close.'''
+
+    def __init__(self, path):
+        self.path = path
+        os.makedirs(os.path.dirname(path) or ".", exist_ok = True)
+        self.file = open(path + ".tmp", "wb")
+
+    def write(self, data):
+        self.file.write(data)
+
+    def close(self):
+        self.file.close()
+        os.replace(self.path + ".tmp", self.path)
+
+    def abort(self):
+        self.file.close()
+        if os.path.exists(self.path + ".tmp"):
+            os.remove(self.path + ".tmp")
+
+class S3Writer:
+    '''Bytes uploaded to `key` of `bucket` in parts of `part_size`, `workers` at a time.'''
+
+    def __init__(self, client, bucket, key, part_size = 16 * 2**20, workers = 4, content_type = None):
+        self.client    = client
+        self.bucket    = bucket
+        self.key       = key
+        self.part_size = max(part_size, MIN_PART)
+        self.extra     = {"ContentType": content_type} if content_type else {}
+        self.buffer    = io.BytesIO()
+        self.upload_id = None
+        self.futures   = []
+        self.pool      = ThreadPoolExecutor(max_workers = workers)
+        self.slots     = threading.BoundedSemaphore(workers)
+
+    def _upload(self, number, body):
+        try:
+            response = self.client.upload_part(Bucket = self.bucket, Key = self.key, UploadId = self.upload_id,
+                                               PartNumber = number, Body = body)
+            return {"PartNumber": number, "ETag": response["ETag"]}
+        finally:
+            self.slots.release()
+
+    def _submit(self):
+        if self.upload_id is None:
+            response       = self.client.create_multipart_upload(Bucket = self.bucket, Key = self.key, **self.extra)
+            self.upload_id = response["UploadId"]
+        body        = self.buffer.getvalue()
+        self.buffer = io.BytesIO()
+        # Note: waits for a free slot, so at most `workers` parts are in memory
+        self.slots.acquire()
+        self.futures.append(self.pool.submit(self._upload, len(self.futures) + 1, body))
+
+    def write(self, data):
+        self.buffer.write(data)
+        if self.buffer.tell() >= self.part_size:
+            self._submit()
+
+    def close(self):
+        try:
+            if self.upload_id is None:
+                self.client.put_object(Bucket = self.bucket, Key = self.key, Body = self.buffer.getvalue(), **self.extra)
+                return
+            if self.buffer.tell() > 0:
+                self._submit()
+            parts = [future.result() for future in self.futures]
+            self.client.complete_multipart_upload(Bucket = self.bucket, Key = self.key, UploadId = self.upload_id,
+                                                  MultipartUpload = {"Parts": parts})
+        except BaseException:
+            self.abort()
+            raise
+        finally:
+            self.pool.shutdown(wait = True)
+
+    def abort(self):
+        for future in self.futures:
+            future.cancel()
+        self.pool.shutdown(wait = True)
+        if self.upload_id is not None:
+            self.client.abort_multipart_upload(Bucket = self.bucket, Key = self.key, UploadId = self.upload_id)
+            self.upload_id = None
+
+def open_writer(url, part_size = 16 * 2**20, workers = 4, content_type = None):
+    '''Writer of `url`: s3://bucket/key (multipart upload) or a local path.'''
+    if url.startswith("s3://"):
+        from storage import S3Storage
+        bucket, _, key = url[len("s3://"):].partition("/")
+        return S3Writer(S3Storage(bucket).client, bucket, key, part_size, workers, content_type)
+    return LocalWriter(url)
+
+# CSV
+#------------------------------------------------------------------------------
+def write_csv(data, url, compression_ = None, chunksize = 100_000, part_size = 16 * 2**20, workers = 4):
+    '''
+    Write `data` as CSV to `url`, `chunksize` rows at a time, compressed with
+    `compression_` (default: compression()). `url` must have the matching extension.
+    Returns the bytes written.
+    '''
+    compression_ = compression_ or compression()
+    codec        = compressor(compression_)
+    writer       = open_writer(url, part_size, workers, content_type = "text/csv" if compression_ == "none" else None)
+    written      = 0
+    try:
+        for start in range(0, max(len(data), 1), chunksize):
+            text  = data.iloc[start:start + chunksize].to_csv(index = False, header = start == 0)
+            block = codec.compress(text.encode("utf-8"))
+            written += len(block)
+            writer.write(block)
+        block = codec.flush()
+        written += len(block)
+        writer.write(block)
+    except BaseException:
+        writer.abort()
+        raise
+    writer.close()
+    return written
@@ -0,0 +1,248 @@
+'''
+Program   : Export and import of processed datasets
+Source    : Multiple
+Dependency: SCL-SPH
+Repository: indicators_health_secondary_data
+            https://github.com/BID-DATA/indicators_health_secondary_data
+Objective : Write processed datasets as CSV and/or partitioned Parquet, and read them back
+Notes     : Output format set with the env variable `sclformat`: csv (default), parquet or both
+            CSV files are written in chunks, compressed with the env variable `sclcompression`
+                (none, gzip or zstd; {name}.csv, .csv.gz or .csv.zst) and uploaded to S3 in
+                concurrent parts (see multipart.py)
+            Parquet datasets are written to {path}/{name}.parquet, hive-partitioned by
+                source, indicator and year (only the columns given)
+            The full Arrow schema is kept in _common_metadata, so dtypes are preserved on read
+            Parquet datasets are written to a new version {name}.parquet/v={run} and the
+                pointer {name}.parquet/_current.json is updated when it is complete, in one
+                step also in S3; readers read the version of the pointer
+            Readers select columns and push filters down to the partitions and row groups
+            Filters use the pyarrow format, e.g. [("indicator","in",["lexp"]),("year",">=",2000)]
+            CSV readers only parse the columns given and apply the filters chunk by chunk
+            Subset runs (subset.py) write and read {name}-dev, with the subset that wrote it in
+                {name}-dev.subset.json; -dev outputs of another subset are not read
+'''
+
+# Libraries
+#------------------------------------------------------------------------------
+import os
+import json
+import operator
+import pandas as pd
+from multipart import extension, write_csv
+from storage import LocalStorage, S3Storage
+from subset import get_subset
+
+# Output format
+#------------------------------------------------------------------------------
+FORMATS = ("csv","parquet","both")
+
+def output_format():
+    '''Format of processed datasets from env variable `sclformat`.'''
+    format_ = os.environ.get("sclformat", "csv").lower()
+    if format_ not in FORMATS:
+        raise ValueError(f"sclformat must be one of {FORMATS}, got {format_!r}")
+    return format_
+
+# Parquet
+#------------------------------------------------------------------------------
+# Note: the version of a dataset is in {name}.parquet/_current.json
+CURRENT = "_current.json"
+
+def _filesystem(path):
+    import pyarrow.fs as pafs
+    return pafs.FileSystem.from_uri(path)
+
+def _delete_dir(fs, root):
+    try:
+        fs.delete_dir(root)
+    except (FileNotFoundError, OSError):
+        pass
+
+def _version(fs, root):
+    '''Directory of the current version of the dataset `root` (pointer in CURRENT).'''
+    try:
+        with fs.open_input_stream(f"{root}/{CURRENT}") as file:
+            return f"{root}/v={json.loads(file.read())['version']}"
+    except FileNotFoundError:
+        # Note: datasets written before versions were added are read from `root`
+        return root
+
+def _point(fs, root, version):
+    '''Point the dataset `root` to `version`, in one step.'''
+    import pyarrow.fs as pafs
+
+    body = json.dumps({"version": version}).encode()
+    if isinstance(fs, pafs.LocalFileSystem):
+        # Note: written aside and renamed, so readers never see a partial pointer
+        temp = f"{root}/{CURRENT}.tmp-{version}"
+        with fs.open_output_stream(temp) as file:
+            file.write(body)
+        fs.move(temp, f"{root}/{CURRENT}")
+        return
+
+    # Note: a PUT replaces the S3 object in one step, readers get the old or the new pointer
+    with fs.open_output_stream(f"{root}/{CURRENT}") as file:
+        file.write(body)
+
+def _prune(fs, root, keep):
+    '''Delete the entries of the dataset `root` other than CURRENT and the versions `keep`.'''
+    import pyarrow.fs as pafs
+
+    for info in fs.get_file_info(pafs.FileSelector(root)):
+        if info.base_name == CURRENT or info.base_name in {f"v={version}" for version in keep}:
+            continue
+        if info.type == pafs.FileType.Directory:
+            _delete_dir(fs, info.path)
+        else:
+            fs.delete_file(info.path)
+
+def write_parquet(data, path, partitions):
+    '''
+    Write `data` to a new version of the dataset directory `path` partitioned by `partitions`.
+    The pointer to the current version is updated when the version is complete, so a
+    failed write leaves the previous version in place; older versions are deleted after.
+    '''
+    import time
+    import uuid
+    import pyarrow as pa
+    import pyarrow.parquet as pq
+
+    table    = pa.Table.from_pandas(data, preserve_index = False)
+    fs, root = _filesystem(path)
+    previous = _version(fs, root)
+    version  = f"{time.strftime('%Y%m%dT%H%M%S', time.gmtime())}-{uuid.uuid4().hex[:8]}"
+    temp     = f"{root}/v={version}"
+    try:
+        fs.create_dir(temp)
+        pq.write_to_dataset(table, temp, partition_cols = partitions, filesystem = fs)
+        pq.write_metadata(table.schema, f"{temp}/_common_metadata", filesystem = fs)
+        _point(fs, root, version)
+    except BaseException:
+        _delete_dir(fs, temp)
+        raise
+
+    # Note: the previous version is kept for readers that read the pointer before the
+    #       update; other versions and datasets written before versions are deleted
+    _prune(fs, root, keep = [version, previous.rpartition("/v=")[2]])
+
+def read_parquet(path, columns = None, filters = None):
+    '''Read the current version of a partitioned dataset selecting `columns` and pushing `filters` down.'''
+    import pyarrow as pa
+    import pyarrow.dataset as ds
+    import pyarrow.parquet as pq
+
+    fs, root   = _filesystem(path)
+    root       = _version(fs, root)
+    schema     = pq.read_schema(f"{root}/_common_metadata", filesystem = fs)
+    keys       = _partition_keys(fs, root)
+
+    # Categorical partitions are read as strings and converted back after the read
+    # Note: pyarrow needs every dictionary value of a partition before the read
+    categories = [key for key in keys if pa.types.is_dictionary(schema.field(key).type)]
+    for key in categories:
+        index  = schema.get_field_index(key)
+        schema = schema.set(index, schema.field(key).with_type(schema.field(key).type.value_type))
+
+    partitions = ds.partitioning(pa.schema([schema.field(key) for key in keys]), flavor = "hive")
+    dataset    = ds.dataset(root, schema = schema, format = "parquet", partitioning = partitions, filesystem = fs)
+    filters    = [(column, op, sorted(value) if isinstance(value, (set, frozenset)) else value) for column, op, value in filters or []]
+    filter_    = pq.filters_to_expression(filters) if filters else None
+    data       = dataset.to_table(columns = columns, filter = filter_).to_pandas()
+    for key in categories:
+        if key in data.columns:
+            data[key] = data[key].astype("category")
+    return data
+
+def _partition_keys(fs, root):
+    '''Partition columns of a hive dataset, from its first directory path.'''
+    import pyarrow.fs as pafs
+
+    keys = []
+    path = root
+    while True:
+        dirs = [info for info in fs.get_file_info(pafs.FileSelector(path)) if info.type == pafs.FileType.Directory]
+        if len(dirs) == 0 or "=" not in dirs[0].base_name:
+            return keys
+        keys.append(dirs[0].base_name.split("=")[0])
+        path = dirs[0].path
+
+# CSV filters
+#------------------------------------------------------------------------------
+OPERATORS = {"==": operator.eq, "=": operator.eq, "!=": operator.ne, ">": operator.gt,
+             ">=": operator.ge, "<": operator.lt, "<=": operator.le}
+
+def apply_filters(data, filters):
+    '''Apply pyarrow-style filters (list of (column, op, value)) to a DataFrame.'''
+    for column, op, value in filters or []:
+        if op == "in":
+            data = data[data[column].isin(value)]
+        elif op == "not in":
+            data = data[~data[column].isin(value)]
+        else:
+            data = data[OPERATORS[op](data[column], value)]
+    return data
+
+# Subset runs
+#------------------------------------------------------------------------------
+def _location(path):
+    '''(storage, key) of `path`: s3://bucket/key or a local path.'''
+    if path.startswith("s3://"):
+        bucket, _, key = path[len("s3://"):].partition("/")
+        return S3Storage(bucket), key
+    return LocalStorage(os.path.dirname(path)), os.path.basename(path)
+
+def write_subset(path, name, subset):
+    '''Record the subset of a subset run that wrote {path}/{name}.'''
+    storage, key = _location(f"{path}/{name}.subset.json")
+    storage.write(key, json.dumps(subset.describe(), indent = 1).encode(), content_type = "application/json")
+
+def check_subset(path, name, subset):
+    '''Raise ValueError if {path}/{name} was not written by a run of `subset`.'''
+    storage, key = _location(f"{path}/{name}.subset.json")
+    try:
+        written = json.loads(storage.read(key))
+    except FileNotFoundError:
+        written = None
+    if written != subset.describe():
+        raise ValueError(f"{name} was written by a subset run of {written}, not of {subset.describe()}; "
+                         f"run the stages it depends on with the same subset")
+
+# Export and import
+#------------------------------------------------------------------------------
+def export(data, path, name, indicator = None, year = None, source = None):
+    '''
+    Write `data` to {path}/{name}.csv (with the extension of the compression) and/or
+    {path}/{name}.parquet.
+    `source`, `indicator` and `year` are the column names used as Parquet partitions.
+    '''
+    format_ = output_format()
+    subset  = get_subset()
+    name    = name + subset.suffix
+    if "://" not in path:
+        os.makedirs(path, exist_ok = True)
+    if format_ in ("csv","both"):
+        write_csv(data, f"{path}/{name}.csv{extension()}")
+    if format_ in ("parquet","both"):
+        partitions = [column for column in [source, indicator, year] if column is not None]
+        write_parquet(data, f"{path}/{name}.parquet", partitions)
+    if subset.active:
+        write_subset(path, name, subset)
+
+def load(path, name, columns = None, filters = None, chunksize = 250_000):
+    '''
+    Read {path}/{name} in the configured format.
+    Only `columns` and the rows matching `filters` are kept: with Parquet, only the
+    partitions/row groups matching are read; with CSV, filters are applied by chunk.
+    '''
+    subset = get_subset()
+    name   = name + subset.suffix
+    if subset.active:
+        check_subset(path, name, subset)
+    if output_format() == "csv":
+        usecols = None if columns is None else list(dict.fromkeys(list(columns) + [column for column, _, _ in filters or []]))
+        url     = f"{path}/{name}.csv{extension()}"
+        with pd.read_csv(url, usecols = usecols, chunksize = chunksize) as reader:
+            chunks = [apply_filters(chunk, filters) for chunk in reader]
+        data    = pd.concat(chunks, ignore_index = True) if chunks else pd.read_csv(url, usecols = usecols, nrows = 0)
+        return data if columns is None else data[columns]
+    return read_parquet(f"{path}/{name}.parquet", columns = columns, filters = filters)
@@ -0,0 +1,219 @@
+'''
+Program   : Panel engine for time-series transforms
+Source    : indicators_health (scl-indicators.py)
+Dependency: SCL-SPH
+Repository: indicators_health_secondary_data
+            https://github.com/BID-DATA/indicators_health_secondary_data
+Objective : Keep a long dataset as a dense country x series x year array and compute
+            trends over the year axis without groupby
+Notes     : A series is one combination of the series columns, by default
+                source, indicator, sex and age of indicators_health
+            The year axis covers every year from the first to the last, so a shift of
+                n positions is n years; missing cells are NaN
+            Transforms return a new panel: interpolate (linear, inside gaps), cagr,
+                rolling (mean, sum, min, max), ffill (latest value as of each year)
+            latest gives the latest non-missing value of each country and series with its year
+            to_long returns the long schema of the input; columns constant within each
+                country (e.g. idgeo, iddate) are kept, other columns are dropped
+            Usage:
+                panel = Panel.from_long(health)
+                panel.interpolate(limit = 3).cagr(5).to_long()
+                panel.latest(as_of = 2019)
+'''
+
+# Libraries
+#------------------------------------------------------------------------------
+import numpy as np
+import pandas as pd
+
+SERIES = ["source","indicator","sex","age"]
+
+# Functions
+#------------------------------------------------------------------------------
+def _codes(values):
+    '''(codes, labels) of a column, missing values get code -1.'''
+    if isinstance(values.dtype, pd.CategoricalDtype):
+        return values.cat.codes.to_numpy(), values.cat.categories
+    return pd.factorize(values, use_na_sentinel = True)
+
+def _labels(codes, labels):
+    '''Column of `codes` over `labels` (-1 is missing), categorical for text labels.'''
+    if len(labels) == 0:
+        return np.full(len(codes), np.nan)
+    if labels.dtype.kind in "iufb":
+        return np.where(codes >= 0, labels.to_numpy()[np.maximum(codes, 0)], np.nan)
+    return pd.Categorical.from_codes(codes, categories = labels)
+
+def _previous(valid):
+    '''Position of the last valid year at or before each year, -1 if none.'''
+    position = np.where(valid, np.arange(valid.shape[-1]), -1)
+    return np.maximum.accumulate(position, axis = -1)
+
+def _next(valid):
+    '''Position of the first valid year at or after each year, n (number of years) if none.'''
+    n        = valid.shape[-1]
+    position = np.where(valid, np.arange(n), n)
+    return np.minimum.accumulate(position[..., ::-1], axis = -1)[..., ::-1]
+
+# Panel
+#------------------------------------------------------------------------------
+class Panel:
+    '''Values of countries x series x years, with the labels of each axis.'''
+
+    def __init__(self, values, countries, series, years, attributes = None, columns = None, names = None):
+        self.values     = values
+        self.countries  = pd.Index(countries)
+        self.series     = series
+        self.years      = years
+        self.attributes = attributes or {}
+        self.columns    = columns
+        self.names      = names or {"country": "isoalpha3", "year": "year", "value": "value"}
+
+    def __repr__(self):
+        return f"Panel({len(self.countries)} countries x {len(self.series)} series x {len(self.years)} years)"
+
+    def _like(self, values):
+        return Panel(values, self.countries, self.series, self.years, self.attributes, self.columns, self.names)
+
+    @classmethod
+    def from_long(cls, data, series = SERIES, country = "isoalpha3", year = "year", value = "value"):
+        '''
+        Panel of the long `data`; rows without country or year are left out.
+        Raises ValueError if a cell has more than one row.
+        '''
+        data              = data[data[country].notna() & data[year].notna()]
+        series            = [name for name in series if name in data.columns]
+        country_, labels_ = _codes(data[country])
+        years_            = data[year].to_numpy()
+        first, last       = int(years_.min()), int(years_.max())
+        years             = np.arange(first, last + 1, dtype = years_.dtype)
+
+        # Series: one code per combination of the series columns
+        key = np.zeros(len(data), dtype = np.int64)
+        for name in series:
+            codes, labels = _codes(data[name])
+            key = key * (len(labels) + 1) + (codes + 1)
+        uniques, index, series_ = np.unique(key, return_index = True, return_inverse = True)
+        frame = data[series].iloc[index].reset_index(drop = True)
+
+        # Cells
+        cell   = (country_.astype(np.int64) * len(uniques) + series_) * len(years) + (years_ - first)
+        counts = np.bincount(cell, minlength = len(labels_) * len(uniques) * len(years))
+        if (counts > 1).any():
+            raise ValueError(f"{int((counts > 1).sum())} cells of {country} x {series} x {year} have more than one row")
+        values = np.full(len(labels_) * len(uniques) * len(years), np.nan)
+        values[cell] = data[value].to_numpy(dtype = float, na_value = np.nan)
+        values = values.reshape(len(labels_), len(uniques), len(years))
+
+        # Columns constant within each country
+        attributes = {}
+        rows       = np.full(len(labels_), -1)
+        rows[country_[::-1]] = np.arange(len(data))[::-1]
+        for name in data.columns.difference([country, year, value] + series, sort = False):
+            codes, labels = _codes(data[name])
+            if (codes == codes[rows[country_]]).all():
+                attributes[name] = (codes[rows], labels)
+        columns = [name for name in data.columns if name in attributes or name in [country, year, value] + series]
+        names   = {"country": country, "year": year, "value": value}
+        return cls(values, labels_, frame, years, attributes, columns, names)
+
+    # Long format
+    #--------------------------------------------------------------------------
+    def _long(self, country, series, year, value):
+        output = {self.names["country"]: _labels(country, self.countries)}
+        for name, (codes, labels) in self.attributes.items():
+            output[name] = _labels(codes[country], pd.Index(labels))
+        for name in self.series.columns:
+            codes, labels = _codes(self.series[name])
+            output[name]  = _labels(codes[series], pd.Index(labels))
+        output[self.names["year"]]  = year
+        output[self.names["value"]] = value
+        output = pd.DataFrame(output)
+        return output[[name for name in self.columns if name in output.columns]] if self.columns else output
+
+    def to_long(self, dropna = True):
+        '''Long DataFrame of the panel, without missing cells if `dropna`.'''
+        if dropna:
+            country, series, year = np.nonzero(~np.isnan(self.values))
+        else:
+            country, series, year = np.indices(self.values.shape).reshape(3, -1)
+        return self._long(country, series, self.years[year], self.values[country, series, year])
+
+    # Transforms
+    #--------------------------------------------------------------------------
+    def interpolate(self, limit = None):
+        '''Linear interpolation inside gaps of at most `limit` years (all gaps if None).'''
+        valid    = ~np.isnan(self.values)
+        previous = _previous(valid)
+        next_    = _next(valid)
+        n        = self.values.shape[-1]
+        gap      = (~valid) & (previous >= 0) & (next_ < n)
+        if limit is not None:
+            gap &= (next_ - previous - 1) <= limit
+
+        low    = np.take_along_axis(self.values, np.clip(previous, 0, n - 1), axis = -1)
+        high   = np.take_along_axis(self.values, np.clip(next_, 0, n - 1), axis = -1)
+        with np.errstate(invalid = "ignore", divide = "ignore"):
+            weight = (np.arange(n) - previous) / (next_ - previous)
+        return self._like(np.where(gap, low + weight * (high - low), self.values))
+
+    def cagr(self, periods = 1):
+        '''Compound annual growth rate over the `periods` years ending in each year.'''
+        base = np.full(self.values.shape, np.nan)
+        base[..., periods:] = self.values[..., :-periods]
+        with np.errstate(invalid = "ignore", divide = "ignore"):
+            ratio = self.values / base
+            return self._like(np.where(ratio > 0, ratio ** (1 / periods) - 1, np.nan))
+
+    def rolling(self, window, how = "mean", min_periods = 1):
+        '''Rolling `how` (mean, sum, min or max) over the `window` years ending in each year.'''
+        if how not in ("mean","sum","min","max"):
+            raise ValueError(f"how must be mean, sum, min or max, got {how!r}")
+        valid  = ~np.isnan(self.values)
+        n      = self.values.shape[-1]
+        high   = np.arange(1, n + 1)
+        low    = np.maximum(0, high - window)
+
+        # Sums and counts from cumulative sums, min and max from sliding windows
+        zero   = np.zeros(self.values.shape[:-1] + (1,))
+        counts = np.concatenate([zero, np.cumsum(valid, axis = -1)], axis = -1)
+        counts = counts[..., high] - counts[..., low]
+        if how in ("mean","sum"):
+            sums   = np.concatenate([zero, np.cumsum(np.where(valid, self.values, 0), axis = -1)], axis = -1)
+            output = sums[..., high] - sums[..., low]
+            if how == "mean":
+                with np.errstate(invalid = "ignore", divide = "ignore"):
+                    output = output / counts
+        else:
+            padded  = np.concatenate([np.full(self.values.shape[:-1] + (window - 1,), np.nan), self.values], axis = -1)
+            windows = np.lib.stride_tricks.sliding_window_view(padded, window, axis = -1)
+            fill    = np.inf if how == "min" else -np.inf
+            output  = getattr(np, how)(np.where(np.isnan(windows), fill, windows), axis = -1)
+        return self._like(np.where(counts >= min_periods, output, np.nan))
+
+    def ffill(self, limit = None):
+        '''Latest value as of each year, carried at most `limit` years (always if None).'''
+        previous = _previous(~np.isnan(self.values))
+        values   = np.take_along_axis(self.values, np.maximum(previous, 0), axis = -1)
+        keep     = previous >= 0
+        if limit is not None:
+            keep &= (np.arange(self.values.shape[-1]) - previous) <= limit
+        return self._like(np.where(keep, values, np.nan))
+
+    def latest(self, as_of = None, max_age = None):
+        '''
+        Long DataFrame with the latest non-missing value of each country and series
+        in a year up to `as_of` (default: last year), at most `max_age` years old.
+        '''
+        as_of  = int(self.years[-1]) if as_of is None else int(as_of)
+        column = min(as_of, int(self.years[-1])) - int(self.years[0])
+        if column < 0:
+            previous = np.full(self.values.shape[:-1], -1)
+        else:
+            previous = _previous(~np.isnan(self.values[..., :column + 1]))[..., -1]
+        keep   = previous >= 0
+        if max_age is not None:
+            keep &= (as_of - self.years[np.maximum(previous, 0)]) <= max_age
+        country, series = np.nonzero(keep)
+        position        = previous[country, series]
+        return self._long(country, series, self.years[position], self.values[country, series, position])
@@ -0,0 +1,246 @@
+'''
+Program   : Pipeline runner
+Source    : Multiple
+Dependency: SCL-SPH
+Repository: indicators_health_secondary_data
+            https://github.com/BID-DATA/indicators_health_secondary_data
+Objective : Run the preprocessing scripts in order, in parallel when possible
+Notes     : Each stage declares the S3 prefixes it reads (inputs) and writes (outputs)
+            A stage waits for the stages that write its inputs, e.g. scl-indicators.py
+                runs after who-ghed.py, ihme-haq.py, ihme-le.py and who-gho.py, and
+                scl-profiles.py runs after scl-indicators.py
+            Independent stages run in parallel worker processes
+            Fingerprint of a stage: ETags of all objects under its inputs plus the code
+            Stages whose fingerprint did not change since the last successful run are skipped
+                unless they are volatile (e.g. who-gho.py reads the GHO API)
+            State is kept in ~/.cache/indicators_health/pipeline.json (env variable `pipelinestate`)
+            Stages read and write the storage of storage.py: S3 or a local directory (--storage)
+            Each script has a main() and can be imported without side effects (load_stage),
+                pandas and the helper modules are only imported when a stage runs
+            Subset runs (--countries, --indicators, --years, see subset.py) always run and
+                write {name}-dev outputs, the state of the full runs is not changed
+            Usage: python source/pipeline.py [--stages who-ghed scl-indicators] [--only] [--force]
+                       [--workers 4] [--storage DIR] [--list]
+                       [--countries ARG BRA] [--indicators WHS6_102] [--years 2000-2019]
+'''
+
+# Libraries
+#------------------------------------------------------------------------------
+import os
+import sys
+import json
+import glob
+import hashlib
+import importlib
+import argparse
+import traceback
+from dataclasses import dataclass, field
+from concurrent.futures import ProcessPoolExecutor, FIRST_COMPLETED, wait
+from storage import as_storage, environment
+from subset import get_subset
+
+SOURCE = os.path.dirname(os.path.abspath(__file__))
+
+# Paths
+#------------------------------------------------------------------------------
+KEYS   = "Geospatial Basemaps/Cartographic Boundary Files/keys/"
+IHME   = "International Organizations/Institute for Health Metrics and Evaluation (IHME)/"
+WHO    = "International Organizations/World Health Organization (WHO)/"
+HEALTH = "International Organizations/International Organizations Indicators/health/"
+HAQ    = IHME + "Healthcare Access and Quality (HAQ) index/"
+GBD    = IHME + "Global Burden of Disease (GBD)/"
+GHED   = WHO  + "Globoal Health Expenditure Database (GHED)/"
+GHO    = WHO  + "Global Health Observatory (GHO)/"
+
+# Stages
+#------------------------------------------------------------------------------
+@dataclass
+class Stage:
+    '''Script with the S3 prefixes it reads and writes.'''
+    name    : str
+    script  : str
+    inputs  : list = field(default_factory = list)
+    outputs : list = field(default_factory = list)
+    volatile: bool = False
+
+STAGES = [
+    Stage("ihme-haq", "ihme-haq.py",
+          inputs  = [KEYS, HAQ + "raw/", GBD + "codebook/ihme-location-2019.csv"],
+          outputs = [HAQ + "processed/haq"]),
+    Stage("ihme-le", "ihme-le.py",
+          inputs  = [KEYS, GBD + "raw/ihme-gbd-", GBD + "codebook/ihme-location-2019.csv"],
+          outputs = [GBD + "processed/ihme-gbd-le-hale"]),
+    Stage("who-ghed", "who-ghed.py",
+          inputs  = [KEYS, GHED + "GHED_data_raw"],
+          outputs = [GHED + "GHED_data_processed"]),
+    Stage("who-gho", "who-gho.py",
+          inputs  = [],
+          outputs = [GHO + "who-gho-api"],
+          volatile = True),
+    Stage("scl-indicators", "scl-indicators.py",
+          inputs  = [KEYS, HAQ + "processed/haq", GBD + "processed/ihme-gbd-le-hale",
+                     GHED + "GHED_data_processed", GHO + "who-gho-api"],
+          outputs = [HEALTH + "indicators_health"]),
+    Stage("scl-profiles", "scl-profiles.py",
+          inputs  = [KEYS, HEALTH + "indicators_health", HAQ + "processed/haq", GBD + "processed/ihme-gbd-le-hale",
+                     GHED + "GHED_data_processed", GHO + "who-gho-api"],
+          outputs = [HEALTH + "profiles/"]),
+]
+
+def dependencies(stages):
+    '''{stage: set of stages that write one of its inputs}.'''
+    deps = {}
+    for stage in stages:
+        deps[stage.name] = {other.name for other in stages if other is not stage
+                            and any(output.startswith(input_) for output in other.outputs for input_ in stage.inputs)}
+    return deps
+
+# Fingerprints
+#------------------------------------------------------------------------------
+def code_hash(stage):
+    '''Hash of the script and the shared modules of source/.'''
+    hash_   = hashlib.sha256()
+    helpers = sorted(path for path in glob.glob(os.path.join(SOURCE, "*.py")) if "-" not in os.path.basename(path))
+    for path in [os.path.join(SOURCE, stage.script)] + helpers:
+        with open(path, "rb") as file:
+            hash_.update(file.read())
+    return hash_.hexdigest()
+
+def fingerprint(stage, storage):
+    '''Fingerprint of the code and the inputs of `stage`.'''
+    hash_ = hashlib.sha256(code_hash(stage).encode())
+    for prefix in stage.inputs:
+        hash_.update(json.dumps([prefix, storage.list(prefix)]).encode())
+    return hash_.hexdigest()
+
+def outputs_exist(stage, storage):
+    return all(len(storage.list(prefix)) > 0 for prefix in stage.outputs)
+
+# State
+#------------------------------------------------------------------------------
+def state_path():
+    return os.environ.get("pipelinestate") or os.path.expanduser("~/.cache/indicators_health/pipeline.json")
+
+def load_state():
+    if os.path.exists(state_path()):
+        with open(state_path()) as file:
+            return json.load(file)
+    return {}
+
+def save_state(state):
+    os.makedirs(os.path.dirname(state_path()), exist_ok = True)
+    with open(state_path() + ".tmp", "w") as file:
+        json.dump(state, file, indent = 1, sort_keys = True)
+    os.replace(state_path() + ".tmp", state_path())
+
+# Run
+#------------------------------------------------------------------------------
+def load_stage(script):
+    '''
+    Module of a script of source/, e.g. load_stage("who-ghed.py").main() runs the stage.
+    Importing a script has no side effects: its work and heavy imports are in main().
+    '''
+    if SOURCE not in sys.path:
+        sys.path.insert(0, SOURCE)
+    return importlib.import_module(os.path.splitext(script)[0])
+
+def run_script(script):
+    '''Run the main() of a script of source/ in the current (worker) process.'''
+    load_stage(script).main()
+
+def run(stages = None, force = False, workers = 4, storage = None, only = False):
+    '''
+    Run `stages` (names, default all) and the stages they depend on, in dependency order.
+    With `only`, dependencies are not added (their outputs must exist).
+    Returns {stage: "done" | "skipped" | "failed" | "blocked"}.
+    '''
+    storage = as_storage(storage)
+    dev     = get_subset().active
+
+    # Stages to run
+    names    = set(stages or [stage.name for stage in STAGES])
+    deps     = dependencies(STAGES)
+    pending  = set()
+    while names:
+        name = names.pop()
+        if name not in pending:
+            pending.add(name)
+            names |= set() if only else deps[name]
+    pending  = {stage.name: stage for stage in STAGES if stage.name in pending}
+    status   = {}
+    state    = load_state()
+    running  = {}
+
+    with ProcessPoolExecutor(max_workers = workers) as pool:
+        while pending or running:
+
+            # Submit stages whose dependencies are finished
+            active = {name for name, _ in running.values()}
+            for name, stage in list(pending.items()):
+                if any(dep in pending or dep in active for dep in deps[name]):
+                    continue
+                del pending[name]
+                if any(status.get(dep) in ("failed","blocked") for dep in deps[name]):
+                    status[name] = "blocked"
+                    print(f"[{name}] blocked by failed dependencies")
+                    continue
+                print_ = fingerprint(stage, storage)
+                if not force and not dev and not stage.volatile and state.get(name) == print_ and outputs_exist(stage, storage):
+                    status[name] = "skipped"
+                    print(f"[{name}] skipped, inputs did not change")
+                    continue
+                print(f"[{name}] running {stage.script}")
+                running[pool.submit(run_script, stage.script)] = (name, print_)
+                active.add(name)
+
+            if not running:
+                continue
+
+            # Collect finished stages
+            done, _ = wait(running, return_when = FIRST_COMPLETED)
+            for future in done:
+                name, print_ = running.pop(future)
+                try:
+                    future.result()
+                    status[name] = "done"
+                    if not dev:
+                        state[name] = print_
+                        save_state(state)
+                    print(f"[{name}] done")
+                except Exception:
+                    status[name] = "failed"
+                    print(f"[{name}] failed\n{traceback.format_exc()}")
+
+    return status
+
+if __name__ == "__main__":
+    environment()
+
+    parser = argparse.ArgumentParser(description = "Run the preprocessing pipeline")
+    parser.add_argument("--stages" , nargs = "*", choices = [stage.name for stage in STAGES], help = "stages to run (default all)")
+    parser.add_argument("--only"   , action = "store_true", help = "run only the stages given, not the stages they depend on")
+    parser.add_argument("--force"  , action = "store_true", help = "run stages even if their inputs did not change")
+    parser.add_argument("--workers", type = int, default = 4, help = "number of worker processes")
+    parser.add_argument("--storage", help = "local directory with the layout of the bucket (default: S3 bucket `sclbucket`)")
+    parser.add_argument("--list"   , action = "store_true", help = "list the stages and exit")
+    parser.add_argument("--countries" , nargs = "+", help = "subset run: isoalpha3 codes and/or regions (IADB, OECD, Global)")
+    parser.add_argument("--indicators", nargs = "+", help = "subset run: indicator codes of the outputs (case-insensitive)")
+    parser.add_argument("--years"     , help = "subset run: years, e.g. 2000-2019, 2010- or 2015")
+    args   = parser.parse_args()
+
+    if args.list:
+        deps = dependencies(STAGES)
+        for stage in STAGES:
+            print(f"{stage.name:<16}{stage.script:<20}after: {', '.join(sorted(deps[stage.name])) or '-'}")
+        sys.exit(0)
+
+    # Note: scripts read the storage from the environment (storage.get_storage)
+    if args.storage:
+        os.environ["sclstorage"] = args.storage
+
+    # Note: scripts read the subset from the environment (subset.get_subset)
+    for name, value in [("sclcountries", args.countries), ("sclindicators", args.indicators), ("sclyears", args.years)]:
+        if value:
+            os.environ[name] = value if isinstance(value, str) else ",".join(value)
+    status = run(args.stages, force = args.force, workers = args.workers, only = args.only)
+    sys.exit(1 if any(value in ("failed","blocked") for value in status.values()) else 0)
@@ -0,0 +1,114 @@
+'''
+Program   : Country-profile bundles
+Source    : indicators_health (scl-indicators.py) and the benchmarks of scl-profiles.py
+Dependency: SCL-SPH
+Repository: indicators_health_secondary_data
+            https://github.com/BID-DATA/indicators_health_secondary_data
+Objective : Build one JSON bundle per country with everything its SCL country profile shows
+Notes     : For each series of a country (indicator, source, sex, age) a bundle holds
+                latest    : latest year and value
+                series    : years and values (missing values are left out)
+                benchmarks: latest and series of the IADB, OECD and Global rows of the same
+                            series (`regions`, computed by scl-profiles.py)
+            Bundles are built in worker processes; benchmarks are grouped once and
+                shared with the workers when they start
+            Each bundle has a digest of its input rows (and of the benchmarks), so only
+                countries whose rows changed are built again
+'''
+
+# Libraries
+#------------------------------------------------------------------------------
+import json
+import hashlib
+from concurrent.futures import ProcessPoolExecutor
+import pandas as pd
+
+# Bundle version: bundles of another version are always built again
+VERSION = 1
+SERIES  = ["indicator","source","sex","age"]
+
+# Series
+#------------------------------------------------------------------------------
+def _label(value):
+    return None if pd.isna(value) else value
+
+def _groups(data):
+    '''{(indicator, source, sex, age): (years, values)} of the non-missing values of `data`.'''
+    data    = data[data.value.notna()].sort_values(SERIES + ["year"], na_position = "first")
+    years   = data.year.to_numpy().astype(int)
+    values  = data.value.to_numpy().astype(float)
+    indices = data.groupby(SERIES, dropna = False, observed = True, sort = True).indices
+    return {tuple(_label(value) for value in key): (years[index], values[index]) for key, index in indices.items()}
+
+def series(years, values):
+    '''{"latest": {"year", "value"}, "series": {"year": [...], "value": [...]}} of one series.'''
+    years  = years.tolist()
+    values = values.tolist()
+    return {"latest": {"year": years[-1], "value": values[-1]},
+            "series": {"year": years, "value": values}}
+
+def benchmarks(regions):
+    '''{(indicator, source, sex, age): {region: series}} of the region rows.'''
+    output = {}
+    for region, temp in regions.groupby("isoalpha3", observed = True):
+        for key, (years, values) in _groups(temp).items():
+            output.setdefault(key, {})[region] = series(years, values)
+    return output
+
+# Bundles
+#------------------------------------------------------------------------------
+def bundle(code, data, benchmarks):
+    '''Bundle (dict) of country `code` from its rows `data`.'''
+    indicators = []
+    for key, (years, values) in _groups(data).items():
+        item = dict(zip(SERIES, key))
+        item.update(series(years, values))
+        item["benchmarks"] = benchmarks.get(key, {})
+        indicators.append(item)
+    return {"isoalpha3": code, "version": VERSION, "indicators": indicators}
+
+def digests(data, extra = ""):
+    '''{isoalpha3: hash of its rows (in a stable order) and `extra`}.'''
+    data   = data.sort_values(["isoalpha3"] + SERIES + ["year"], na_position = "first")
+    rows   = pd.util.hash_pandas_object(data.astype(str), index = False).to_numpy()
+    output = {}
+    for code, index in data.groupby("isoalpha3", observed = True).indices.items():
+        hash_ = hashlib.sha256(f"{VERSION}:{extra}".encode())
+        hash_.update(rows[index].tobytes())
+        output[code] = hash_.hexdigest()
+    return output
+
+# Parallel build
+#------------------------------------------------------------------------------
+_benchmarks = {}
+
+def _init(benchmarks):
+    global _benchmarks
+    _benchmarks = benchmarks
+
+def _build(args):
+    code, data = args
+    return code, json.dumps(bundle(code, data, _benchmarks), separators = (",",":"), allow_nan = False)
+
+def build(data, countries, regions, manifest = None, workers = 4):
+    '''
+    Bundles of `countries` whose rows changed since `manifest` ({code: digest}).
+    `data` (countries) and `regions` (benchmarks, isoalpha3 is the region) have the
+    columns of indicators_health.
+    Returns ({code: JSON string} of the bundles built, new manifest).
+    '''
+    manifest = manifest or {}
+    data     = data[data.isoalpha3.isin(countries)]
+    groups   = dict(list(data.groupby("isoalpha3", observed = True)))
+
+    # Countries with new or changed rows
+    base    = ",".join(f"{code}:{value}" for code, value in sorted(digests(regions).items()))
+    hashes  = digests(data, base)
+    changed = [code for code, value in sorted(hashes.items()) if manifest.get(code) != value]
+    if len(changed) == 0:
+        return {}, hashes
+
+    shared = benchmarks(regions)
+    with ProcessPoolExecutor(max_workers = max(1, min(workers, len(changed))), initializer = _init, initargs = (shared,)) as pool:
+        bundles = dict(pool.map(_build, [(code, groups[code]) for code in changed]))
+    return bundles, hashes
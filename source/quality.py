@@ -0,0 +1,224 @@
+'''
+Program   : Data-quality gate of the processed datasets
+Source    : Multiple
+Dependency: SCL-SPH
+Repository: indicators_health_secondary_data
+            https://github.com/BID-DATA/indicators_health_secondary_data
+Objective : Check the output of a script against declared rules before it is exported
+Notes     : Rules
+                Unique  : one row per value of the key columns
+                NotNull : no missing values, e.g. codes left empty by a merge
+                Range   : values within [low, high]; Finite: no inf (e.g. division by zero)
+                Coverage: a row for every country of `codes` and year of the data,
+                          optionally within groups (e.g. by source)
+            Columns are factorized once and shared by all rules, so all rules are one
+                pass of integer array operations
+            Rules with severity "error" stop the script (QualityError) before the export,
+                rules with severity "warning" are only reported
+            One JSON report per run in ~/.cache/indicators_health/quality (env variable `sclquality`)
+'''
+
+# Libraries
+#------------------------------------------------------------------------------
+import os
+import json
+import time
+from dataclasses import dataclass, field
+import numpy as np
+import pandas as pd
+
+EXAMPLES = 5
+
+def quality_path():
+    return os.environ.get("sclquality") or os.path.expanduser("~/.cache/indicators_health/quality")
+
+class QualityError(ValueError):
+    '''Raised when a rule with severity "error" fails.'''
+
+# Columns
+#------------------------------------------------------------------------------
+class Columns:
+    '''Integer codes of the columns of `data`, computed once per column.'''
+
+    def __init__(self, data):
+        self.data  = data
+        self.codes = {}
+
+    def __call__(self, name):
+        '''(codes, labels) of column `name`; missing values get code -1.'''
+        if name not in self.codes:
+            values = self.data[name]
+            if isinstance(values.dtype, pd.CategoricalDtype):
+                self.codes[name] = (values.cat.codes.to_numpy(), values.cat.categories)
+            else:
+                self.codes[name] = pd.factorize(values, use_na_sentinel = True)
+        return self.codes[name]
+
+    def key(self, names, dropna = True):
+        '''
+        (key, size): one int64 code in [0, size) per row for the combination of `names`.
+        With dropna, rows with a missing value get -1; otherwise missing is one more value.
+        '''
+        key     = np.zeros(len(self.data), dtype = np.int64)
+        size    = 1
+        missing = np.zeros(len(self.data), dtype = bool)
+        for name in names:
+            codes, labels = self(name)
+            if dropna:
+                missing |= codes < 0
+                key       = key * len(labels) + np.maximum(codes, 0)
+                size     *= max(len(labels), 1)
+            else:
+                key       = key * (len(labels) + 1) + (codes + 1)
+                size     *= len(labels) + 1
+
+            # Note: codes are made dense again only when combinations get too many
+            if size > 4 * len(self.data) + 2**20:
+                key, uniques = pd.factorize(key)
+                size         = len(uniques)
+        return np.where(missing, -1, key), size
+
+# Rules
+#------------------------------------------------------------------------------
+@dataclass
+class Unique:
+    '''One row per value of `columns` (missing values are one more value).'''
+    columns : list
+    severity: str = "error"
+
+    def failed(self, columns):
+        key, size = columns.key(self.columns, dropna = False)
+        counts    = np.bincount(key[key >= 0], minlength = size)
+        return (key >= 0) & (counts[np.maximum(key, 0)] > 1)
+
+@dataclass
+class NotNull:
+    '''No missing values in `columns`.'''
+    columns : list
+    severity: str = "error"
+
+    def failed(self, columns):
+        rows = np.zeros(len(columns.data), dtype = bool)
+        for name in self.columns:
+            rows |= columns(name)[0] < 0
+        return rows
+
+@dataclass
+class Range:
+    '''Non-missing values of `column` within [low, high].'''
+    column  : str
+    low     : float = -np.inf
+    high    : float = np.inf
+    severity: str   = "error"
+
+    def failed(self, columns):
+        values = columns.data[self.column].to_numpy(dtype = float, na_value = np.nan)
+        with np.errstate(invalid = "ignore"):
+            return (values < self.low) | (values > self.high)
+
+@dataclass
+class Finite:
+    '''No infinite values in `column`.'''
+    column  : str
+    severity: str = "error"
+
+    def failed(self, columns):
+        return np.isinf(columns.data[self.column].to_numpy(dtype = float, na_value = np.nan))
+
+@dataclass
+class Coverage:
+    '''
+    A row for every country of `codes` and every year of the data (within each group of `by`).
+    Failed items are the missing (group, country, year) combinations.
+    '''
+    code    : str
+    year    : str
+    codes   : set
+    by      : list = field(default_factory = list)
+    severity: str  = "warning"
+
+    def missing(self, columns):
+        '''(number, first EXAMPLES) of the missing (group, country, year) combinations.'''
+        codes_, labels_ = columns(self.code)
+        years_, years   = columns(self.year)
+        group_, groups  = columns.key(self.by) if self.by else (np.zeros(len(columns.data), dtype = np.int64), 1)
+        expected        = pd.Index(sorted(self.codes))
+        country_        = np.append(expected.get_indexer(labels_), -1)[codes_]
+
+        # Years of each group (any country) and countries present each year, as flat cells
+        keep    = (years_ >= 0) & (group_ >= 0)
+        member  = keep & (country_ >= 0)
+        n, m    = len(years), len(expected)
+        wanted  = np.zeros(groups * n, dtype = bool)
+        present = np.zeros(groups * m * n, dtype = bool)
+        wanted[group_[keep] * n + years_[keep]] = True
+        present[(group_[member] * m + country_[member]) * n + years_[member]] = True
+        gap     = np.argwhere(wanted.reshape(groups, 1, n) & ~present.reshape(groups, m, n))
+
+        # Labels of the groups of the examples, from their first row
+        items = []
+        for g, c, y in gap[:EXAMPLES]:
+            row = int(np.argmax(group_ == g))
+            items.append({**{name: _scalar(columns.data[name].iloc[row]) for name in self.by},
+                          self.code: expected[c], self.year: _scalar(years[y])})
+        return len(gap), items
+
+def _scalar(value):
+    return value.item() if isinstance(value, np.generic) else value
+
+def _records(data):
+    return data.astype(object).where(data.notna(), None).to_dict("records")
+
+def _columns(rule):
+    if isinstance(rule, Coverage):
+        return [rule.code, rule.year] + list(rule.by)
+    return list(rule.columns) if hasattr(rule, "columns") else [rule.column]
+
+# Gate
+#------------------------------------------------------------------------------
+def check(data, rules):
+    '''Results of `rules` over `data`: [{rule, columns, severity, failed, examples}].'''
+    columns = Columns(data)
+    results = []
+    for rule in rules:
+        if isinstance(rule, Coverage):
+            failed, examples = rule.missing(columns)
+        else:
+            rows     = rule.failed(columns)
+            failed   = int(rows.sum())
+            examples = _records(data[rows].head(EXAMPLES)) if failed else []
+        results.append({"rule"    : type(rule).__name__.lower(),
+                        "columns" : _columns(rule),
+                        "severity": rule.severity,
+                        "failed"  : failed,
+                        "examples": examples})
+    return results
+
+def gate(data, rules, stage, folder = None):
+    '''
+    Check `data` against `rules`, write the JSON report of `stage` and raise
+    QualityError if a rule with severity "error" failed. Returns the report.
+    '''
+    start   = time.perf_counter()
+    results = check(data, rules)
+    errors  = [item for item in results if item["failed"] and item["severity"] == "error"]
+    report  = {"stage"  : stage,
+               "checked": time.strftime("%Y%m%dT%H%M%S"),
+               "rows"   : int(len(data)),
+               "status" : "failed" if errors else "passed",
+               "wall_s" : time.perf_counter() - start,
+               "rules"  : results}
+
+    folder = folder or quality_path()
+    os.makedirs(folder, exist_ok = True)
+    path   = os.path.join(folder, f"{stage}-{report['checked']}.json")
+    with open(path + ".tmp", "w") as file:
+        json.dump(report, file, indent = 1, default = str)
+    os.replace(path + ".tmp", path)
+
+    for item in results:
+        if item["failed"]:
+            print(f"[quality] {item['severity']}: {item['rule']} {item['columns']} failed for {item['failed']} rows")
+    if errors:
+        raise QualityError(f"{stage}: {len(errors)} quality rules failed, export blocked (report: {path})")
+    return report
@@ -0,0 +1,94 @@
+'''
+Program   : Regional aggregation engine
+Source    : Multiple
+Dependency: SCL-SPH
+Repository: indicators_health_secondary_data
+            https://github.com/BID-DATA/indicators_health_secondary_data
+Objective : Compute the values of all regions (IADB, OECD, Global, ...) in one pass
+Notes     : Regions are given as a dict {region: list of country codes}, None means all rows
+            or as a country x region membership matrix (DataFrame of 0/1 indexed by code)
+            Country values are added up once per group, then all regions are computed
+                with one matrix product, so extra regions (subregions, income groups)
+                do not add another pass over the data
+            Aggregations: sum, mean (simple mean) and wmean (weighted mean, e.g. by population)
+            Missing values are skipped as in pandas groupby
+'''
+
+# Libraries
+#------------------------------------------------------------------------------
+import numpy as np
+import pandas as pd
+
+# Functions
+#------------------------------------------------------------------------------
+def membership(codes, regions):
+    '''
+    Country x region matrix of 0/1 for `codes`.
+    `regions` is a dict {region: list of codes or None (all codes)} or a membership DataFrame.
+    '''
+    codes = pd.Index(codes)
+    if isinstance(regions, pd.DataFrame):
+        return regions.reindex(codes).fillna(0).astype(np.int8)
+
+    matrix = {}
+    for region, members in regions.items():
+        matrix[region] = np.ones(len(codes), dtype = np.int8) if members is None else codes.isin(members).astype(np.int8)
+    return pd.DataFrame(matrix, index = codes)
+
+def aggregate(data, by, values, regions, code = "code", how = "mean", weight = None, label = "region"):
+    '''
+    Aggregate `values` of `data` by `by` for every region in `regions`.
+    how: "sum", "mean" or "wmean" (weighted by column `weight`).
+    Returns one row per (by, region) with at least one member row; the region name goes in `label`.
+    '''
+    if how not in ("sum","mean","wmean"):
+        raise ValueError(f"how must be sum, mean or wmean, got {how!r}")
+    if how == "wmean" and weight is None:
+        raise ValueError("how = 'wmean' requires a weight column")
+
+    # Index of groups and countries
+    group_ = data.groupby(by, sort = True, dropna = True, observed = True).ngroup().to_numpy()
+    keep   = group_ >= 0
+    _, first, group_ = np.unique(group_[keep], return_index = True, return_inverse = True)
+    country_, uniques = pd.factorize(data[code].to_numpy()[keep], use_na_sentinel = False)
+    matrix = membership(uniques, regions)
+
+    # Cell of each row: group x country
+    n_groups = len(first)
+    n_cells  = n_groups * len(uniques)
+    cell_    = group_ * len(uniques) + country_
+    M        = matrix.to_numpy(dtype = np.float64)
+
+    def by_region(weights):
+        '''Add `weights` by cell, then by region: groups x regions.'''
+        cells = np.bincount(cell_, weights = weights, minlength = n_cells)
+        return cells.reshape(n_groups, len(uniques)) @ M
+
+    # Rows per group x region
+    rows   = by_region(None)
+    result = {}
+    w      = data[weight].to_numpy(dtype = np.float64)[keep] if how == "wmean" else None
+    for value in values:
+        x     = data[value].to_numpy(dtype = np.float64)[keep]
+        valid = ~np.isnan(x)
+        if how == "wmean":
+            valid &= ~np.isnan(w)
+            total  = by_region(np.where(valid, x * w, 0.0))
+            count  = by_region(np.where(valid, w, 0.0))
+        else:
+            total  = by_region(np.where(valid, x, 0.0))
+            count  = by_region(valid.astype(np.float64))
+        if how == "sum":
+            result[value] = total
+        else:
+            with np.errstate(invalid = "ignore", divide = "ignore"):
+                result[value] = np.where(count > 0, total / count, np.nan)
+
+    # Long table of groups x regions
+    keys   = data.loc[keep, by].iloc[first].reset_index(drop = True)
+    r, g   = np.nonzero(rows.T > 0)
+    output = keys.iloc[g].reset_index(drop = True)
+    output[label] = matrix.columns.to_numpy()[r]
+    for value in values:
+        output[value] = result[value][g, r]
+    return output
@@ -10,117 +10,143 @@ Repository: indicators_health_secondary_data
 Objective : Create dataset with indicators for SCL country profile
 Notes     : Edit dictionary manually 
             First commit of dictionary used code, for further updates, manually
+            Only country rows (idgeo = country); the IADB, OECD and Global benchmarks are
+                computed by scl-profiles.py
+            Text columns are categoricals and recodes are lookups over their categories (master.py)
 '''
 
-# Libraries
+# Stage
 #------------------------------------------------------------------------------
-import io
-import os
-import boto3
-import dotenv
-import numpy as np
-import pandas as pd
-
-# Working environments
-#------------------------------------------------------------------------------
-dotenv.load_dotenv("/home/ec2-user/SageMaker/.env")
-sclbucket   = os.environ.get("sclbucket")
-scldatalake = os.environ.get("scldatalake")
+def main():
+    '''Build and export the master dataset indicators_health.'''
+    # Note: pandas, numpy and the helper modules are imported when the stage runs,
+    #       so the script can be imported without loading them (see pipeline.py)
+    from changes import publish_changes
+    from keys import load_keys
+    from master import concat, from_ghed, from_gho, from_haq, from_le
+    from metrics import Run
+    from quality import Coverage, Finite, NotNull, Unique, gate
+    from outputs import export, load
+    from storage import get_storage
+    from store import publish
+    from subset import get_subset
 
-# Resources and buckets
-#------------------------------------------------------------------------------
-s3        = boto3.client('s3')
-s3_       = boto3.resource("s3")
-s3_bucket = s3_.Bucket(sclbucket)
+    # Working environments
+    #--------------------------------------------------------------------------
+    # Note: S3 bucket `sclbucket` or local directory `sclstorage` (see storage.py),
+    #       the S3 client is created on first use
+    storage_ = get_storage()
 
-# IADB 26-LAC  keys 
-#------------------------------------------------------------------------------
-# Path 
-path       = "Geospatial Basemaps/Cartographic Boundary Files/keys"
-iadb       = pd.read_csv(f"s3://{sclbucket}/{path}/iadb-keys.csv")
-codes_iadb = iadb.isoalpha3.unique().tolist()
+    # Run metrics
+    #--------------------------------------------------------------------------
+    # Note: time, memory, rows and bytes of each step are saved as JSON (see metrics.py)
+    run_ = Run("scl-indicators")
 
+    # Subset run
+    # Note: countries, indicators and years of the env variables (see subset.py),
+    #       all of them if not set
+    subset_ = get_subset()
 
-# Import data 
-#------------------------------------------------------------------------------
-# WHO GHED
-path  = "International Organizations/World Health Organization (WHO)/"
-path += "Globoal Health Expenditure Database (GHED)"
-who_ghed = pd.read_csv(f"s3://{sclbucket}/{path}/GHED_data_processed.csv")
-
-# IHME HAQ
-path  = "International Organizations/Institute for Health Metrics and Evaluation (IHME)"
-path +="/Healthcare Access and Quality (HAQ) index/processed"
-ihme_haq = pd.read_csv(f"s3://{sclbucket}/{path}/haq.csv")
-
-# IHME LE
-path  = "International Organizations/Institute for Health Metrics and Evaluation (IHME)/"
-path += "Global Burden of Disease (GBD)/processed"
-ihme_le = pd.read_csv(f"s3://{sclbucket}/{path}/ihme-gbd-le-hale.csv")
-
-# WHO GHO 
-path    = "International Organizations/World Health Organization (WHO)/"
-path   += "Global Health Observatory (GHO)"
-who_gho = pd.read_csv(f"s3://{sclbucket}/{path}/who-gho-api.csv")
-
-# Preprocessing
-#------------------------------------------------------------------------------
-# WHO GHED
-who_ghed_ = who_ghed.copy()
-who_ghed_ = who_ghed_.drop(columns = ["country","var_name"])
-who_ghed_ = who_ghed_[who_ghed_.code.isin(codes_iadb)]
-who_ghed_ = who_ghed_.rename(columns = {"code":"isoalpha3","var_code":"indicator"})
-who_ghed_["iddate"] = "year"
-who_ghed_["source"] = "WHO GHED"
-who_ghed_["idgeo"]  = "country"
-
-# IHME LE-HALE
-ihme_le = ihme_le.drop(columns = ["location_name"])
-ihme_le = ihme_le[ihme_le.code.isin(codes_iadb)]
-ihme_le = ihme_le.rename(columns = {"measure_name":"indicator","sex_name":"sex","age_name":"age","val":"value","code":"isoalpha3"})
-ihme_le["iddate"] = "year"
-ihme_le["source"] = "IHME GBD"
-ihme_le["idgeo"]  = "country"
-ihme_le.indicator = ihme_le.indicator.replace({'Life expectancy at birth':"lexp",'Healthy Life Expectancy at birth':'hale'})
-
-# IHME HAQ 
-ihme_haq = ihme_haq.drop(columns = ["location_name"])
-ihme_haq = ihme_haq[ihme_haq.code.isin(codes_iadb)]
-ihme_haq = ihme_haq.rename(columns = {"code":"isoalpha3","indicator_name":"indicator","val":"value"})
-ihme_haq = ihme_haq[ihme_haq.indicator == "Healthcare Access and Quality Index"]
-ihme_haq["iddate"] = "year"
-ihme_haq["source"] = "IHME HAQ"
-ihme_haq["idgeo"]  = "country"
-ihme_haq.indicator = "HAQ" 
-
-# WHO GHO
-who_gho_ = who_gho.copy()
-who_gho_.GHO = who_gho_.GHO.str.lower()
-vars_    = ['mdg_0000000007','whs6_102','hwf_0001','wsh_sanitation_basic','ncd_bmi_25a','lbw_prevalence']
-vars_   += ['whs4_543','uhc_index_reported','uhc_sci_rmnch','finprotection_cata_tot_10_pop']
-who_gho_ = who_gho_[who_gho_.GHO.isin(vars_)]
-who_gho_.CATEGORY = who_gho_.CATEGORY.fillna("TOTL")
-who_gho_ = who_gho_[who_gho_.CATEGORY.isin(["BTSX","TOTL","BTSX-YEARS18-PLUS","MLE","FMLE"])]
-who_gho_.CATEGORY = who_gho_.CATEGORY.str.replace("BTSX-YEARS18-PLUS","BTSX")
-who_gho_["sex"] = np.where(who_gho_.CATEGORY == "FMLE","Female","")
-who_gho_["sex"] = np.where(who_gho_.CATEGORY == "MLE" ,"Male"  ,who_gho_["sex"])
-who_gho_["sex"] = np.where(who_gho_.CATEGORY == "TOTL","Both"  ,who_gho_["sex"])
-who_gho_["sex"] = np.where(who_gho_.CATEGORY == "BTSX","Both"  ,who_gho_["sex"])
-who_gho_ = who_gho_[["GHO","YEAR","COUNTRY","sex","Numeric"]]
-who_gho_ = who_gho_.rename(columns = {"GHO":"indicator","YEAR":"year","COUNTRY":"isoalpha3","Numeric":"value"})
-who_gho_["iddate"] = "year"
-who_gho_["source"] = "WHO GHO"
-who_gho_["idgeo"]  = "country"
-who_gho_.indicator = who_gho_.indicator.str.lower()
-who_gho_ = who_gho_.drop_duplicates()
-
-# Append and export master data
-#------------------------------------------------------------------------------
-# Append
-health = pd.concat([who_ghed_, ihme_le, ihme_haq, who_gho_])
-health = health[["iddate","year","idgeo","isoalpha3","source","sex","age","indicator","value"]]
+    # IADB 26-LAC  keys 
+    #--------------------------------------------------------------------------
+    # Note: keys are downloaded only when they change in S3
+    run_.step("load keys")
+    keys_      = load_keys(storage_)
+    iadb       = keys_.iadb
+    codes_iadb = keys_.codes_iadb
+
+    # IADB countries of the subset
+    # Note: all of them if not a subset run, regions of the subset (e.g. IADB) are
+    #       replaced by their members
+    read_      = subset_.read_countries(keys_)
+    codes_     = codes_iadb if read_ is None else codes_iadb & read_
+
+    # Import data 
+    #--------------------------------------------------------------------------
+    # Note: with Parquet outputs only the rows and columns of interest are read,
+    #       in a subset run only its indicators and years
+    # WHO GHED
+    run_.step("import")
+    path  = "International Organizations/World Health Organization (WHO)/"
+    path += "Globoal Health Expenditure Database (GHED)"
+    filters_ = [("code","in",codes_)] + subset_.filters(indicator = "var_code", year = "year")
+    who_ghed = load(storage_.url(path), "GHED_data_processed", filters = filters_)
+
+    # IHME HAQ
+    path  = "International Organizations/Institute for Health Metrics and Evaluation (IHME)"
+    path +="/Healthcare Access and Quality (HAQ) index/processed"
+    filters_ = [("code","in",codes_),("indicator_name","==","Healthcare Access and Quality Index")]
+    filters_ += subset_.filters(indicator = "indicator_name", year = "year", codes = ["Healthcare Access and Quality Index"])
+    ihme_haq = load(storage_.url(path), "haq", filters = filters_)
+
+    # IHME LE
+    path  = "International Organizations/Institute for Health Metrics and Evaluation (IHME)/"
+    path += "Global Burden of Disease (GBD)/processed"
+    filters_ = [("code","in",codes_)] + subset_.filters(indicator = "measure_name", year = "year",
+                                                       codes = ["Life expectancy at birth","Healthy Life Expectancy at birth"])
+    ihme_le  = load(storage_.url(path), "ihme-gbd-le-hale", filters = filters_)
+
+    # WHO GHO 
+    path    = "International Organizations/World Health Organization (WHO)/"
+    path   += "Global Health Observatory (GHO)"
+    vars_   = ['MDG_0000000007','WHS6_102','HWF_0001','WSH_SANITATION_BASIC','NCD_BMI_25A','LBW_PREVALENCE']
+    vars_  += ['WHS4_543','UHC_INDEX_REPORTED','UHC_SCI_RMNCH','FINPROTECTION_CATA_TOT_10_POP']
+    cols_   = ["GHO","YEAR","COUNTRY","CATEGORY","Numeric"]
+    filters_  = [("GHO","in",subset_.wanted(vars_))]
+    filters_ += subset_.filters(country = "COUNTRY", year = "YEAR", countries = read_)
+    who_gho = load(storage_.url(path), "who-gho-api", columns = cols_, filters = filters_)
+    run_.rows(len(who_ghed) + len(ihme_haq) + len(ihme_le) + len(who_gho))
+
+    # Preprocessing
+    #--------------------------------------------------------------------------
+    # Note: constant columns are categoricals of one category, recodes are
+    #       lookup tables over the categories (see master.py)
+    # WHO GHED
+    run_.step("reshape", rows_in = len(who_ghed) + len(ihme_haq) + len(ihme_le) + len(who_gho))
+    who_ghed_ = from_ghed(who_ghed[who_ghed.code.isin(codes_)])
+
+    # IHME LE-HALE
+    ihme_le = from_le(ihme_le[ihme_le.code.isin(codes_)])
+
+    # IHME HAQ 
+    ihme_haq = from_haq(ihme_haq)
+
+    # WHO GHO
+    # Note: one category per sex (see master.py)
+    who_gho_ = from_gho(who_gho)
+
+    # Append and export master data
+    #--------------------------------------------------------------------------
+    # Append
+    # Note: categoricals of all sources are joined by the union of their categories
+    health = concat([who_ghed_, ihme_le, ihme_haq, who_gho_])
+
+    # Keep rows of the subset
+    health = subset_.apply(health, country = "isoalpha3", indicator = "indicator", year = "year", countries = read_)
+    run_.rows(health)
+
+    # Quality gate
+    # Note: the export is blocked if a rule with severity error fails (see quality.py)
+    # Note: one row per country, source, indicator, year, sex and age
+    run_.step("validate", rows_in = health)
+    rules_  = [NotNull(["isoalpha3","source","indicator","year"]), Unique(["isoalpha3","source","indicator","year","sex","age"])]
+    rules_ += [Finite("value"), Coverage("isoalpha3", "year", codes_, by = ["source"])]
+    gate(health, rules_, "scl-indicators")
+
+    # Export dataset
+    run_.step("export", rows_in = health)
+    path = "International Organizations/International Organizations Indicators/health"
+    export(health, storage_.url(path), "indicators_health", indicator = "indicator", year = "year", source = "source")
+
+    # Export query store
+    # Note: indexed SQLite copy for lookups by country, indicator and year (see store.py)
+    publish(health, storage_, f"{path}/indicators_health{subset_.suffix}.sqlite")
+
+    # Export delta since the last run
+    # Note: rows inserted, updated and deleted, by natural key (see changes.py)
+    publish_changes(health, storage_, path, "indicators_health", keys = ["source","isoalpha3","indicator","sex","age","year"])
+    run_.finish()
 
-# Export dataset
-path = "International Organizations/International Organizations Indicators/health"
-health.to_csv(pd.read_csv(f"s3://{sclbucket}/{path}/indicators_health.csv", index = False)
+if __name__ == "__main__":
+    main()
 #------------------------------------------------------------------------------
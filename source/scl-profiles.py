@@ -0,0 +1,148 @@
+'''
+Program   : Country-profile bundles
+Source    : indicators_health (scl-indicators.py) and the processed outputs of its sources
+Dependency: SCL-SPH
+Repository: indicators_health_secondary_data
+            https://github.com/BID-DATA/indicators_health_secondary_data
+Objective : Create one JSON bundle per IADB country for the SCL country profile
+Notes     : Bundles are written to health/profiles/{isoalpha3}.json
+            Each bundle has the latest value, time series and IADB/OECD/Global
+                benchmark of every indicator of the country (see profiles.py)
+            Benchmarks are not rows of indicators_health: GHED and LE benchmarks are the
+                region rows of their processed outputs, HAQ and GHO benchmarks are the
+                simple mean of the countries of each region
+            Only countries whose rows changed are built again (health/profiles/manifest.json)
+            Subset runs (subset.py) build the countries of the subset in health/profiles-dev,
+                with the same benchmarks as a full run
+'''
+
+# Libraries
+#------------------------------------------------------------------------------
+import json
+
+# Stage
+#------------------------------------------------------------------------------
+def main():
+    '''Build and export the country-profile bundles.'''
+    # Note: pandas, numpy and the helper modules are imported when the stage runs,
+    #       so the script can be imported without loading them (see pipeline.py)
+    from keys import load_keys
+    from master import concat, constant, from_ghed, from_gho, from_haq, from_le
+    from metrics import Run
+    from outputs import load
+    from profiles import VERSION, build
+    from quality import Unique, gate
+    from regions import aggregate
+    from storage import get_storage
+    from subset import get_subset
+
+    # Working environments
+    #--------------------------------------------------------------------------
+    # Note: S3 bucket `sclbucket` or local directory `sclstorage` (see storage.py),
+    #       the S3 client is created on first use
+    storage_ = get_storage()
+
+    # Run metrics
+    #--------------------------------------------------------------------------
+    # Note: time, memory, rows and bytes of each step are saved as JSON (see metrics.py)
+    run_ = Run("scl-profiles")
+
+    # IADB 26-LAC  keys
+    #--------------------------------------------------------------------------
+    run_.step("load keys")
+    keys_      = load_keys(storage_)
+    codes_iadb = keys_.codes_iadb
+
+    # Subset run
+    # Note: only the IADB countries of the subset (regions stand for their members),
+    #       all of them if not set
+    subset_    = get_subset()
+    read_      = subset_.read_countries(keys_)
+    codes_iadb = codes_iadb if read_ is None else codes_iadb & read_
+
+    # Regions used as benchmarks
+    regions_ = {"IADB":keys_.codes_iadb, "OECD":keys_.codes_oecd, "Global":None}
+
+    # Import data
+    #--------------------------------------------------------------------------
+    run_.step("import")
+    path   = "International Organizations/International Organizations Indicators/health"
+    health = load(storage_.url(path), "indicators_health", filters = [("isoalpha3","in",codes_iadb)])
+
+    # WHO GHED and IHME LE: region rows
+    ghed_  = "International Organizations/World Health Organization (WHO)/"
+    ghed_ += "Globoal Health Expenditure Database (GHED)"
+    who_ghed = load(storage_.url(ghed_), "GHED_data_processed", filters = [("code","in",list(regions_))])
+    le_    = "International Organizations/Institute for Health Metrics and Evaluation (IHME)/"
+    le_   += "Global Burden of Disease (GBD)/processed"
+    ihme_le  = load(storage_.url(le_), "ihme-gbd-le-hale", filters = [("code","in",list(regions_))])
+
+    # IHME HAQ and WHO GHO: all countries
+    # Note: also in a subset run, so benchmarks are the same as in a full run (see subset.py)
+    haq_   = "International Organizations/Institute for Health Metrics and Evaluation (IHME)"
+    haq_  += "/Healthcare Access and Quality (HAQ) index/processed"
+    filters_ = [("indicator_name","==","Healthcare Access and Quality Index")] + subset_.filters(year = "year")
+    ihme_haq = load(storage_.url(haq_), "haq", filters = filters_)
+    gho_   = "International Organizations/World Health Organization (WHO)/"
+    gho_  += "Global Health Observatory (GHO)"
+    filters_ = subset_.filters(year = "YEAR")
+    who_gho  = load(storage_.url(gho_), "who-gho-api", columns = ["GHO","YEAR","COUNTRY","CATEGORY","Numeric"], filters = filters_)
+    run_.rows(len(health) + len(who_ghed) + len(ihme_le) + len(ihme_haq) + len(who_gho))
+
+    # Benchmarks
+    #--------------------------------------------------------------------------
+    # Note: rows of indicators_health with isoalpha3 = IADB, OECD or Global
+    run_.step("benchmarks", rows_in = len(who_ghed) + len(ihme_le) + len(ihme_haq) + len(who_gho))
+    ihme_haq = from_haq(ihme_haq)
+    group_   = [aggregate(ihme_haq, ["indicator","source","iddate","year"], ["value"], regions_, code = "isoalpha3", how = "mean")]
+    who_gho  = from_gho(who_gho)
+    who_gho  = who_gho[keys_.member(who_gho.isoalpha3, "World")]
+    # Note: two totals of a country and year (a code not in GHO_TOTAL, see master.py)
+    #       block the benchmarks instead of entering the mean twice
+    gate(who_gho, [Unique(["indicator","year","isoalpha3","sex"])], "scl-profiles")
+    group_  += [aggregate(who_gho, ["indicator","source","iddate","year","sex"], ["value"], regions_, code = "isoalpha3", how = "mean")]
+    group_   = [temp.rename(columns = {"region":"isoalpha3"}) for temp in group_]
+
+    regions  = concat([from_ghed(who_ghed), from_le(ihme_le)] + group_)
+    regions["idgeo"] = constant("region", len(regions))
+
+    # Keep indicators and years of the subset
+    # Note: every bundle has the IADB, OECD and Global benchmarks
+    regions  = subset_.apply(regions, indicator = "indicator", year = "year")
+    run_.rows(regions)
+
+    # Manifest of the last run
+    # Note: {isoalpha3: digest of the rows used to build its bundle}
+    folder_ = f"{path}/profiles{subset_.suffix}"
+    key     = f"{folder_}/manifest.json"
+    try:
+        manifest = json.loads(storage_.read(key))
+    except FileNotFoundError:
+        manifest = {}
+    if manifest.get("version") != VERSION:
+        manifest = {}
+
+    # Build bundles
+    #--------------------------------------------------------------------------
+    # Note: only countries with new or changed rows are built
+    run_.step("aggregate", rows_in = health)
+    bundles, digests = build(health, codes_iadb, regions, manifest.get("countries"), workers = 4)
+    run_.rows(len(bundles))
+
+    # Export bundles and manifest
+    #--------------------------------------------------------------------------
+    run_.step("export", rows_in = len(bundles))
+    for code, bundle in bundles.items():
+        storage_.write(f"{folder_}/{code}.json", bundle.encode(), content_type = "application/json")
+
+    # Remove bundles of countries without rows
+    for code in set(manifest.get("countries", {})) - set(digests):
+        storage_.delete(f"{folder_}/{code}.json")
+
+    print(f"{len(bundles)} of {len(digests)} country bundles built")
+    storage_.write(key, json.dumps({"version": VERSION, "countries": digests}, indent = 1).encode())
+    run_.finish()
+
+if __name__ == "__main__":
+    main()
+#------------------------------------------------------------------------------
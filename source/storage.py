@@ -0,0 +1,188 @@
+'''
+Program   : Storage backends
+Source    : Social Data Lake
+Dependency: SCL-SPH
+Repository: indicators_health_secondary_data
+            https://github.com/BID-DATA/indicators_health_secondary_data
+Objective : Read and write the Social Data Lake files through one interface, in S3 or on disk
+Notes     : S3Storage : bucket `sclbucket`, the boto3 client is created on first use
+            LocalStorage: directory with the same layout as the bucket, e.g. for tests,
+                benchmarks or container runs without S3 access
+            get_storage selects the backend: env variable `sclstorage` (a local directory)
+                if set, S3 otherwise; environment variables are loaded from ENV_FILE once
+            Keys are paths relative to the bucket or directory, e.g. KEYS_PATH/iadb-keys.csv
+            Missing keys raise FileNotFoundError in both backends
+'''
+
+# Libraries
+#------------------------------------------------------------------------------
+import os
+import shutil
+import functools
+import contextlib
+
+ENV_FILE = "/home/ec2-user/SageMaker/.env"
+
+# Working environment
+#------------------------------------------------------------------------------
+@functools.lru_cache(maxsize = None)
+def environment():
+    '''Load the environment variables of ENV_FILE (once per process).'''
+    try:
+        import dotenv
+    except ImportError:
+        return False
+    return dotenv.load_dotenv(ENV_FILE)
+
+# S3
+#------------------------------------------------------------------------------
+class S3Storage:
+    '''Objects of an S3 bucket.'''
+
+    def __init__(self, bucket):
+        self.bucket = bucket
+
+    def __repr__(self):
+        return f"S3Storage({self.bucket!r})"
+
+    def __eq__(self, other):
+        return isinstance(other, S3Storage) and other.bucket == self.bucket
+
+    def __hash__(self):
+        return hash(("s3", self.bucket))
+
+    @functools.cached_property
+    def client(self):
+        import boto3
+        return boto3.client("s3")
+
+    @contextlib.contextmanager
+    def _missing(self, key):
+        '''Raise FileNotFoundError for missing keys.'''
+        from botocore.exceptions import ClientError
+        try:
+            yield
+        except ClientError as error:
+            if error.response.get("Error", {}).get("Code") in ("404","NoSuchKey","NotFound"):
+                raise FileNotFoundError(self.url(key)) from error
+            raise
+
+    def url(self, key):
+        '''URL of `key` for pandas/pyarrow readers and writers.'''
+        return f"s3://{self.bucket}/{key}"
+
+    def etag(self, key):
+        with self._missing(key):
+            return self.client.head_object(Bucket = self.bucket, Key = key)["ETag"].strip('"')
+
+    def read(self, key):
+        '''Bytes of `key`.'''
+        with self._missing(key):
+            return self.client.get_object(Bucket = self.bucket, Key = key)["Body"].read()
+
+    def write(self, key, body, content_type = None):
+        extra = {"ContentType": content_type} if content_type else {}
+        self.client.put_object(Bucket = self.bucket, Key = key, Body = body, **extra)
+
+    def delete(self, key):
+        self.client.delete_object(Bucket = self.bucket, Key = key)
+
+    def download(self, key, path):
+        '''Copy `key` to the local file `path`.'''
+        with self._missing(key):
+            self.client.download_file(self.bucket, key, path)
+
+    def upload(self, path, key):
+        '''Copy the local file `path` to `key`.'''
+        self.client.upload_file(path, self.bucket, key)
+
+    def list(self, prefix):
+        '''Sorted (key, etag) of all objects under `prefix`.'''
+        items     = []
+        paginator = self.client.get_paginator("list_objects_v2")
+        for page in paginator.paginate(Bucket = self.bucket, Prefix = prefix):
+            items += [(obj["Key"], obj["ETag"].strip('"')) for obj in page.get("Contents", [])]
+        return sorted(items)
+
+# Local directory
+#------------------------------------------------------------------------------
+class LocalStorage:
+    '''Files of a local directory with the layout of the bucket.'''
+
+    def __init__(self, root):
+        self.root = os.path.abspath(os.path.expanduser(root))
+
+    def __repr__(self):
+        return f"LocalStorage({self.root!r})"
+
+    def __eq__(self, other):
+        return isinstance(other, LocalStorage) and other.root == self.root
+
+    def __hash__(self):
+        return hash(("local", self.root))
+
+    def url(self, key):
+        return os.path.join(self.root, key)
+
+    def etag(self, key):
+        '''Version of `key` from its modification time and size.'''
+        info = os.stat(self.url(key))
+        return f"{info.st_mtime_ns:x}-{info.st_size:x}"
+
+    def read(self, key):
+        with open(self.url(key), "rb") as file:
+            return file.read()
+
+    def write(self, key, body, content_type = None):
+        path = self.url(key)
+        os.makedirs(os.path.dirname(path), exist_ok = True)
+        with open(path + ".tmp", "wb") as file:
+            file.write(body)
+        os.replace(path + ".tmp", path)
+
+    def delete(self, key):
+        if os.path.exists(self.url(key)):
+            os.remove(self.url(key))
+
+    def download(self, key, path):
+        shutil.copyfile(self.url(key), path)
+
+    def upload(self, path, key):
+        os.makedirs(os.path.dirname(self.url(key)), exist_ok = True)
+        shutil.copyfile(path, self.url(key))
+
+    def list(self, prefix):
+        '''Sorted (key, etag) of all files whose key starts with `prefix`.'''
+        folder = os.path.dirname(self.url(prefix))
+        items  = []
+        for path, _, files in os.walk(folder):
+            for name in files:
+                key = os.path.relpath(os.path.join(path, name), self.root).replace(os.sep, "/")
+                if key.startswith(prefix):
+                    items.append((key, self.etag(key)))
+        return sorted(items)
+
+# Backend
+#------------------------------------------------------------------------------
+def as_storage(value = None):
+    '''Storage of `value`: a storage, a bucket name, or None (get_storage()).'''
+    if value is None:
+        return get_storage()
+    if isinstance(value, str):
+        return S3Storage(value)
+    return value
+
+@functools.lru_cache(maxsize = None)
+def get_storage(location = None):
+    '''
+    Storage of `location` (a local directory, or s3://bucket).
+    Default: env variable `sclstorage`, else the bucket of env variable `sclbucket`.
+    '''
+    environment()
+    location = location or os.environ.get("sclstorage")
+    if location and not location.startswith("s3://"):
+        return LocalStorage(location)
+    bucket = location[len("s3://"):].strip("/") if location else os.environ.get("sclbucket")
+    if not bucket:
+        raise ValueError("No storage: set the env variable `sclstorage` (local directory) or `sclbucket`")
+    return S3Storage(bucket)
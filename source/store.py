@@ -0,0 +1,161 @@
+'''
+Program   : Query store of the master health dataset
+Source    : indicators_health (scl-indicators.py)
+Dependency: SCL-SPH
+Repository: indicators_health_secondary_data
+            https://github.com/BID-DATA/indicators_health_secondary_data
+Objective : Publish indicators_health as an indexed SQLite file and query it without parsing the CSV
+Notes     : The store is one SQLite file, indicators_health.sqlite, next to indicators_health.csv
+            Indexes: (isoalpha3, indicator, year) for country lookups
+                     (indicator, year) for lookups across countries
+            Readers keep a local copy, downloaded again only when the S3 ETag changes
+            Default location: ~/.cache/indicators_health/store (env variable `storecache`)
+            Usage:
+                store = open_store()
+                store.query(isoalpha3 = "ARG", indicator = ["lexp","hale"], start = 2000)
+                store.latest(isoalpha3 = "ARG")
+'''
+
+# Libraries
+#------------------------------------------------------------------------------
+import os
+import sqlite3
+import tempfile
+import pandas as pd
+from keys import fetch
+from storage import as_storage
+
+# Paths and schema
+#------------------------------------------------------------------------------
+STORE_KEY = "International Organizations/International Organizations Indicators/health/indicators_health.sqlite"
+TABLE     = "indicators_health"
+COLUMNS   = {"iddate"   : "TEXT",
+             "year"     : "INTEGER",
+             "idgeo"    : "TEXT",
+             "isoalpha3": "TEXT",
+             "source"   : "TEXT",
+             "sex"      : "TEXT",
+             "age"      : "TEXT",
+             "indicator": "TEXT",
+             "value"    : "REAL"}
+INDEXES   = {"idx_country"  : ["isoalpha3","indicator","year"],
+             "idx_indicator": ["indicator","year"]}
+
+def cache_path():
+    return os.environ.get("storecache") or os.path.expanduser("~/.cache/indicators_health/store")
+
+# Build and publish
+#------------------------------------------------------------------------------
+def build(data, path):
+    '''Write `data` (columns of COLUMNS) to the SQLite file `path`, replacing it.'''
+    data = data[list(COLUMNS)]
+    data = data.astype(object).where(data.notna(), None)
+
+    temp = path + ".tmp"
+    if os.path.exists(temp):
+        os.remove(temp)
+    con = sqlite3.connect(temp)
+    try:
+        con.execute("PRAGMA journal_mode = OFF")
+        con.execute("PRAGMA synchronous = OFF")
+        con.execute(f"CREATE TABLE {TABLE} ({', '.join(f'{name} {type_}' for name, type_ in COLUMNS.items())})")
+        con.executemany(f"INSERT INTO {TABLE} VALUES ({', '.join('?' * len(COLUMNS))})",
+                        data.itertuples(index = False, name = None))
+
+        # Indexes after the insert, then statistics for the query planner
+        for name, columns in INDEXES.items():
+            con.execute(f"CREATE INDEX {name} ON {TABLE} ({', '.join(columns)})")
+        con.execute("ANALYZE")
+        con.commit()
+    finally:
+        con.close()
+    os.replace(temp, path)
+    return path
+
+def publish(data, storage = None, key = STORE_KEY):
+    '''Build the store of `data` and upload it to `key` of `storage` (storage.py).'''
+    storage = as_storage(storage)
+    with tempfile.TemporaryDirectory() as folder:
+        path = build(data, os.path.join(folder, os.path.basename(key)))
+        storage.upload(path, key)
+
+# Queries
+#------------------------------------------------------------------------------
+def _condition(column, value, params):
+    '''SQL condition for `column` equal to `value` (a scalar or a list of values).'''
+    if isinstance(value, (list, tuple, set, frozenset, pd.Index, pd.Series)):
+        value = list(value)
+        params.extend(value)
+        return f"{column} IN ({', '.join('?' * len(value))})"
+    params.append(value)
+    return f"{column} = ?"
+
+class Store:
+    '''Read-only queries over an indicators_health SQLite file.'''
+
+    def __init__(self, path):
+        self.path = path
+        self.con  = sqlite3.connect(f"file:{path}?mode=ro", uri = True, check_same_thread = False)
+
+    def close(self):
+        self.con.close()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *args):
+        self.close()
+
+    def _where(self, isoalpha3 = None, indicator = None, start = None, end = None, **columns):
+        # Note: column names are written into the SQL, so only columns of the table are accepted
+        unknown = [column for column in columns if column not in COLUMNS]
+        if unknown:
+            raise ValueError(f"Unknown columns {unknown}, expected some of {list(COLUMNS)}")
+        params     = []
+        conditions = []
+        for column, value in [("isoalpha3", isoalpha3), ("indicator", indicator)] + list(columns.items()):
+            if value is not None:
+                conditions.append(_condition(column, value, params))
+        if start is not None:
+            conditions.append("year >= ?")
+            params.append(int(start))
+        if end is not None:
+            conditions.append("year <= ?")
+            params.append(int(end))
+        return (" WHERE " + " AND ".join(conditions) if conditions else ""), params
+
+    def query(self, isoalpha3 = None, indicator = None, start = None, end = None, **columns):
+        '''
+        Rows of `isoalpha3` and `indicator` (scalars or lists) with year in [start, end].
+        Other columns (source, sex, age) can be given as keyword arguments.
+        '''
+        where, params = self._where(isoalpha3, indicator, start, end, **columns)
+        sql = f"SELECT * FROM {TABLE}{where} ORDER BY isoalpha3, indicator, year"
+        return pd.read_sql_query(sql, self.con, params = params)
+
+    def latest(self, isoalpha3 = None, indicator = None, start = None, end = None, **columns):
+        '''
+        Latest non-missing value of each country, indicator, source, sex and age,
+        with the same arguments as `query`.
+        '''
+        where, params = self._where(isoalpha3, indicator, start, end, **columns)
+        where = (where + " AND " if where else " WHERE ") + "value IS NOT NULL"
+        sql   = f'''
+            SELECT {", ".join(COLUMNS)} FROM (
+                SELECT *, MAX(year) OVER (PARTITION BY isoalpha3, indicator, source, sex, age) AS year_max
+                FROM {TABLE}{where})
+            WHERE year = year_max
+            ORDER BY isoalpha3, indicator'''
+        return pd.read_sql_query(sql, self.con, params = params)
+
+    def indicators(self):
+        '''Indicators in the store, with their source.'''
+        sql = f"SELECT DISTINCT source, indicator FROM {TABLE} ORDER BY source, indicator"
+        return pd.read_sql_query(sql, self.con)
+
+def open_store(storage = None, key = STORE_KEY, folder = None):
+    '''Store of `key` of `storage` (storage.py), read from the local copy when up to date.'''
+    storage = as_storage(storage)
+    folder  = folder or cache_path()
+    os.makedirs(folder, exist_ok = True)
+    return Store(fetch(storage, key, folder))
@@ -0,0 +1,163 @@
+'''
+Program   : Subset runs ("dev mode") of the preprocessing scripts
+Source    : Multiple
+Dependency: SCL-SPH
+Repository: indicators_health_secondary_data
+            https://github.com/BID-DATA/indicators_health_secondary_data
+Objective : Run a script for some countries, indicators and years, filtering at the reads
+Notes     : Subset from the env variables (or pipeline.py --countries --indicators --years)
+                sclcountries : isoalpha3 codes and/or regions, e.g. ARG,BRA or IADB
+                sclindicators: codes of the indicator column of each output, e.g.
+                               WHS6_102,gghed_che,lexp (case-insensitive)
+                sclyears     : first and last year, e.g. 2000-2019, 2010- or 2015
+            Output is the same slice of a full run: indicators and years are filtered while
+                reading, countries at the end
+            Regions of the subset (e.g. IADB) stand for their members (`read_countries`)
+            Every country bundle has the IADB, OECD and Global benchmarks, so they are the
+                same in all runs: who-ghed and ihme-le compute their region rows from all
+                countries and always keep them (`output_countries`), and the outputs
+                without region rows (GHO, HAQ) keep all countries for scl-profiles
+            Indicators of the master dataset are also matched by the name of their source
+                indicator (ALIASES), e.g. lexp selects "Life expectancy at birth"
+            Outputs of a subset run are named {name}-dev (see outputs.py), so the outputs
+                of a full run are never overwritten, and no deltas are published
+            Each -dev output records its subset in {name}-dev.subset.json, and reading a
+                -dev output of another subset raises ValueError
+'''
+
+# Libraries
+#------------------------------------------------------------------------------
+import os
+from dataclasses import dataclass
+
+REGIONS = ("IADB","OECD","Global")
+SUBSET  = object()
+ALIASES = {"lexp": "Life expectancy at birth",
+           "hale": "Healthy Life Expectancy at birth",
+           "haq" : "Healthcare Access and Quality Index"}
+
+def _codes(value):
+    return frozenset(item.strip() for item in value.split(",") if item.strip()) if value else None
+
+def _years(value):
+    '''(start, end) of "2000-2019", "2010-", "-2015" or "2015"; None for open ends.'''
+    if not value:
+        return None, None
+    start, sep, end = value.partition("-")
+    start = int(start) if start.strip() else None
+    end   = (int(end) if end.strip() else None) if sep else start
+    return start, end
+
+# Subset
+#------------------------------------------------------------------------------
+@dataclass(frozen = True)
+class Subset:
+    '''Countries (or regions), indicators and years of a run; None is all.'''
+    countries : frozenset = None
+    indicators: frozenset = None
+    start     : int       = None
+    end       : int       = None
+
+    @property
+    def active(self):
+        return any(value is not None for value in (self.countries, self.indicators, self.start, self.end))
+
+    @property
+    def suffix(self):
+        '''Suffix of the outputs of a subset run.'''
+        return "-dev" if self.active else ""
+
+    def describe(self):
+        '''Countries, indicators (lower case) and years of the subset, as a JSON-ready dict.'''
+        return {"countries" : None if self.countries is None else sorted(self.countries),
+                "indicators": None if self.indicators is None else sorted({name.lower() for name in self.indicators}),
+                "start"     : self.start,
+                "end"       : self.end}
+
+    # Countries
+    def read_countries(self, keys):
+        '''
+        Countries of the subset with the members of its regions (and the region codes);
+        None (all) with Global or no subset.
+        '''
+        if self.countries is None or "Global" in self.countries:
+            return None
+        codes = set(self.countries)
+        if "IADB" in codes:
+            codes |= keys.codes_iadb
+        if "OECD" in codes:
+            codes |= keys.codes_oecd
+        return codes
+
+    def output_countries(self, keys):
+        '''Codes kept in an output with region rows: read_countries and REGIONS; None is all.'''
+        codes = self.read_countries(keys)
+        return None if codes is None else codes | set(REGIONS)
+
+    def within(self, codes):
+        '''`codes` (e.g. the IADB countries of a coverage rule) that are in the subset.'''
+        return set(codes) if self.countries is None else set(codes) & self.countries
+
+    # Indicators
+    def names(self):
+        '''Lower-case names of the indicators of the subset and of their aliases.'''
+        names    = {name.lower() for name in self.indicators}
+        aliases_ = {code: name.lower() for code, name in ALIASES.items()}
+        names   |= {aliases_[name] for name in names if name in aliases_}
+        names   |= {code for code, name in aliases_.items() if name in names}
+        return names
+
+    def wants(self, code):
+        '''Whether indicator `code` is in the subset (case-insensitive).'''
+        return self.indicators is None or str(code).lower() in self.names()
+
+    def wanted(self, codes):
+        '''`codes` in the subset, in their order.'''
+        return [code for code in codes if self.wants(code)]
+
+    # Rows
+    def mask(self, data, country = None, indicator = None, year = None, countries = SUBSET):
+        '''
+        Boolean array of the rows of `data` in the subset, for the given columns.
+        `countries` replaces the countries of the subset (e.g. read_countries, None is all).
+        '''
+        import numpy as np
+        rows      = np.ones(len(data), dtype = bool)
+        countries = self.countries if countries is SUBSET else countries
+        if country and countries is not None:
+            rows &= data[country].isin(countries).to_numpy(dtype = bool)
+        if indicator and self.indicators is not None:
+            rows &= data[indicator].astype(str).str.lower().isin(self.names()).to_numpy(dtype = bool)
+        if year and self.start is not None:
+            rows &= (data[year] >= self.start).to_numpy(dtype = bool)
+        if year and self.end is not None:
+            rows &= (data[year] <= self.end).to_numpy(dtype = bool)
+        return rows
+
+    def apply(self, data, country = None, indicator = None, year = None, countries = SUBSET):
+        '''Rows of `data` in the subset (see mask).'''
+        if not self.active:
+            return data
+        return data[self.mask(data, country, indicator, year, countries)]
+
+    def filters(self, country = None, indicator = None, year = None, countries = SUBSET, codes = None):
+        '''
+        pyarrow-style filters (see outputs.load) of the subset. Indicators are matched
+        against `codes` if given, otherwise by their lower-case names and aliases.
+        '''
+        output    = []
+        countries = self.countries if countries is SUBSET else countries
+        if country and countries is not None:
+            output.append((country, "in", sorted(countries)))
+        if indicator and self.indicators is not None:
+            output.append((indicator, "in", self.wanted(codes) if codes is not None else sorted(self.names())))
+        if year and self.start is not None:
+            output.append((year, ">=", self.start))
+        if year and self.end is not None:
+            output.append((year, "<=", self.end))
+        return output
+
+def get_subset():
+    '''Subset of the env variables sclcountries, sclindicators and sclyears.'''
+    start, end = _years(os.environ.get("sclyears"))
+    return Subset(_codes(os.environ.get("sclcountries")), _codes(os.environ.get("sclindicators")), start, end)
@@ -0,0 +1,66 @@
+'''
+Program   : Vintages of the raw collections
+Source    : IHME GHDx / GBD Results, WHO GHED
+Dependency: SCL-SPH
+Repository: indicators_health_secondary_data
+            https://github.com/BID-DATA/indicators_health_secondary_data
+Objective : Find every vintage and part of a raw collection, read them concurrently and
+            keep the newest vintage of each row
+Notes     : Files are listed under a prefix of the storage (storage.py) and matched with a
+                regular expression; the group `vintage` names the release, e.g.
+                    haq_1990_2016_scaled.csv   -> 1990_2016
+                    ihme-gbd-le-2021-1.csv     -> 2021 (part 1)
+                    GHED_data_raw.xlsx         -> none (older than any named vintage)
+            Vintages are ordered by the numbers in their name
+            When the same row (e.g. location, year and measure) is in more than one
+                vintage, the row of the newest vintage is kept
+            A new release or extract part only needs to be uploaded with a matching name
+'''
+
+# Libraries
+#------------------------------------------------------------------------------
+import re
+from concurrent.futures import ThreadPoolExecutor
+import pandas as pd
+
+# Functions
+#------------------------------------------------------------------------------
+def _order(vintage):
+    '''Sort key of a vintage: its numbers, e.g. 1990_2016 -> (1990, 2016); none is oldest.'''
+    return tuple(int(number) for number in re.findall(r"\d+", vintage or ""))
+
+def discover(storage, prefix, pattern):
+    '''
+    [(vintage, key)] of the objects under `prefix` whose name (after `prefix`)
+    matches `pattern`, oldest vintage first and in key order within a vintage.
+    '''
+    pattern = re.compile(pattern)
+    files   = []
+    for key, _ in storage.list(prefix):
+        match = pattern.fullmatch(key[len(prefix):])
+        if match:
+            files.append((match.groupdict().get("vintage"), key))
+    if len(files) == 0:
+        raise FileNotFoundError(f"No files matching {pattern.pattern} under {prefix}")
+    return sorted(files, key = lambda item: (_order(item[0]), item[1]))
+
+def read_all(read, keys, workers = 6):
+    '''[read(key) for key in keys], read concurrently.'''
+    with ThreadPoolExecutor(max_workers = max(1, min(workers, len(keys)))) as pool:
+        return list(pool.map(read, keys))
+
+def newest(frames, vintages, on, concat = pd.concat):
+    '''
+    Rows of `frames` (one per file, with its vintage in `vintages`), keeping for each
+    value of the columns `on` the row of the newest vintage.
+    `concat` joins a list of frames, e.g. to keep categoricals.
+    '''
+    ranks = [_order(vintage) for vintage in vintages]
+    if len(set(ranks)) == 1:
+        return concat(list(frames))
+
+    # Newest vintage first (parts of a vintage keep their order), then first row of each key
+    order = sorted(range(len(frames)), key = lambda k: ranks[k], reverse = True)
+    data  = concat([frames[k] for k in order])
+    data  = data.reset_index(drop = True)
+    return data[~data.duplicated(subset = on, keep = "first")].reset_index(drop = True)
@@ -12,139 +12,167 @@ Objective : Proprocess indicators of interest
 Notes     : Download data manually
                 Only upload the most recent year
                 Check for recent data at least once a year
-                Update code to read all available datasets in the collection
-                Update code to merge all available datasets per source
+                All workbooks GHED_data_raw[_{year}].xlsx are read, the newest wins for
+                    each country and year (vintages.py)
             Upload it to the Social Data Lake 
                 https://scldata.iadb.org/app?locale=es
                 International Organizations/World Health Organization (WHO)
             Rerun notebook
 '''
 
-# Libraries
+# Stage
 #------------------------------------------------------------------------------
-import io
-import os
-import boto3
-import dotenv
-import numpy as np
-import pandas as pd
-
-# Working environments
-#------------------------------------------------------------------------------
-dotenv.load_dotenv("/home/ec2-user/SageMaker/.env")
-sclbucket   = os.environ.get("sclbucket")
-scldatalake = os.environ.get("scldatalake")
-
-# Resources and buckets
-#------------------------------------------------------------------------------
-s3        = boto3.client('s3')
-s3_       = boto3.resource("s3")
-s3_bucket = s3_.Bucket(sclbucket)
-
-# Country keys 
-#------------------------------------------------------------------------------
-# Path 
-path = "Geospatial Basemaps/Cartographic Boundary Files/keys"
-
-# IADB 26-LAC countries
-iadb       = pd.read_csv(f"s3://{sclbucket}/{path}/iadb-keys.csv")
-codes_iadb = iadb.isoalpha3.unique().tolist()
+def main():
+    '''Preprocess the GHED workbooks and export GHED_data_processed.'''
+    # Note: pandas, numpy and the helper modules are imported when the stage runs,
+    #       so the script can be imported without loading them (see pipeline.py)
+    import pandas as pd
+    from changes import publish_changes
+    from ghed_derived import DERIVED, derive, names
+    from ghed_workbook import load_workbook
+    from keys import load_keys
+    from metrics import Run
+    from outputs import export
+    from quality import Coverage, Finite, NotNull, Unique, gate
+    from regions import aggregate
+    from storage import get_storage
+    from subset import get_subset
+    from vintages import discover, newest, read_all
+
+    # Working environments
+    #--------------------------------------------------------------------------
+    # Note: S3 bucket `sclbucket` or local directory `sclstorage` (see storage.py),
+    #       the S3 client is created on first use
+    storage_ = get_storage()
+
+    # Run metrics
+    #--------------------------------------------------------------------------
+    # Note: time, memory, rows and bytes of each step are saved as JSON (see metrics.py)
+    run_ = Run("who-ghed")
+
+    # Subset run
+    # Note: countries, indicators and years of the env variables (see subset.py),
+    #       all of them if not set
+    subset_ = get_subset()
+
+    # Country keys 
+    #--------------------------------------------------------------------------
+    # Note: keys are downloaded only when they change in S3
+    run_.step("load keys")
+    keys_ = load_keys(storage_)
+
+    # IADB 26-LAC countries
+    iadb       = keys_.iadb
+    codes_iadb = keys_.codes_iadb
+
+    # OECD countries
+    oecd       = keys_.oecd
+    codes_oecd = keys_.codes_oecd
+
+    # Import data and dictionary
+    #--------------------------------------------------------------------------
+    # Define variables of interest
+    run_.step("import")
+    vars_   = ["country","code","year","che_usd","gdp_usd","gdp_ppp","pop"]
+    govment = ["gghed","gghed_usd","gghed_ppp2020","gghed_usd2020_pc","gghed_ppp2020_pc","gghed_gdp"]
+    oop     = ["hf3"  ,"hf3_usd"  ,"hf3_ppp2020"  ,"hf3_usd2020_pc"  ,"hf3_ppp2020_pc"  ,"hf3_gdp"  ]
+    private = ["hf2"  ,"hf2_usd"  ,"hf2_ppp2020"  ,"hf2_usd2020_pc"  ,"hf2_ppp2020_pc"  ,"hf2_gdp"  ]
+    vars_  += govment + oop + private
+
+    # Derived indicators of the subset and the variables they need
+    # Note: gdp_usd is always read, rows without it are dropped
+    ratios_ = {code: ratio for code, ratio in DERIVED.items() if subset_.wants(code)}
+    needs_  = {name for ratio in ratios_.values() for name in (ratio.numerator, *ratio.denominator)}
+    vars_   = [name for name in vars_ if name in ["country","code","year","gdp_usd"] or name in needs_ or subset_.wants(name)]
+
+    # Read both sheets of each workbook in one pass, only variables of interest
+    # Note: repeat runs on the same workbook read the Parquet sidecar,
+    #       workbooks are read concurrently and GHED_data_raw.xlsx is the oldest
+    path          = "International Organizations/World Health Organization (WHO)/Globoal Health Expenditure Database (GHED)"
+    files_        = discover(storage_, f"{path}/", r"GHED_data_raw(_(?P<vintage>\d{4}))?\.xlsx")
+    vintage_      = [vintage for vintage, _ in files_]
+    sheets_       = read_all(lambda key: load_workbook(storage_, key, {"Data":vars_, "Codebook":["variable code","variable name"]}), [key for _, key in files_])
+    who_ghed      = newest([temp["Data"] for temp in sheets_], vintage_, on = ["code","year"])
+    who_ghed_dict = newest([temp["Codebook"] for temp in sheets_], vintage_, on = ["variable code"])
+    who_ghed_dict = who_ghed_dict.rename(columns = {"variable code":"var_code","variable name":"var_name"})
+    run_.rows(who_ghed)
+
+    # Preprocessing
+    #--------------------------------------------------------------------------
+    # Drop NAs rows
+    run_.step("filter", rows_in = who_ghed)
+    who_ghed = who_ghed[~who_ghed.gdp_usd.isna()]
+
+    # Keep years of the subset
+    # Note: all countries are kept to compute the regions (see subset.py)
+    who_ghed = subset_.apply(who_ghed, year = "year")
+    run_.rows(who_ghed)
+
+    # Define regions 
+    regions_ = {"IADB":codes_iadb, "OECD":codes_oecd, "Global":None}
+
+    # Create group values
+    # Note: all regions are computed in one pass
+    run_.step("aggregate", rows_in = who_ghed)
+    vars_  = [name for name in vars_ if name not in ["country","code","year"]]
+    temp_  = aggregate(who_ghed, ["year"], vars_, regions_, how = "sum")
 
-# OECD countries
-oecd       = pd.read_csv(f"s3://{sclbucket}/{path}/oecd-keys.csv") 
-codes_oecd = oecd.isoalpha3.unique().tolist()
+    # Add lables
+    temp_["country"] = temp_.region
+    temp_["code"]    = temp_.region
+    temp_            = temp_.drop(columns = "region")
 
-# Import data and dictionary
-#------------------------------------------------------------------------------
-path          = "International Organizations/World Health Organization (WHO)/Globoal Health Expenditure Database (GHED)/GHED_data_raw.xlsx"
-obj           = s3.get_object(Bucket = sclbucket, Key = path)
-excel_data    = obj['Body'].read()
-excel_file    = io.BytesIO(excel_data)
-who_ghed      = pd.read_excel(excel_file, engine = "openpyxl", sheet_name = "Data")
-who_ghed_dict = pd.read_excel(excel_file, engine = "openpyxl", sheet_name = "Codebook")
-who_ghed_dict = who_ghed_dict.rename(columns = {"variable code":"var_code","variable name":"var_name"})
-
-# Preprocessing
-#------------------------------------------------------------------------------
-# Define variables of interest
-vars_   = ["country","code","year","che_usd","gdp_usd","gdp_ppp","pop"]
-govment = ["gghed","gghed_usd","gghed_ppp2020","gghed_usd2020_pc","gghed_ppp2020_pc","gghed_gdp"]
-oop     = ["hf3"  ,"hf3_usd"  ,"hf3_ppp2020"  ,"hf3_usd2020_pc"  ,"hf3_ppp2020_pc"  ,"hf3_gdp"  ]
-private = ["hf2"  ,"hf2_usd"  ,"hf2_ppp2020"  ,"hf2_usd2020_pc"  ,"hf2_ppp2020_pc"  ,"hf2_gdp"  ]
-vars_  += govment + oop + private
-
-# Select variables of interest
-who_ghed = who_ghed[vars_]
-
-# Drop NAs rows
-who_ghed = who_ghed[~who_ghed.gdp_usd.isna()]
-
-# Define regions 
-who_ghed["IADB"]   = np.where(who_ghed.code.isin(codes_iadb),1,0)
-who_ghed["OECD"]   = np.where(who_ghed.code.isin(codes_oecd),1,0)
-who_ghed["Global"] = 1
-
-# Create group values
-group_ = []
-for group in ["IADB","OECD","Global"]:
-    
-    # Collapse data
-    temp_ = who_ghed.copy()
-    temp_ = temp_.groupby(["year",group]).sum().reset_index()
-    temp_ = temp_[temp_[group] == 1]
-    temp_ = temp_.drop(columns = ["IADB","OECD","Global"])
+    # Append to dataset
+    who_ghed = pd.concat([who_ghed, temp_])
+    run_.rows(who_ghed)
 
     # Create new variables
-    temp_["gghed_usd2020_pc"] = temp_.gghed_usd       / (temp_["pop"] / 1000)
-    temp_["hf3_usd2020_pc"]   = temp_.hf3_usd         / (temp_["pop"] / 1000)
-    temp_["hf2_usd2020_pc"]   = temp_.hf2_usd         / (temp_["pop"] / 1000)
-    temp_["gghed_ppp2020_pc"] = temp_.gghed_ppp2020   / (temp_["pop"] / 1000)
-    temp_["hf3_ppp2020_pc"]   = temp_.hf3_ppp2020     / (temp_["pop"] / 1000)
-    temp_["hf2_ppp2020_pc"]   = temp_.hf2_ppp2020     / (temp_["pop"] / 1000)
-    temp_["gghed_gdp"]        = temp_.gghed_usd * 100 / temp_.gdp_usd
-    temp_["hf3_gdp"]          = temp_.gghed_usd * 100 / temp_.gdp_usd
-    temp_["hf2_gdp"]          = temp_.gghed_usd * 100 / temp_.gdp_usd
-
-    # Add lables
-    temp_["country"] = group
-    temp_["code"]    = group
-    
-    # Append to list of groups
-    group_.append(temp_)
-    
-# Append to dataset
-who_ghed = pd.concat([who_ghed] + group_)
-
-# Drop columns 
-who_ghed = who_ghed.drop(columns = ["IADB","OECD","Global"])
-
-# Add variables as % of CHE
-who_ghed["gghed_che"] = who_ghed.gghed_usd * 100 / (who_ghed.gghed_usd + who_ghed.hf3_usd + who_ghed.hf2_usd)
-who_ghed["oop_che"]   = who_ghed.hf3_usd   * 100 / (who_ghed.gghed_usd + who_ghed.hf3_usd + who_ghed.hf2_usd)
-who_ghed["pri_che"]   = who_ghed.hf2_usd   * 100 / (who_ghed.gghed_usd + who_ghed.hf3_usd + who_ghed.hf2_usd)
-who_ghed["che_gdp"]   = who_ghed.che_usd   * 100 / who_ghed.gdp_usd
-
-# Reshape dataset
-id_vars_ = ["country","code","year"]
-val_vars = who_ghed.columns[3:]
-who_ghed = who_ghed.melt(id_vars = id_vars_, value_vars = val_vars, var_name = "var_code")
-
-# Remove year 2021
-# Notes: Not complete for all countries
-who_ghed = who_ghed[who_ghed.year < 2021]
-
-# Add description 
-who_ghed = who_ghed.merge(who_ghed_dict[["var_code","var_name"]], on = "var_code", how = "left")
-
-# Complete descriptions
-who_ghed.var_name = np.where(who_ghed.var_code == "gghed_che", "Governemnt as % CHE", who_ghed.var_name)
-who_ghed.var_name = np.where(who_ghed.var_code == "oop_che"  , "OOP as % CHE"       , who_ghed.var_name)
-who_ghed.var_name = np.where(who_ghed.var_code == "pri_che"  , "Private as % CHE"   , who_ghed.var_name)
-who_ghed.var_name = np.where(who_ghed.var_code == "che_gdp"  , "CHE as % GDP"       , who_ghed.var_name)
-
-# Export data
-path  = "International Organizations/World Health Organization (WHO)/"
-path += "Globoal Health Expenditure Database (GHED)"
-
-who_ghed.to_csv(f"s3://{sclbucket}/{path}/GHED_data_processed.csv", index = False)
-#------------------------------------------------------------------------------
\ No newline at end of file
+    # Note: formulas are declared once in ghed_derived.py and computed in one pass,
+    #       per capita and % GDP of regions from their sums, % CHE for all rows
+    run_.step("reshape", rows_in = who_ghed)
+    who_ghed = derive(who_ghed, ratios_, regions = who_ghed.code.isin(list(regions_)))
+
+    # Reshape dataset
+    id_vars_ = ["country","code","year"]
+    val_vars = who_ghed.columns[3:]
+    who_ghed = who_ghed.melt(id_vars = id_vars_, value_vars = val_vars, var_name = "var_code")
+
+    # Remove year 2021
+    # Notes: Not complete for all countries
+    who_ghed = who_ghed[who_ghed.year < 2021]
+
+    # Add description 
+    who_ghed = who_ghed.merge(who_ghed_dict[["var_code","var_name"]], on = "var_code", how = "left")
+
+    # Complete descriptions
+    # Note: descriptions of the new variables (see ghed_derived.py)
+    who_ghed.var_name = who_ghed.var_code.map(names()).fillna(who_ghed.var_name)
+
+    # Keep rows of the subset
+    # Note: region rows are always kept, they are the benchmarks of scl-profiles.py
+    who_ghed = subset_.apply(who_ghed, country = "code", indicator = "var_code", year = "year", countries = subset_.output_countries(keys_))
+    run_.rows(who_ghed)
+
+    # Quality gate
+    # Note: the export is blocked if a rule with severity error fails (see quality.py)
+    # Note: ratios with a zero denominator are infinite
+    run_.step("validate", rows_in = who_ghed)
+    rules_  = [NotNull(["code","year","var_code"]), Unique(["code","var_code","year"]), Finite("value")]
+    rules_ += [Coverage("code", "year", subset_.within(codes_iadb), by = ["var_code"])]
+    gate(who_ghed, rules_, "who-ghed")
+
+    # Export data
+    run_.step("export", rows_in = who_ghed)
+    path  = "International Organizations/World Health Organization (WHO)/"
+    path += "Globoal Health Expenditure Database (GHED)"
+
+    export(who_ghed, storage_.url(path), "GHED_data_processed", indicator = "var_code", year = "year")
+
+    # Delta since the last run
+    # Note: rows inserted, updated and deleted, by key (see changes.py)
+    publish_changes(who_ghed, storage_, path, "GHED_data_processed", keys = ["code","var_code","year"])
+    run_.finish()
+
+if __name__ == "__main__":
+    main()
+#------------------------------------------------------------------------------
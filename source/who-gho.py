@@ -15,116 +15,224 @@ Notes     : This dataset can be updated manually
             We use the package GHOclient to access their data programmaticaly
             Some considerations:
                For additional indicators, search codes by name and add them in the list of code of interest
-               Run section Fetch data from selected codes only for the new codes, i.e. replace list indicators
-               Append the new indicators to the already available dataset
+               The list of codes is kept on disk with a search index (gho_catalogue.py)
+               Only new or stale codes are fetched, the rest is read from the local cache (gho_cache.py)
+               New or updated codes are merged into the already available dataset
                Update code to read al available datasets in the collection
                Update code to merge all available datasets from the API     
 '''
 
-# Libraries
+# Stage
 #------------------------------------------------------------------------------
-import os
-import boto3
-import dotenv
-import numpy as np
-import pandas as pd
-from ghoclient import GHOSession, index
-
-# Working environments
-#------------------------------------------------------------------------------
-dotenv.load_dotenv("/home/ec2-user/SageMaker/.env")
-sclbucket   = os.environ.get("sclbucket")
-scldatalake = os.environ.get("scldatalake")
-
-# Resources and buckets
-#------------------------------------------------------------------------------
-s3        = boto3.client('s3')
-s3_       = boto3.resource("s3")
-s3_bucket = s3_.Bucket(sclbucket)
-
-# Connect to API
-#------------------------------------------------------------------------------
-# Connection
-gc = GHOSession()
-
-# Get available codes / indicators
-codes = gc.get_data_codes(format = "dataframe")
-index.build_index(codes)
-
-# Search indicators by word
-# Note: example for `UHC`
-search_ = index.search("UHC")
-search_ = pd.DataFrame(search_)
-
-# Preprocessing
-#------------------------------------------------------------------------------
-# Define list/dict of codes of interest
-indicators  = ["WHOSIS_000003","nmr"]                                  # neonatal mortality
-indicators += ["MDG_0000000007","u5mr","MEDS1_02_04"]                  # under-5 mortality
-indicators += ["MDG_0000000001","imr","MEDS1_02_03"]                   # infant mortality
-indicators += ["WHS6_102"]                                             # hospital beds
-indicators += ["HWF_0001"]                                             # number of doctors
-indicators += ["FINPROTECTION_CATA_TOT_10_POP"]                        # catastrophic out-of-pocket spending
-indicators += ["WSH_SANITATION_BASIC","WSH_SANITATION_SAFELY_MANAGED"] # sanitation services
-indicators += ["NCD_BMI_25C","NCD_BMI_25A"]                            # overweight prevalence
-indicators += ["NCD_BMI_18C","NCD_BMI_18A"]                            # underweight prevalence
-indicators += ["LBW_PREVALENCE"]                                       # low birth weight prevalence
-indicators += ["NUTUNDERWEIGHTPREV"]                                   # underweight prevalence among children
-indicators += ["NUTOVERWEIGHTPREV","NUTRITION_ANT_WHZ_NE2"]            # overweight prevalence among children
-indicators += ["vmsl","WHS8_110","MCV2"]                               # measles vaccination
-indicators += ["WHS4_543","vbcg"]                                      # BCG vaccination
-indicators += ["UHC_INDEX_REPORTED"]                                   # UHC index
-indicators += ["UHC_SCI_RMNCH"]                                        # UHC sub-index maternal
-indicators += ["WHS6_102"]                                             # hospital beds
-indicators += ["HWF_0001"]                                             # doctors
-
-# Fetch data from selected codes
-who_gho = []
-for name in indicators:
+def main():
+    '''Fetch the GHO codes of interest and export who-gho-api.'''
+    # Note: pandas, numpy and the helper modules are imported when the stage runs,
+    #       so the script can be imported without loading them (see pipeline.py)
+    import numpy as np
+    import pandas as pd
+    from changes import publish_changes
+    from ghoclient import GHOSession
+    from gho_cache import GHOCache
+    from gho_catalogue import load_catalogue
+    from gho_category import encode
+    from gho_fetch import fetch_codes, unique_codes
+    from metrics import Run
+    from outputs import export, load
+    from quality import Finite, NotNull, Unique, gate
+    from storage import get_storage
+    from subset import get_subset
+
+    # Working environments
+    #--------------------------------------------------------------------------
+    # Note: S3 bucket `sclbucket` or local directory `sclstorage` (see storage.py),
+    #       the S3 client is created on first use
+    storage_ = get_storage()
+
+    # Run metrics
+    #--------------------------------------------------------------------------
+    # Note: time, memory, rows and bytes of each step are saved as JSON (see metrics.py)
+    run_ = Run("who-gho")
+
+    # Subset run
+    # Note: countries, indicators and years of the env variables (see subset.py),
+    #       all of them if not set
+    subset_ = get_subset()
+
+    # Connect to API
+    #--------------------------------------------------------------------------
+    # Connection
+    run_.step("connect")
+    gc = GHOSession()
+
+    # Get available codes / indicators
+    # Note: the list of codes and its search index are kept on disk and
+    #       fetched again after 30 days (see gho_catalogue.py)
+    catalogue = load_catalogue(gc.get_data_codes, max_age_days = 30)
+
+    # Search indicators by word
+    # Note: example for `UHC`, also from the command line:
+    #       python source/gho_catalogue.py UHC
+    search_ = catalogue.search("UHC")
+    search_ = pd.DataFrame(search_)
+
+    # Preprocessing
+    #--------------------------------------------------------------------------
+    # Define list/dict of codes of interest
+    indicators  = ["WHOSIS_000003","nmr"]                                  # neonatal mortality
+    indicators += ["MDG_0000000007","u5mr","MEDS1_02_04"]                  # under-5 mortality
+    indicators += ["MDG_0000000001","imr","MEDS1_02_03"]                   # infant mortality
+    indicators += ["WHS6_102"]                                             # hospital beds
+    indicators += ["HWF_0001"]                                             # number of doctors
+    indicators += ["FINPROTECTION_CATA_TOT_10_POP"]                        # catastrophic out-of-pocket spending
+    indicators += ["WSH_SANITATION_BASIC","WSH_SANITATION_SAFELY_MANAGED"] # sanitation services
+    indicators += ["NCD_BMI_25C","NCD_BMI_25A"]                            # overweight prevalence
+    indicators += ["NCD_BMI_18C","NCD_BMI_18A"]                            # underweight prevalence
+    indicators += ["LBW_PREVALENCE"]                                       # low birth weight prevalence
+    indicators += ["NUTUNDERWEIGHTPREV"]                                   # underweight prevalence among children
+    indicators += ["NUTOVERWEIGHTPREV","NUTRITION_ANT_WHZ_NE2"]            # overweight prevalence among children
+    indicators += ["vmsl","WHS8_110","MCV2"]                               # measles vaccination
+    indicators += ["WHS4_543","vbcg"]                                      # BCG vaccination
+    indicators += ["UHC_INDEX_REPORTED"]                                   # UHC index
+    indicators += ["UHC_SCI_RMNCH"]                                        # UHC sub-index maternal
+    indicators += ["WHS6_102"]                                             # hospital beds
+    indicators += ["HWF_0001"]                                             # doctors
+
+    indicators  = unique_codes(indicators)
+
+    # Note: in a subset run only the codes of the subset are fetched
+    indicators  = subset_.wanted(indicators)
+
+    # Fetch data from new or stale codes
+    # Note: duplicated codes are fetched once, failed codes are retried and reported
+    run_.step("fetch")
+    cache          = GHOCache()
+    stale_         = cache.stale(indicators, max_age_days = 30)
+    data_, failed_ = fetch_codes(gc.fetch_data_from_codes, stale_, max_workers = 8, retries = 3)
+    for name, error in failed_.items():
+        print(f"An exception ocurred for code {name}: {error}")
+
+    # Update cache
+    # Note: a subset run does not write the shared cache, the codes it fetched are
+    #       used as fetched (see below)
+    if not subset_.active:
+        for name, temp in data_.items():
+            cache.put(name, temp)
+        cache.save()
+    run_.rows(sum(len(temp) for temp in data_.values()))
+
+    # Import already available dataset
+    path  = "International Organizations/World Health Organization (WHO)/"
+    path += "Global Health Observatory (GHO)"
+    run_.step("import")
+    # Note: a subset run builds all its codes from the cache
     try:
-        temp = gc.fetch_data_from_codes(code = name)
+        who_gho_ = pd.DataFrame(columns = ["GHO"]) if subset_.active else load(storage_.url(path), "who-gho-api")
+    except FileNotFoundError:
+        who_gho_ = pd.DataFrame(columns = ["GHO"])
+    run_.rows(who_gho_)
+
+    # Codes whose cached content is not in the published dataset, or missing from it
+    # Note: codes are marked as published only after the export (see gho_cache.py),
+    #       so codes of a run that failed before the export are built again
+    changed_  = [] if subset_.active else cache.unpublished(indicators)
+    changed_ += [name for name in indicators if (name in data_ or name in cache) and name not in changed_ and not who_gho_.GHO.eq(name).any()]
+
+    # Codes no longer in the list of codes of interest
+    removed_  = sorted(set(who_gho_.GHO.dropna()) - set(indicators))
+    # Note: a subset run always exports its -dev output, even empty, so the stages
+    #       after it can read it (see outputs.py)
+    if len(changed_) == 0 and len(removed_) == 0 and not subset_.active:
+        print("No new or updated codes, dataset is up to date")
+        run_.finish()
+        return
+
+    # Create dataframe of new or updated codes
+    # Note: the list of codes is fetched again if a code is not in it, codes still
+    #       missing (e.g. retired codes) are reported and skipped
+    if any(name not in catalogue for name in changed_):
+        catalogue = load_catalogue(gc.get_data_codes, refresh = True)
+    who_gho  = []
+    skipped_ = []
+    for name in changed_:
+        if name not in catalogue:
+            print(f"Code {name} is not in the list of GHO codes, skipped")
+            skipped_.append(name)
+            continue
+        temp = data_[name] if name in data_ else cache.get(name)
         if temp.shape[0] > 0:
-            temp["display"] = codes[codes["@Label"] == name].Display.tolist()[0]
+            temp["display"] = catalogue.name(name)
             who_gho.append(temp)
-    except:
-        print(f"An exception ocurred for code {name}")
-
-# Create master dataframe
-who_gho = pd.concat(who_gho)
-
-# Keep country-level data
-who_gho = who_gho[~who_gho.COUNTRY.isna()]
-who_gho = who_gho[~who_gho.REGION.isna()]
-
-# Drop variables 
-vars_   = ["PUBLISHSTATE","StdErr","StdDev","Comments","Low","High"]
-vars_  += ["UNREGION","UNSDGREGION","WORLDBANKREGION","UNICEFREGION","WORLDBANKINCOMEGROUP","UNICEFREGION","DHSMICSGEOREGION"] 
-vars_   = [name for name in vars_ if name in who_gho.columns]
-
-# Drop rows without numeric values
-who_gho = who_gho[~who_gho.Numeric.isna()]
-
-# Create category variable
-    # Select categories
-cats_   = ["SEX","AGEGROUP","EDUCATIONLEVEL","RESIDENCEAREATYPE","WEALTHQUINTILE","WEALTHDECILE"]
-cats_  += ["POP_TYPE","HOUSEHOLD_COMP_BY_AGE"]
-cats_   = [name for name in cats_ if name in who_gho.columns]
-
-    # Merge categories
-who_gho["CATEGORY"] = who_gho[cats_].astype(str).agg('-'.join, axis = 1)
-who_gho["CATEGORY"] = who_gho.CATEGORY.str.replace("nan-","")
-who_gho["CATEGORY"] = who_gho.CATEGORY.str.replace("-nan","")
-who_gho["CATEGORY"] = who_gho.CATEGORY.str.replace("nan" ,"")
-who_gho             = who_gho.drop(columns = cats_)
-
-# Find latest observation
-vars_ = ["GHO","REGION","COUNTRY","CATEGORY"]
-who_gho["YEAR_MAX"] = who_gho.groupby(vars_).YEAR.transform("max")
-who_gho["LATEST"]   = (who_gho.YEAR == who_gho.YEAR_MAX).astype(int)
-
-# Export data 
+    who_gho = pd.concat(who_gho) if who_gho else pd.DataFrame(columns = ["GHO","YEAR","REGION","COUNTRY","Value","Numeric"])
+
+    # Keep country-level data
+    run_.step("reshape", rows_in = who_gho)
+    who_gho = who_gho[~who_gho.COUNTRY.isna()]
+    who_gho = who_gho[~who_gho.REGION.isna()]
+
+    # Drop variables 
+    vars_   = ["PUBLISHSTATE","StdErr","StdDev","Comments","Low","High"]
+    vars_  += ["UNREGION","UNSDGREGION","WORLDBANKREGION","UNICEFREGION","WORLDBANKINCOMEGROUP","UNICEFREGION","DHSMICSGEOREGION"] 
+    vars_   = [name for name in vars_ if name in who_gho.columns]
+
+    # Drop rows without numeric values
+    who_gho = who_gho[~who_gho.Numeric.isna()]
+
+    # Create category variable
+        # Select categories
+    cats_   = ["SEX","AGEGROUP","EDUCATIONLEVEL","RESIDENCEAREATYPE","WEALTHQUINTILE","WEALTHDECILE"]
+    cats_  += ["POP_TYPE","HOUSEHOLD_COMP_BY_AGE"]
+    cats_   = [name for name in cats_ if name in who_gho.columns]
+
+        # Merge categories
+        # Note: non-missing values joined by "-" (e.g. BTSX-YEARS18-PLUS), "" if none
+    who_gho["CATEGORY"] = encode(who_gho, cats_)
+    who_gho             = who_gho.drop(columns = cats_)
+
+    # Find latest observation
+    # Note: groups include GHO, so only groups of new or updated codes are recomputed
+    vars_ = ["GHO","REGION","COUNTRY","CATEGORY"]
+    who_gho["YEAR_MAX"] = who_gho.groupby(vars_).YEAR.transform("max")
+    who_gho["LATEST"]   = (who_gho.YEAR == who_gho.YEAR_MAX).astype(int)
+
+    # Keep years of the subset
+    # Note: years are filtered after the latest observation is found; all countries are
+    #       kept, scl-profiles.py computes the benchmarks from them (see subset.py)
+    who_gho = subset_.apply(who_gho, year = "YEAR")
+
+    # Merge with already available dataset
+    # Note: only codes of interest are kept, removed codes are dropped
+    who_gho = pd.concat([who_gho_[who_gho_.GHO.isin(indicators) & ~who_gho_.GHO.isin(changed_)], who_gho])
+    who_gho["CATEGORY"] = who_gho.CATEGORY.astype("category")
+    run_.rows(who_gho)
+
+    # Quality gate
+    #--------------------------------------------------------------------------
+    # Note: the export is blocked if a rule with severity error fails (see quality.py)
+    # Note: rows are keyed by every dimension column left (e.g. dimensions of a code that
+    #       are not in cats_), duplicated keys block the export
+    run_.step("validate", rows_in = who_gho)
+    attrs_ = ["PUBLISHSTATE","StdErr","StdDev","Comments","Low","High","Display","display","Value","Numeric"]
+    attrs_ += ["UNREGION","UNSDGREGION","WORLDBANKREGION","UNICEFREGION","WORLDBANKINCOMEGROUP","DHSMICSGEOREGION"]
+    attrs_ += ["YEAR_MAX","LATEST"]
+    dims_  = [name for name in who_gho.columns if name not in attrs_]
+    rules_ = [NotNull(["GHO","COUNTRY","YEAR"]), Unique(dims_), Finite("Numeric")]
+    gate(who_gho, rules_, "who-gho")
+
+    # Export data 
+    #--------------------------------------------------------------------------
+    run_.step("export", rows_in = who_gho)
+    export(who_gho, storage_.url(path), "who-gho-api", indicator = "GHO", year = "YEAR")
+
+    # Delta since the last run
+    # Note: rows inserted, updated and deleted, by key (see changes.py)
+    publish_changes(who_gho, storage_, path, "who-gho-api", keys = dims_)
+
+    # Mark the exported codes as published
+    if not subset_.active:
+        cache.publish([name for name in changed_ if name not in skipped_])
+        cache.save()
+    run_.finish()
+
+if __name__ == "__main__":
+    main()
 #------------------------------------------------------------------------------
-path  = "International Organizations/World Health Organization (WHO)/"
-path += "Global Health Observatory (GHO)"
-who_gho.to_csv(f"s3://{sclbucket}/{path}/who-gho-api.csv", index = False)
-#------------------------------------------------------------------------------
\ No newline at end of file
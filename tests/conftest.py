@@ -0,0 +1,11 @@
+'''
+Tests of the helper modules of source/
+Usage: python -m pytest tests
+'''
+
+import os
+import sys
+
+SOURCE = os.path.join(os.path.dirname(os.path.dirname(os.path.abspath(__file__))), "source")
+if SOURCE not in sys.path:
+    sys.path.insert(0, SOURCE)
@@ -0,0 +1,86 @@
+'''Tests of changes.py.'''
+
+import io
+import numpy as np
+import pandas as pd
+import pytest
+from changes import apply, delta, publish_changes, read_manifest
+from storage import LocalStorage
+
+KEYS = ["isoalpha3","indicator","year"]
+
+def indicators():
+    return pd.DataFrame({"isoalpha3": ["ARG","ARG","BRA","BRA"],
+                         "indicator": ["lexp","lexp","lexp","haq"],
+                         "year"     : [2000, 2001, 2000, 2000],
+                         "value"    : [70.5, 71.0, np.nan, 60.0],
+                         "label"    : ["a", "", "c", "d"]})
+
+def sort(data):
+    return data.sort_values(KEYS).reset_index(drop = True)
+
+@pytest.fixture
+def storage(tmp_path, monkeypatch):
+    for name in ("sclcountries","sclindicators","sclyears"):
+        monkeypatch.delenv(name, raising = False)
+    return LocalStorage(str(tmp_path))
+
+def test_delta_and_apply():
+    previous   = indicators()
+    _, state   = delta(previous, KEYS)
+    current    = previous.copy()
+    current.loc[0, "value"] = 80.0
+    current    = pd.concat([current.drop(index = 3), pd.DataFrame([{"isoalpha3": "CHL", "indicator": "lexp", "year": 2000, "value": 75.0, "label": "e"}])])
+    changes, _ = delta(current, KEYS, state)
+    assert changes.op.value_counts().to_dict() == {"insert": 1, "update": 1, "delete": 1}
+    assert changes[changes.op == "delete"].indicator.tolist() == ["haq"]
+    pd.testing.assert_frame_equal(sort(apply(previous, changes, KEYS)), sort(current), check_dtype = False)
+
+def test_publish_runs(storage):
+    data  = indicators()
+    first = publish_changes(data, storage, "out", "indicators_health", KEYS)
+    assert first["full"] and first["insert"] == len(data)
+    assert publish_changes(data, storage, "out", "indicators_health", KEYS) is None
+
+    data.loc[1, "value"] = 72.0
+    second   = publish_changes(data, storage, "out", "indicators_health", KEYS)
+    manifest = read_manifest(storage, "out/changes/indicators_health")
+    assert (second["update"], second["insert"], second["delete"]) == (1, 0, 0)
+    assert [run["run"] for run in manifest["runs"]] == [first["run"], second["run"]]
+    assert second["previous"] == first["run"]
+
+    # Note: only the state of the last run is kept
+    states = [key for key, _ in storage.list("out/changes/indicators_health/") if key.endswith(".state.csv.gz")]
+    assert states == [second["state"]]
+
+def test_csv_round_trip_has_no_changes(storage):
+    data = indicators()
+    publish_changes(data, storage, "out", "indicators_health", KEYS)
+    buffer = io.StringIO()
+    data.to_csv(buffer, index = False)
+    reloaded = pd.read_csv(io.StringIO(buffer.getvalue()))
+    assert publish_changes(reloaded, storage, "out", "indicators_health", KEYS) is None
+
+def test_failed_manifest_keeps_previous_run(storage, monkeypatch):
+    data  = indicators()
+    first = publish_changes(data, storage, "out", "indicators_health", KEYS)
+    data.loc[0, "value"] = 80.0
+
+    write = storage.write
+    def failing(key, body, **kwargs):
+        if key.endswith("manifest.json"):
+            raise OSError("write failed")
+        return write(key, body, **kwargs)
+    monkeypatch.setattr(storage, "write", failing)
+    with pytest.raises(OSError):
+        publish_changes(data, storage, "out", "indicators_health", KEYS)
+    monkeypatch.setattr(storage, "write", write)
+
+    assert [run["run"] for run in read_manifest(storage, "out/changes/indicators_health")["runs"]] == [first["run"]]
+    second = publish_changes(data, storage, "out", "indicators_health", KEYS)
+    assert (second["update"], second["previous"]) == (1, first["run"])
+
+def test_subset_run_publishes_nothing(storage, monkeypatch):
+    monkeypatch.setenv("sclcountries", "ARG")
+    assert publish_changes(indicators(), storage, "out", "indicators_health", KEYS) is None
+    assert read_manifest(storage, "out/changes/indicators_health")["runs"] == []
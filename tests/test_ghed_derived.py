@@ -0,0 +1,37 @@
+'''Tests of ghed_derived.py.'''
+
+import numpy as np
+import pandas as pd
+import pytest
+from ghed_derived import DERIVED, Ratio, check, derive
+
+def ghed():
+    # Note: two countries with the % GDP of the workbook, and two regions without it
+    return pd.DataFrame({"code"     : ["ARG","BRA","IADB","OECD"],
+                         "gdp_usd"  : [500.0, 2000.0, 2500.0, 0.0],
+                         "gghed_usd": [20.0, 80.0, 100.0, 10.0],
+                         "hf3_usd"  : [10.0, 50.0, 60.0, np.nan],
+                         "hf2_usd"  : [5.0, 30.0, 35.0, 4.0],
+                         "hf3_gdp"  : [2.1, 2.4, np.nan, np.nan],
+                         "hf2_gdp"  : [1.1, 1.6, np.nan, np.nan]})
+
+def test_gdp_shares_of_regions():
+    data    = ghed()
+    regions = data.code.isin(["IADB","OECD"])
+    ratios  = {code: DERIVED[code] for code in ["hf3_gdp","hf2_gdp","oop_che"]}
+    output  = derive(data, ratios, regions = regions)
+
+    # Note: regions from their sums, countries keep the value of the workbook
+    assert output.hf3_gdp.tolist()[:3] == [2.1, 2.4, 100 * 60.0 / 2500.0]
+    assert output.hf2_gdp.tolist()[:3] == [1.1, 1.6, 100 * 35.0 / 2500.0]
+    assert np.isnan(output.hf3_gdp[3]) and np.isinf(output.hf2_gdp[3])
+
+    # Note: % CHE is computed for all rows
+    assert output.oop_che.tolist()[:3] == pytest.approx([100 * 10 / 35, 100 * 50 / 160, 100 * 60 / 195])
+    assert data.hf3_gdp.isna().sum() == 2
+
+def test_check_rejects_numerator_of_another_scheme():
+    with pytest.raises(ValueError, match = "hf3_gdp: numerator gghed_usd"):
+        check({"hf3_gdp": Ratio("gghed_usd", ("gdp_usd",), 100)}, ghed().columns)
+    with pytest.raises(ValueError, match = "not in the data"):
+        check({"che_gdp": DERIVED["che_gdp"]}, ghed().columns)
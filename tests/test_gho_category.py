@@ -0,0 +1,30 @@
+'''Tests of gho_category.py.'''
+
+import numpy as np
+import pandas as pd
+from gho_category import encode, recode
+
+def categories():
+    return pd.DataFrame({"SEX"     : ["BTSX","BTSX","MLE", np.nan, "", None],
+                         "AGEGROUP": ["YEARS18-PLUS", np.nan, "", "YEARS05-09", "", None]})
+
+def test_encode_joins_non_missing_values():
+    data = encode(categories(), ["SEX","AGEGROUP"])
+    assert list(data) == ["BTSX-YEARS18-PLUS","BTSX","MLE","YEARS05-09","",""]
+    assert isinstance(data, pd.Categorical)
+
+def test_encode_empty():
+    assert list(encode(categories(), [])) == [""] * 6
+    assert len(encode(categories().iloc[:0], ["SEX","AGEGROUP"])) == 0
+
+def test_encode_matches_row_by_row():
+    rng  = np.random.default_rng(0)
+    data = pd.DataFrame({name: rng.choice(np.array(["A","B","",None], dtype = object), 500) for name in ["X","Y","Z"]})
+    rows = ["-".join(value for value in row if isinstance(value, str) and value) for row in data.itertuples(index = False)]
+    assert list(encode(data, ["X","Y","Z"])) == rows
+
+def test_recode_missing_and_unknown():
+    values = pd.Categorical(["BTSX","MLE", np.nan, "WQ1", ""])
+    data   = recode(values, {"":"Both","BTSX":"Both","MLE":"Male"}, missing = "Both")
+    assert pd.Series(data).isna().tolist() == [False, False, False, True, False]
+    assert list(pd.Series(data).dropna()) == ["Both","Male","Both","Both"]
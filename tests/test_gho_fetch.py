@@ -0,0 +1,85 @@
+'''Tests of gho_fetch.py against a local server that mimics the GHO API.'''
+
+import json
+import threading
+import urllib.request
+from collections import Counter
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+import pandas as pd
+import pytest
+from gho_fetch import fetch_codes, fetch_with_retry, unique_codes
+
+class Handler(BaseHTTPRequestHandler):
+    '''GET /api/{code}: the rows of `code`, after `failures[code]` 503 responses.'''
+
+    def do_GET(self):
+        code = self.path.rsplit("/", 1)[-1]
+        with self.server.lock:
+            self.server.requests[code] += 1
+            fail = self.server.requests[code] <= self.server.failures.get(code, 0)
+        if code not in self.server.codes or fail:
+            self.send_response(404 if code not in self.server.codes else 503)
+            self.end_headers()
+            return
+        body = json.dumps({"value": [{"IndicatorCode": code, "SpatialDim": "ARG", "TimeDim": 2000, "NumericValue": 1.5}]}).encode()
+        self.send_response(200)
+        self.send_header("Content-Type", "application/json")
+        self.end_headers()
+        self.wfile.write(body)
+
+    def log_message(self, *args):
+        pass
+
+@pytest.fixture
+def server():
+    server          = ThreadingHTTPServer(("127.0.0.1", 0), Handler)
+    server.lock     = threading.Lock()
+    server.requests = Counter()
+    server.failures = {}
+    server.codes    = {"WHS4_100", "WHS6_102", "MDG_0000000001"}
+    thread          = threading.Thread(target = server.serve_forever, daemon = True)
+    thread.start()
+    yield server
+    server.shutdown()
+    server.server_close()
+
+def session(server):
+    '''fetch(code = ...) of the local server, as GHOSession().fetch_data_from_codes.'''
+    url = f"http://127.0.0.1:{server.server_address[1]}/api"
+    def fetch(code):
+        with urllib.request.urlopen(f"{url}/{code}", timeout = 5) as response:
+            return pd.DataFrame(json.loads(response.read())["value"])
+    return fetch
+
+def test_unique_codes_keeps_order():
+    assert unique_codes(["B", "A", "B", "C", "A"]) == ["B", "A", "C"]
+
+def test_retry_until_success(server):
+    server.failures["WHS4_100"] = 2
+    data = fetch_with_retry(session(server), "WHS4_100", retries = 3, backoff = 0)
+    assert data.IndicatorCode.tolist() == ["WHS4_100"]
+    assert server.requests["WHS4_100"] == 3
+
+def test_retry_raises_last_error(server):
+    server.failures["WHS4_100"] = 10
+    with pytest.raises(urllib.error.HTTPError):
+        fetch_with_retry(session(server), "WHS4_100", retries = 2, backoff = 0)
+    assert server.requests["WHS4_100"] == 3
+
+def test_fetch_codes_once_each_in_order(server):
+    codes        = ["WHS6_102", "WHS4_100", "WHS6_102", "MDG_0000000001", "WHS4_100"]
+    data, failed = fetch_codes(session(server), codes, max_workers = 4, retries = 0, backoff = 0)
+    assert list(data) == ["WHS6_102", "WHS4_100", "MDG_0000000001"]
+    assert failed == {}
+    assert server.requests == Counter({"WHS6_102": 1, "WHS4_100": 1, "MDG_0000000001": 1})
+
+def test_fetch_codes_reports_failures(server):
+    server.failures["WHS6_102"] = 1
+    data, failed = fetch_codes(session(server), ["WHS4_100", "UNKNOWN", "WHS6_102"], retries = 1, backoff = 0)
+    assert list(data) == ["WHS4_100", "WHS6_102"]
+    assert list(failed) == ["UNKNOWN"]
+    assert failed["UNKNOWN"].startswith("HTTPError: HTTP Error 404")
+    assert server.requests["UNKNOWN"] == 2
+
+def test_fetch_codes_empty():
+    assert fetch_codes(lambda code: None, []) == ({}, {})
@@ -0,0 +1,41 @@
+'''Tests of ihme_locations.py.'''
+
+import numpy as np
+import pandas as pd
+from ihme_locations import Crosswalk, build_crosswalk
+from keys import Keys
+
+def keys():
+    world = pd.DataFrame({"isoalpha3"      : ["ARG","BRA","FRA","CIV"],
+                          "country_name_en": ["Argentina","Brazil","France","Côte d'Ivoire"]})
+    return Keys(iadb = world[world.isoalpha3.isin(["ARG","BRA"])], oecd = world[world.isoalpha3 == "FRA"], world = world)
+
+def codebook():
+    # Note: Global (level 0), regions (1-2) and subnational units (4) are not countries
+    return pd.DataFrame({"location_id"  : [1, 103, 4751, 155, 98, 80, 205, 4760],
+                         "location_name": ["Global","Latin America","Southern Latin America","Brazil",
+                                           "Argentina","France","Cote d'Ivoire","Acre"],
+                         "ihme_loc_id"  : ["G","R","R","BRA","ARG","FRA","CIV_X","BRA_4750"],
+                         "level"        : [0, 1, 2, 3, 3, 3, 3, 4]})
+
+def test_country_level_locations_only():
+    table = build_crosswalk(codebook(), keys())
+    assert table.index.tolist() == [80, 98, 155, 205]
+    assert table.index.dtype == np.int32
+    assert table.isoalpha3.astype(object).tolist()[:3] == ["FRA","ARG","BRA"]
+    assert table[["iadb","oecd","world"]].sum().tolist() == [2, 1, 3]
+
+def test_unmatched_locations_are_reported(capsys):
+    # Note: Cote d'Ivoire has no valid ihme_loc_id and its name differs from the keys
+    table = build_crosswalk(codebook(), keys())
+    assert pd.isna(table.isoalpha3[205])
+    assert "1 locations without isoalpha3: Cote d'Ivoire" in capsys.readouterr().out
+
+def test_lookups():
+    crosswalk = Crosswalk(build_crosswalk(codebook(), keys()))
+    ids       = [98, 4760, 1, 80, 155]
+    assert list(crosswalk.codes(ids).astype(object)[[0, 3, 4]]) == ["ARG","FRA","BRA"]
+    assert crosswalk.codes(ids).isna().tolist() == [False, True, True, False, False]
+    assert crosswalk.member(ids, "IADB").tolist() == [True, False, False, False, True]
+    assert crosswalk.locations("World").tolist() == [80, 98, 155]
+    assert crosswalk.locations().tolist() == [80, 98, 155, 205]
@@ -0,0 +1,39 @@
+'''Tests of master.py.'''
+
+import numpy as np
+import pandas as pd
+from master import GHO_TOTAL, from_gho
+from quality import Unique, check
+
+def gho(rows):
+    '''who-gho-api rows of (GHO, COUNTRY, CATEGORY, Numeric) for 2000.'''
+    data = pd.DataFrame(rows, columns = ["GHO","COUNTRY","CATEGORY","Numeric"])
+    data["YEAR"]     = 2000
+    data["CATEGORY"] = data.CATEGORY.astype("category")
+    return data
+
+def values(data):
+    return dict(zip(zip(data.indicator.astype(str), data.sex.astype(str)), data.value))
+
+def test_declared_total_is_kept():
+    assert GHO_TOTAL["mdg_0000000007"] == "BTSX" and GHO_TOTAL["whs6_102"] == ""
+    data = from_gho(gho([["MDG_0000000007","ARG",""                 ,1.0],
+                         ["MDG_0000000007","ARG","BTSX"             ,2.0],
+                         ["MDG_0000000007","ARG","MLE"              ,3.0],
+                         ["MDG_0000000007","ARG","FMLE"             ,4.0],
+                         ["WHS6_102"      ,"ARG",np.nan             ,5.0],
+                         ["WHS6_102"      ,"ARG","BTSX-YEARS18-PLUS",6.0],
+                         ["WHS6_102"      ,"ARG","BTSX-YEARS05-09"  ,7.0]]))
+    assert values(data) == {("mdg_0000000007","Both"): 2.0, ("mdg_0000000007","Male"): 3.0,
+                            ("mdg_0000000007","Female"): 4.0, ("whs6_102","Both"): 5.0}
+
+def test_undeclared_totals_fail_the_gate(monkeypatch):
+    # Note: without a declared total, both totals are kept and the Unique rule fails
+    monkeypatch.delitem(GHO_TOTAL, "hwf_0001")
+    data   = from_gho(gho([["HWF_0001","ARG","",1.0], ["HWF_0001","ARG","TOTL",2.0], ["HWF_0001","BRA","TOTL",3.0]]))
+    result = check(data, [Unique(["indicator","year","isoalpha3","sex"])])[0]
+    assert len(data) == 3 and result["failed"] == 2
+
+def test_identical_rows_are_one_row():
+    data = from_gho(gho([["WHS6_102","ARG","",1.0], ["WHS6_102","ARG","",1.0]]))
+    assert len(data) == 1
@@ -0,0 +1,92 @@
+'''Tests of multipart.py: multipart uploads against moto's S3 and local writes.'''
+
+import os
+import gzip
+import pandas as pd
+import pytest
+from multipart import MIN_PART, LocalWriter, S3Writer, write_csv
+
+boto3 = pytest.importorskip("boto3")
+moto  = pytest.importorskip("moto")
+
+BUCKET = "bucket"
+
+@pytest.fixture
+def client(monkeypatch):
+    monkeypatch.setenv("AWS_ACCESS_KEY_ID", "testing")
+    monkeypatch.setenv("AWS_SECRET_ACCESS_KEY", "testing")
+    monkeypatch.setenv("AWS_DEFAULT_REGION", "us-east-1")
+    with moto.mock_aws():
+        client = boto3.client("s3", region_name = "us-east-1")
+        client.create_bucket(Bucket = BUCKET)
+        yield client
+
+def pending(client):
+    return client.list_multipart_uploads(Bucket = BUCKET).get("Uploads", [])
+
+def test_multipart_upload(client):
+    body   = os.urandom(2 * MIN_PART + 1000)
+    writer = S3Writer(client, BUCKET, "data.bin", part_size = MIN_PART, workers = 2)
+    for start in range(0, len(body), 2**20):
+        writer.write(body[start:start + 2**20])
+    writer.close()
+
+    head = client.head_object(Bucket = BUCKET, Key = "data.bin")
+    # Note: the ETag of a multipart object ends with the number of parts
+    assert head["ETag"].strip('"').endswith("-3")
+    assert client.get_object(Bucket = BUCKET, Key = "data.bin")["Body"].read() == body
+    assert pending(client) == []
+
+def test_small_output_is_one_request(client):
+    writer = S3Writer(client, BUCKET, "small.csv", content_type = "text/csv")
+    writer.write(b"a,b\n1,2\n")
+    writer.close()
+    head = client.head_object(Bucket = BUCKET, Key = "small.csv")
+    assert "-" not in head["ETag"] and head["ContentType"] == "text/csv"
+
+class Failing:
+    '''Client whose second upload_part fails.'''
+
+    def __init__(self, client):
+        self.client = client
+        self.parts  = 0
+
+    def upload_part(self, **kwargs):
+        self.parts += 1
+        if self.parts == 2:
+            raise ConnectionError("upload failed")
+        return self.client.upload_part(**kwargs)
+
+    def __getattr__(self, name):
+        return getattr(self.client, name)
+
+def test_abort_on_failure(client):
+    writer = S3Writer(Failing(client), BUCKET, "data.bin", part_size = MIN_PART, workers = 1)
+    with pytest.raises(ConnectionError):
+        for _ in range(3):
+            writer.write(os.urandom(MIN_PART))
+        writer.close()
+
+    assert "Contents" not in client.list_objects_v2(Bucket = BUCKET)
+    assert pending(client) == []
+
+def test_write_csv_to_s3(client):
+    data = pd.DataFrame({"isoalpha3": ["ARG","BRA"] * 1000, "value": range(2000)})
+    written = write_csv(data, f"s3://{BUCKET}/data.csv.gz", "gzip", chunksize = 300)
+    body    = client.get_object(Bucket = BUCKET, Key = "data.csv.gz")["Body"].read()
+    assert len(body) == written
+    assert gzip.decompress(body).decode() == data.to_csv(index = False)
+
+def test_local_writer(tmp_path):
+    path   = str(tmp_path / "out" / "data.csv")
+    writer = LocalWriter(path)
+    writer.write(b"a\n")
+    assert not os.path.exists(path)
+    writer.close()
+    assert open(path, "rb").read() == b"a\n"
+
+    writer = LocalWriter(path)
+    writer.write(b"b\n")
+    writer.abort()
+    assert open(path, "rb").read() == b"a\n"
+    assert os.listdir(tmp_path / "out") == ["data.csv"]
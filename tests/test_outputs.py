@@ -0,0 +1,101 @@
+'''Tests of outputs.py: versioned Parquet datasets on disk and in moto's S3.'''
+
+import json
+import socket
+import urllib.request
+import pandas as pd
+import pytest
+import outputs
+from outputs import CURRENT, read_parquet, write_parquet
+
+pytest.importorskip("pyarrow")
+
+BUCKET = "bucket"
+
+def frame(value):
+    return pd.DataFrame({"indicator": pd.Categorical(["lexp","lexp","haq"]),
+                         "year"     : [2000, 2001, 2000],
+                         "value"    : [value, value + 1, value + 2]})
+
+@pytest.fixture
+def s3(monkeypatch):
+    '''s3:// root of a bucket in a moto server, (root, boto3 client).'''
+    boto3  = pytest.importorskip("boto3")
+    server = pytest.importorskip("moto.server")
+    with socket.socket() as sock:
+        sock.bind(("127.0.0.1", 0))
+        port = sock.getsockname()[1]
+    endpoint = f"http://127.0.0.1:{port}"
+    monkeypatch.setenv("AWS_ENDPOINT_URL", endpoint)
+    monkeypatch.setenv("AWS_ACCESS_KEY_ID", "testing")
+    monkeypatch.setenv("AWS_SECRET_ACCESS_KEY", "testing")
+    monkeypatch.setenv("AWS_DEFAULT_REGION", "us-east-1")
+    moto = server.ThreadedMotoServer(ip_address = "127.0.0.1", port = port)
+    moto.start()
+    client = boto3.client("s3", endpoint_url = endpoint, region_name = "us-east-1")
+    client.create_bucket(Bucket = BUCKET)
+    yield f"s3://{BUCKET}", client
+    # Note: moto servers of a process share their state, so the bucket is emptied
+    urllib.request.urlopen(urllib.request.Request(f"{endpoint}/moto-api/reset", method = "POST"))
+    moto.stop()
+
+def versions(client, prefix):
+    keys = [obj["Key"] for obj in client.list_objects_v2(Bucket = BUCKET, Prefix = prefix).get("Contents", [])]
+    return sorted({key.split("/")[2] for key in keys if "/v=" in key})
+
+def test_round_trip_and_versions(tmp_path):
+    path = str(tmp_path / "data.parquet")
+    for value in [1.0, 2.0, 3.0]:
+        write_parquet(frame(value), path, ["indicator","year"])
+    data = read_parquet(path, filters = [("indicator","==","lexp")]).sort_values("year")
+    assert data.value.tolist() == [3.0, 4.0]
+    assert isinstance(data.indicator.dtype, pd.CategoricalDtype)
+
+    # Note: the current version and the one before it are kept
+    current = json.loads((tmp_path / "data.parquet" / CURRENT).read_text())["version"]
+    assert len(list((tmp_path / "data.parquet").glob("v=*"))) == 2
+    assert (tmp_path / "data.parquet" / f"v={current}").is_dir()
+
+def test_legacy_dataset_is_read_and_replaced(tmp_path):
+    import pyarrow as pa
+    import pyarrow.parquet as pq
+
+    path  = tmp_path / "data.parquet"
+    table = pa.Table.from_pandas(frame(1.0), preserve_index = False)
+    pq.write_to_dataset(table, str(path), partition_cols = ["indicator"])
+    pq.write_metadata(table.schema, str(path / "_common_metadata"))
+    assert read_parquet(str(path)).value.sum() == 6.0
+
+    write_parquet(frame(2.0), str(path), ["indicator"])
+    assert read_parquet(str(path)).value.sum() == 9.0
+    assert sorted(item.name for item in path.iterdir() if not item.name.startswith("v=")) == [CURRENT]
+
+def test_s3_versions(s3):
+    root, client = s3
+    path = f"{root}/out/data.parquet"
+    for value in [1.0, 2.0, 3.0]:
+        write_parquet(frame(value), path, ["indicator","year"])
+    assert read_parquet(path).value.sum() == 3.0 + 4.0 + 5.0
+    assert len(versions(client, "out/")) == 2
+
+    pointer = json.loads(client.get_object(Bucket = BUCKET, Key = f"out/data.parquet/{CURRENT}")["Body"].read())
+    assert f"v={pointer['version']}" in versions(client, "out/")
+
+def test_s3_failed_write_keeps_current(s3, monkeypatch):
+    root, client = s3
+    path = f"{root}/out/data.parquet"
+    write_parquet(frame(1.0), path, ["indicator"])
+    before = versions(client, "out/")
+
+    def failing(*args, **kwargs):
+        raise ConnectionError("upload failed")
+    with monkeypatch.context() as patch:
+        patch.setattr(outputs, "_point", failing)
+        with pytest.raises(ConnectionError):
+            write_parquet(frame(2.0), path, ["indicator"])
+    assert read_parquet(path).value.sum() == 6.0
+    assert versions(client, "out/") == before
+
+    write_parquet(frame(3.0), path, ["indicator"])
+    assert read_parquet(path).value.sum() == 12.0
+    assert len(versions(client, "out/")) == 2 and before[0] in versions(client, "out/")
@@ -0,0 +1,43 @@
+'''Tests of panel.py.'''
+
+import numpy as np
+import pandas as pd
+import pytest
+from panel import Panel
+
+def long(sex = np.nan, age = np.nan):
+    return pd.DataFrame({"isoalpha3": ["ARG","ARG","ARG","BRA","BRA"],
+                         "source"   : "WHO GHED",
+                         "indicator": "gghed_che",
+                         "sex"      : sex,
+                         "age"      : age,
+                         "year"     : [2000, 2001, 2003, 2000, 2001],
+                         "value"    : [1.0, 2.0, 4.0, 5.0, np.nan]})
+
+def test_to_long_with_missing_series_columns():
+    # Note: sex and age are all missing (float dtype), as in loaded GHED or HAQ rows
+    output = Panel.from_long(long()).to_long()
+    assert len(output) == 4
+    assert output.sex.isna().all() and output.age.isna().all()
+    assert output.value.tolist() == [1.0, 2.0, 4.0, 5.0]
+
+def test_latest_with_missing_series_columns():
+    output = Panel.from_long(long()).latest().set_index("isoalpha3")
+    assert output.loc["ARG", "year"] == 2003 and output.loc["ARG", "value"] == 4.0
+    assert output.loc["BRA", "year"] == 2000 and output.loc["BRA", "value"] == 5.0
+    assert output.sex.isna().all()
+
+def test_interpolate_fills_gaps_only():
+    output = Panel.from_long(long(sex = "Both")).interpolate().to_long().set_index(["isoalpha3","year"])
+    assert output.loc[("ARG", 2002), "value"] == 3.0
+    assert ("BRA", 2002) not in output.index
+
+def test_cagr():
+    data   = pd.DataFrame({"isoalpha3": "ARG", "source": "IHME GBD", "indicator": "lexp", "sex": "Both",
+                           "age": "<1 year", "year": [2000, 2001, 2002], "value": [100.0, 110.0, 121.0]})
+    output = Panel.from_long(data).cagr(2).to_long().set_index("year")
+    assert np.isclose(output.loc[2002, "value"], 0.1)
+
+def test_duplicated_cells_raise():
+    with pytest.raises(ValueError):
+        Panel.from_long(pd.concat([long(sex = "Both")] * 2))
@@ -0,0 +1,52 @@
+'''Tests of quality.py.'''
+
+import json
+import numpy as np
+import pandas as pd
+import pytest
+from quality import Coverage, Finite, NotNull, QualityError, Range, Unique, check, gate
+
+def indicators():
+    return pd.DataFrame({"isoalpha3": pd.Categorical(["ARG","ARG","BRA","BRA","CHL"]),
+                         "source"   : ["WHO GHO","WHO GHO","WHO GHO","WHO GHO","WHO GHED"],
+                         "year"     : [2000, 2001, 2000, 2000, 2000],
+                         "value"    : [1.0, np.nan, 3.0, np.inf, -1.0]})
+
+def failed(data, rule):
+    return check(data, [rule])[0]["failed"]
+
+def test_unique():
+    data = indicators()
+    assert failed(data, Unique(["isoalpha3","year"])) == 2
+    assert failed(data, Unique(["isoalpha3","year","value"])) == 0
+
+def test_unique_missing_is_one_value():
+    data = pd.DataFrame({"isoalpha3": ["ARG","ARG","ARG"], "sex": [np.nan, np.nan, "Male"]})
+    assert failed(data, Unique(["isoalpha3","sex"])) == 2
+
+def test_not_null():
+    data = indicators()
+    assert failed(data, NotNull(["value"])) == 1
+    data.loc[0, "isoalpha3"] = np.nan
+    assert failed(data, NotNull(["isoalpha3","value"])) == 2
+
+def test_range_and_finite():
+    data = indicators()
+    assert failed(data, Range("value", 0, 100)) == 2
+    assert failed(data, Finite("value")) == 1
+
+def test_coverage():
+    # Note: BRA and CHL lack 2001 in WHO GHO; CHL lacks 2000 in WHO GHO, ARG and BRA in WHO GHED
+    result = check(indicators(), [Coverage("isoalpha3", "year", {"ARG","BRA","CHL"}, by = ["source"])])[0]
+    assert result["failed"] == 5
+    assert {"source": "WHO GHO", "isoalpha3": "CHL", "year": 2000} in result["examples"]
+
+def test_gate_raises_on_errors_only(tmp_path):
+    data   = indicators()
+    report = gate(data, [Finite("value", severity = "warning")], "stage", folder = str(tmp_path))
+    assert report["status"] == "passed"
+    with pytest.raises(QualityError):
+        gate(data, [Unique(["isoalpha3","year"])], "stage", folder = str(tmp_path))
+
+    reports = [json.loads(path.read_text()) for path in tmp_path.glob("stage-*.json")]
+    assert reports and all(item["rows"] == len(data) for item in reports)
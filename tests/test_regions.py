@@ -0,0 +1,52 @@
+'''Tests of regions.py.'''
+
+import numpy as np
+import pandas as pd
+import pytest
+from regions import aggregate, membership
+
+REGIONS = {"IADB": ["ARG","BRA"], "OECD": ["CHL","USA"], "Global": None}
+
+def data():
+    return pd.DataFrame({"code"     : ["ARG","BRA","CHL","USA","ARG","BRA"],
+                         "indicator": ["a","a","a","a","b","b"],
+                         "value"    : [1.0, 3.0, 5.0, np.nan, 2.0, 4.0],
+                         "pop"      : [1.0, 3.0, 1.0, 1.0, 1.0, 1.0]})
+
+def values(output):
+    return output.set_index(["indicator","region"]).value.to_dict()
+
+def test_membership():
+    matrix = membership(["ARG","CHL"], REGIONS)
+    assert matrix.loc["ARG"].tolist() == [1, 0, 1]
+    assert matrix.loc["CHL"].tolist() == [0, 1, 1]
+
+def test_mean_skips_missing():
+    output = values(aggregate(data(), ["indicator"], ["value"], REGIONS))
+    assert output[("a","IADB")] == 2.0
+    assert output[("a","OECD")] == 5.0
+    assert output[("a","Global")] == 3.0
+    assert output[("b","Global")] == 3.0
+    # Note: regions without member rows are left out
+    assert ("b","OECD") not in output
+
+def test_sum_and_weighted_mean():
+    output = values(aggregate(data(), ["indicator"], ["value"], REGIONS, how = "sum"))
+    assert output[("a","Global")] == 9.0
+    output = values(aggregate(data(), ["indicator"], ["value"], REGIONS, how = "wmean", weight = "pop"))
+    assert output[("a","IADB")] == pytest.approx(2.5)
+
+def test_same_as_groupby():
+    rng   = np.random.default_rng(0)
+    rows  = pd.DataFrame({"code"     : rng.choice(["ARG","BRA","CHL","USA","MEX"], 500),
+                          "indicator": rng.choice(["a","b","c"], 500),
+                          "year"     : rng.integers(2000, 2005, 500),
+                          "value"    : rng.normal(size = 500)})
+    output   = aggregate(rows, ["indicator","year"], ["value"], REGIONS)
+    expected = rows[rows.code.isin(REGIONS["IADB"])].groupby(["indicator","year"]).value.mean()
+    iadb     = output[output.region == "IADB"].set_index(["indicator","year"]).value
+    pd.testing.assert_series_equal(iadb.sort_index(), expected, check_names = False)
+
+def test_invalid_how():
+    with pytest.raises(ValueError):
+        aggregate(data(), ["indicator"], ["value"], REGIONS, how = "median")
@@ -0,0 +1,48 @@
+'''Tests of store.py.'''
+
+import numpy as np
+import pandas as pd
+import pytest
+from storage import LocalStorage
+from store import STORE_KEY, Store, build, open_store, publish
+
+def health():
+    return pd.DataFrame({"iddate"   : "year",
+                         "year"     : [2000, 2001, 2002, 2000, 2001],
+                         "idgeo"    : "country",
+                         "isoalpha3": ["ARG","ARG","ARG","BRA","BRA"],
+                         "source"   : "IHME",
+                         "sex"      : ["Both","Both","Both","Both", None],
+                         "age"      : None,
+                         "indicator": ["lexp","lexp","lexp","lexp","hale"],
+                         "value"    : [75.0, 75.5, np.nan, 72.0, 64.0]})
+
+@pytest.fixture
+def store(tmp_path):
+    with Store(build(health(), str(tmp_path / "health.sqlite"))) as store:
+        yield store
+
+def test_round_trip(store):
+    data = store.query()
+    assert len(data) == 5 and list(data.columns) == list(health().columns)
+    assert data.value.isna().sum() == 1 and data.sex.isna().sum() == 1
+    assert store.query(isoalpha3 = "ARG", start = 2001).year.tolist() == [2001, 2002]
+    assert store.query(indicator = ["hale"], sex = None).isoalpha3.tolist() == ["BRA"]
+
+def test_latest_skips_missing_values(store):
+    data = store.latest(indicator = "lexp")
+    assert dict(zip(data.isoalpha3, data.year)) == {"ARG": 2001, "BRA": 2000}
+
+def test_unknown_columns_are_rejected(store):
+    # Note: column names are written into the SQL
+    with pytest.raises(ValueError, match = "Unknown columns"):
+        store.query(**{"sex = sex OR 1": "x"})
+    with pytest.raises(ValueError, match = "Unknown columns"):
+        store.latest(region = "IADB")
+
+def test_publish_and_open(tmp_path):
+    storage = LocalStorage(str(tmp_path / "data"))
+    publish(health(), storage)
+    with open_store(storage, folder = str(tmp_path / "cache")) as store:
+        assert len(store.query(isoalpha3 = "BRA")) == 2
+    assert (tmp_path / "data" / STORE_KEY).exists()
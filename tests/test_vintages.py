@@ -0,0 +1,35 @@
+'''Tests of vintages.py.'''
+
+import pandas as pd
+import pytest
+from storage import LocalStorage
+from vintages import discover, newest, read_all
+
+def frame(rows):
+    return pd.DataFrame(rows, columns = ["location_id","year","val"])
+
+def test_newest_vintage_per_key():
+    frames   = [frame([[1, 2000, 1.0], [1, 2001, 1.0], [2, 2000, 1.0]]),
+                frame([[1, 2000, 3.0]]),
+                frame([[1, 2001, 2.0], [3, 2000, 2.0]])]
+    vintages = [None, "2021", "1990_2019"]
+    data     = newest(frames, vintages, on = ["location_id","year"])
+    assert sorted(map(tuple, data.to_numpy().tolist())) == [(1, 2000, 3.0), (1, 2001, 2.0), (2, 2000, 1.0), (3, 2000, 2.0)]
+    assert data.index.tolist() == list(range(4))
+
+def test_parts_of_a_vintage_are_kept():
+    # Note: rows of two parts of the same vintage are all kept, even with the same key
+    frames = [frame([[1, 2000, 1.0]]), frame([[1, 2000, 2.0]])]
+    assert newest(frames, ["2021-1","2021-1"], on = ["location_id","year"]).val.tolist() == [1.0, 2.0]
+    data   = newest(frames + [frame([[1, 2000, 0.0]])], ["2021-2","2021-2","2020"], on = ["location_id","year"])
+    assert data.val.tolist() == [1.0]
+
+def test_discover_orders_vintages(tmp_path):
+    storage = LocalStorage(str(tmp_path))
+    for name in ["GHED_data_raw_2023.xlsx","GHED_data_raw.xlsx","GHED_data_raw_2021.xlsx","notes.txt"]:
+        storage.write(f"ghed/{name}", b"")
+    files = discover(storage, "ghed/", r"GHED_data_raw(_(?P<vintage>\d{4}))?\.xlsx")
+    assert files == [(None, "ghed/GHED_data_raw.xlsx"), ("2021", "ghed/GHED_data_raw_2021.xlsx"), ("2023", "ghed/GHED_data_raw_2023.xlsx")]
+    assert read_all(len, ["a","bb"]) == [1, 2]
+    with pytest.raises(FileNotFoundError):
+        discover(storage, "ghed/", r"haq_(?P<vintage>.+)\.csv")